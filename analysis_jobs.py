@@ -0,0 +1,149 @@
+"""`analyze_portfolio` en segundo plano, con avance por ticker.
+
+`ui.vistas._resultados` lo corría en el hilo del script, bajo un solo spinner: el usuario
+miraba «Leyendo tu portafolio…» durante todo el cálculo, y cualquier rerun a mitad (un
+clic, cambiar de tema) lo tiraba y empezaba de cero. Aquí el análisis es un trabajo de un
+pool de hilos, con clave = la del resultado (`"resultados:" + snapshot_store.snapshot_key`),
+y el script solo lo consulta:
+
+- Idempotente: `submit(clave, producir)` devuelve el trabajo en curso de esa clave si ya
+  hay uno —el rerun de la misma sesión, u otra sesión con el mismo archivo, se le une— y
+  solo arranca uno nuevo si no existe o el anterior falló.
+- Avance: `producir(avisar)` recibe el callback que `logic.analyze_portfolio` llama al
+  terminar cada ticker (`_progreso`). Cada aviso queda como evento y el resultado del
+  ticker como parcial; `Job.progress()` devuelve una foto coherente de ambos.
+- Hilos y no procesos: el resultado trae campos perezosos (`logic.LazyField`) que leen el
+  caché de mercado del propio proceso, y `st.cache_data` es por proceso; con procesos se
+  perdería lo primero y se duplicaría lo segundo. La parte cara es red (yfinance), que
+  suelta el GIL.
+- Retención: el trabajo terminado se queda hasta que quien lo consume llama a `discard`
+  (el resultado ya vive entonces en `result_cache`); si nadie vuelve por él —sesión
+  cerrada— se purga RETENCION_S después de terminar.
+
+Tamaño del pool: ANALYSIS_WORKERS (env), 2 por defecto.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 2
+RETENCION_S = 600
+
+_lock = threading.Lock()
+_jobs: dict = {}                # clave → Job
+_executor = None
+
+
+class Job:
+    """Un análisis en curso o terminado. Lo escribe el hilo del pool; lo leen los scripts."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.total = 0
+        self.events = []             # [{"ticker", "done", "total", "t"}] en orden de llegada
+        self.partial = {}            # ticker → resultado parcial
+        self.started = time.monotonic()
+        self.finished = None
+        self._result = None
+        self._error = None
+
+    def _notify(self, done: int, total: int, ticker, result) -> None:
+        with self._lock:
+            self.total = total
+            if ticker is None:
+                return
+            self.partial[ticker] = result
+            self.events.append({"ticker": ticker, "done": done, "total": total,
+                                "t": time.monotonic() - self.started})
+
+    def _run(self, produce) -> None:
+        try:
+            self._result = produce(self._notify)
+        except BaseException as e:   # se entrega a quien consulte, no muere en el pool
+            self._error = e
+        finally:
+            self.finished = time.monotonic()
+            self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def failed(self) -> bool:
+        return self._done.is_set() and self._error is not None
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def result(self):
+        """El resultado; relanza la excepción del análisis si falló. Solo tras `done()`."""
+        if not self._done.is_set():
+            raise RuntimeError(f"analysis_jobs: {self.key} sigue en curso")
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def progress(self) -> dict:
+        """Foto del avance: tickers hechos/total, último terminado, parciales y segundos."""
+        with self._lock:
+            ultimo = self.events[-1] if self.events else None
+            return {"done": ultimo["done"] if ultimo else 0, "total": self.total,
+                    "ticker": ultimo["ticker"] if ultimo else None,
+                    "partial": dict(self.partial),
+                    "elapsed": (self.finished or time.monotonic()) - self.started}
+
+
+def _workers() -> int:
+    try:
+        return max(1, int(os.getenv('ANALYSIS_WORKERS') or DEFAULT_WORKERS))
+    except ValueError:
+        return DEFAULT_WORKERS
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix='analisis')
+    return _executor
+
+
+def _purge(now: float) -> None:
+    for key in [k for k, j in _jobs.items()
+                if j.finished is not None and now - j.finished > RETENCION_S]:
+        del _jobs[key]
+
+
+def submit(key: str, produce) -> Job:
+    """El trabajo de `key`: el que ya existe (en curso o terminado bien) o uno nuevo que
+    corre `produce(avisar)` en el pool."""
+    with _lock:
+        _purge(time.monotonic())
+        job = _jobs.get(key)
+        if job is not None and not job.failed():
+            return job
+        job = _jobs[key] = Job(key)
+    _pool().submit(job._run, produce)
+    return job
+
+
+def get(key: str):
+    """El trabajo de `key`, o None si no hay."""
+    with _lock:
+        return _jobs.get(key)
+
+
+def discard(key: str, job: Job = None) -> None:
+    """Saca el trabajo de `key` del registro (solo si sigue siendo `job`, si se pasa)."""
+    with _lock:
+        if job is None or _jobs.get(key) is job:
+            _jobs.pop(key, None)
+
+
+def active() -> list:
+    """Claves con un análisis todavía en curso."""
+    with _lock:
+        return [k for k, j in _jobs.items() if not j.done()]
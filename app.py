@@ -27,7 +27,7 @@ stale_guard.asegurar_frescura()
 from ui.carga import notificar_progreso, render_carga  # noqa: E402  — tras el guardián
 from ui.chrome import inyectar_estilos, render_encabezado, render_ruta
 from ui.pie import render_pie
-from ui.validacion import hay_alertas, preparar_pdf
+from ui.validacion import hay_alertas, pedir_pdf, preparar_pdf
 from ui.vistas import obtener_resultados, render_vista
 
 st.set_page_config(
@@ -58,6 +58,9 @@ if _demo_param and st.session_state.get("_demo_case") != _demo_param:
     if _demo_bundle:
         for _dk, _dv in _demo_bundle.items():
             st.session_state[_dk] = _dv
+        # Otro archivo: ni el análisis ni el PDF pedido del anterior sirven.
+        st.session_state.pop("_vd_resultados", None)
+        st.session_state.pop("_vd_pdf_pedido", None)
         st.session_state["_wizard_listo"] = True
         st.session_state["_demo_case"] = _demo_param
     elif demo_mode.demo_available():
@@ -80,7 +83,7 @@ render_encabezado(con_datos)
 if con_datos:
     resultados = obtener_resultados()
     pdf_bytes, pdf_filename = preparar_pdf(resultados)
-    ruta = render_ruta(hay_alertas(resultados), pdf_bytes, pdf_filename)
+    ruta = render_ruta(hay_alertas(resultados), pdf_bytes, pdf_filename, pedir_pdf)
     render_vista(ruta)
     render_pie(resultados)
 else:
@@ -60,7 +60,6 @@ import datetime as dt
 from typing import Mapping, Optional, Union
 
 import pandas as pd
-import yfinance as yf
 
 DateLike = Union[str, dt.date, dt.datetime, pd.Timestamp]
 
@@ -95,7 +94,9 @@ def fetch_history(ticker: str, start: Optional[DateLike] = None,
     cualquier error de red/yfinance suba tal cual — el caller decide si reintentar o hacer
     skip (no hay fallback silencioso a datos falsos).
     """
-    t = yf.Ticker(ticker)
+    import yfinance as yf   # perezoso: solo lo usan los scripts de refresco y los tests en vivo
+    import http_pool
+    t = yf.Ticker(ticker, session=http_pool.session())
     start_ts = _to_ts(start)
     if start_ts is None:
         # Sin `start`, yfinance NO asume "desde incepcion": si se pasa `end` sin `period` ni
@@ -117,7 +118,9 @@ def fetch_history(ticker: str, start: Optional[DateLike] = None,
 def fetch_splits(ticker: str) -> pd.Series:
     """Serie de splits real de `ticker` (indice = fecha efectiva, valor = razon
     nuevas-acciones-por-accion-vieja; <1.0 = split inverso). Vacia si no hubo splits."""
-    s = yf.Ticker(ticker).splits
+    import yfinance as yf
+    import http_pool
+    s = yf.Ticker(ticker, session=http_pool.session()).splits
     if s is None or len(s) == 0:
         return pd.Series(dtype=float)
     s = s.copy()
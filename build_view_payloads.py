@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""Precalcula los payloads de las lecciones que no dependen del portafolio del usuario
+(`ui.adapters.VISTAS_PRECALCULADAS`: Comparación · Simulación y las dos de Método
+tradicional) y los deja en `knowledge/view_payloads/{nombre}.json`.
+
+Esas vistas corren `backtest.run_backtest` sobre el caso de estudio fijo (`MET_CASO`,
+`TRG_UNIVERSO`) con el caché de precio y los yaml de `knowledge/`, que solo cambian cuando
+corren los workflows de refresco semanal. Calcularlas en cada arranque del proceso costaba
+segundos por vista; con el payload precalculado el adaptador lo lee del disco si
+`huella_entradas()` coincide con la que quedó escrita, y si no (otro caché, otro yaml, otro
+código) calcula en vivo como antes — ver `ui.adapters._precalculado`.
+
+Qué escribe, por vista:
+  - `knowledge/view_payloads/{nombre}.json` — {"inputs": huella de las entradas,
+    "generated_at": fecha, "payload": lo que devuelve la función}.
+
+Resiliencia (mismo patrón que fetch_price_cache.py): si una vista no se puede calcular o
+sale degradada (algún ticker vino de yfinance en vivo y no del caché), se CONSERVA el
+archivo previo — su huella ya no coincide, así que el adaptador simplemente lo ignora y
+calcula en vivo. Nunca sale con error: esto es una optimización, no un dato.
+
+Corre en .github/workflows/refresh-price-cache.yml y refresh-roc-19a.yml justo después de
+refrescar las entradas.
+
+Uso local:  ./.venv/bin/python build_view_payloads.py
+"""
+import datetime as dt
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ui import adapters   # noqa: E402
+
+
+def main(argv):
+    os.makedirs(adapters.PAYLOADS_DIR, exist_ok=True)
+    huella = adapters.huella_entradas()
+    if huella is None:
+        print("::warning::faltan entradas (caché de precio o yaml); no precalculo nada.",
+              file=sys.stderr)
+        return 0
+    hoy = dt.date.today().isoformat()
+    escritas = []
+    for nombre in adapters.VISTAS_PRECALCULADAS:
+        datos = getattr(adapters, nombre)(precalculado=False)
+        if datos is None or datos.get("degradado"):
+            print(f"::warning::{nombre}: sin historia completa desde el caché "
+                  f"(degradado: {(datos or {}).get('degradado') or 'todo'}). Conservo el "
+                  f"payload previo.", file=sys.stderr)
+            continue
+        ruta = os.path.join(adapters.PAYLOADS_DIR, f"{nombre}.json")
+        with open(ruta + ".tmp", "w", encoding="utf-8") as fh:
+            json.dump({"inputs": huella, "generated_at": hoy, "payload": datos}, fh,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(ruta + ".tmp", ruta)
+        escritas.append(nombre)
+        print(f"{nombre}: {os.path.getsize(ruta) // 1024} KB")
+
+    print(f"Escrito en {adapters.PAYLOADS_DIR}: {escritas or '—'} (huella {huella}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
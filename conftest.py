@@ -0,0 +1,31 @@
+"""Fixtures comunes a todos los tests.
+
+`logic` y `http_pool` guardan estado de proceso sobre el mercado: el caché negativo de
+tickers, los marcos ya descargados y el circuito de cada dominio. Sin red, los tests que
+analizan abren el circuito de Yahoo y anotan tickers en el caché negativo, y el resultado
+de un test dependía de cuáles corrieron antes. Cada test empieza con ese estado vacío.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+
+@pytest.fixture(autouse=True)
+def _estado_de_mercado_limpio():
+    def limpiar():
+        logic = sys.modules.get("logic")
+        if logic is not None:
+            logic._NEGATIVE.clear()
+            with logic._MARKET_LOCK:
+                logic._MARKET_FRAMES.clear()
+        http_pool = sys.modules.get("http_pool")
+        if http_pool is not None:
+            with http_pool._lock:
+                http_pool._breakers.clear()
+
+    limpiar()
+    yield
+    limpiar()
@@ -64,10 +64,11 @@ def _load_bundle(case_id):
     df_clean = logic.normalize_csv(df)
     if any(c not in df_clean.columns for c in ['Date', 'Ticker', 'Amount']):
         return None
+    df_clean = logic.canonical_transactions(df_clean)
 
     csv_td = {}
     if 'Ticker' in df_clean.columns and 'Action' in df_clean.columns:
-        for t, g in df_clean.groupby('Ticker'):
+        for t, g in df_clean.groupby('Ticker', observed=True):
             buys = g[g['Action'].str.lower().str.contains('buy', na=False)]
             divs = g[g['Action'].str.lower().str.contains('div', na=False)]
             csv_td[t] = {
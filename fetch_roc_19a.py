@@ -234,9 +234,10 @@ def _challenge_hint(html, tk):
 
 def fetch_plain_html(url):
     """Fetch sin navegador: la tabla de distribuciones hoy viene server-rendered en el HTML
-    plano, así que esto suele bastar y evita el fingerprint de chromium headless."""
-    import requests
-    resp = requests.get(url, headers=_BROWSER_HEADERS, timeout=30)
+    plano, así que esto suele bastar y evita el fingerprint de chromium headless. Va por la
+    sesión compartida (`http_pool`): keep-alive entre fondos y ritmo común con yfinance."""
+    import http_pool
+    resp = http_pool.get(url, headers=_BROWSER_HEADERS, timeout=30)
     resp.raise_for_status()
     return resp.text
 
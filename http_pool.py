@@ -0,0 +1,361 @@
+"""Sesión HTTP compartida por todo el proceso: keep-alive, tope por host, ritmo global,
+presupuesto de reintentos y circuito por dominio.
+
+`logic.get_session()` creaba una `curl_cffi.Session` nueva (handshake TLS nuevo, cookies de
+Yahoo nuevas) en cada `fetch_market_data`, en el bloque del benchmark VOO y en el scraper
+HTML; `fetch_roc_19a`, `tools/fetch_roc_ici` y `market_context` usaban `requests` o el
+default de yfinance por su cuenta. Nada reutilizaba conexiones ni respetaba un ritmo
+común, y con varias sesiones analizando a la vez Yahoo responde 429.
+
+- Sesión: UNA `curl_cffi.Session` (impersonando Chrome) por proceso, `session()`. Es
+  thread-safe y guarda un handle de curl por hilo, así que cada hilo reusa sus conexiones
+  (keep-alive) y todos comparten cookies. Es la misma que se pasa a yfinance
+  (`session=`), que de todos modos guarda una sola sesión global.
+- Admisión, en cada request (también las que hace yfinance por dentro): primero un cupo
+  del host (HTTP_HOST_CONCURRENCY, 4 por defecto) y después un token del cubo global
+  (HTTP_RATE_PER_S, 4/s; ráfaga HTTP_BURST, 8). Si no hay, se espera.
+- Reintentos: `get()` reintenta 429/5xx y errores de red con backoff exponencial (respeta
+  `Retry-After`), pero cada reintento gasta del presupuesto común: cada request deposita
+  HTTP_RETRY_RATIO (0.2) y el saldo tiene tope. Con Yahoo limitando, los reintentos se
+  agotan en vez de multiplicar la carga. Quien reintenta por su cuenta (el bucle de
+  `fetch_market_data`) pide permiso con `retry_allowed()`.
+- Circuito, por dominio (`query1.finance.yahoo.com` y `finance.yahoo.com` son el mismo
+  upstream, `yahoo.com`): tras HTTP_BREAKER_FAILURES (5) fallos seguidos —429, 5xx o error
+  de red; un 404 es una respuesta sana— se abre durante HTTP_BREAKER_COOLDOWN_S (60 s) y
+  toda request a ese dominio lanza `CircuitOpen` al instante, sin tocar la red. Pasado el
+  enfriamiento deja pasar UNA de prueba: si sale bien se cierra, si no vuelve a abrirse.
+  `breaker_state(dominio)` lo expone para el panel de Validación datos.
+- Observación por llamada: `with observe() as visto:` cuenta las requests que hace ESTE
+  hilo dentro del bloque y cuántas fallaron (429, 5xx, error de red, circuito abierto). Así
+  quien recibe un vacío sabe si el upstream contestó sano (el dato no existe) o no contestó,
+  sin leer el estado del circuito, que comparten todos los hilos.
+- Métricas: `stats()` → requests, conexiones nuevas y reusadas (`reuse_rate`), esperas y
+  segundos esperando por el ritmo (`throttled`, `throttle_wait_s`) y por el cupo del host
+  (`host_waits`), reintentos hechos y denegados, errores y requests cortadas por un
+  circuito abierto (`short_circuits`).
+
+curl_cffi se importa al crear la sesión, no al importar este módulo (ver
+test_importtime.py).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+DEFAULT_RATE_PER_S = 4.0
+DEFAULT_BURST = 8
+DEFAULT_HOST_CONCURRENCY = 4
+DEFAULT_RETRY_RATIO = 0.2
+RETRY_BALANCE_MAX = 10.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_AFTER_MAX_S = 30.0
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_COOLDOWN_S = 60.0
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name) or default)
+    except ValueError:
+        return default
+
+
+class TokenBucket:
+    """`rate` tokens por segundo, hasta `burst` acumulados."""
+
+    def __init__(self, rate: float, burst: float, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._stamp = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Toma un token, esperando si hace falta. Devuelve los segundos esperados."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= 1.0           # se reserva aunque quede en negativo: cola justa
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+
+class RetryBudget:
+    """Saldo de reintentos: `ratio` por request hecha, hasta `cap`; un reintento cuesta 1."""
+
+    def __init__(self, ratio: float, cap: float = RETRY_BALANCE_MAX):
+        self.ratio = float(ratio)
+        self.cap = float(cap)
+        self._balance = self.cap
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._balance = min(self.cap, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._balance < 1.0:
+                return False
+            self._balance -= 1.0
+            return True
+
+
+class CircuitOpen(Exception):
+    """El circuito del dominio está abierto: la request no salió."""
+
+
+class CircuitBreaker:
+    """Cerrado → abierto tras `threshold` fallos seguidos → a prueba tras `cooldown_s`."""
+
+    def __init__(self, threshold: int, cooldown_s: float, clock=time.monotonic):
+        self.threshold = int(threshold)
+        self.cooldown_s = float(cooldown_s)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = None
+        self._last_error = None
+        self._short_circuits = 0
+
+    def allow(self) -> bool:
+        """¿Puede salir una request? Con el circuito abierto, solo la de prueba."""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and self._clock() - self._opened_at >= self.cooldown_s:
+                self._state = 'half_open'
+                return True
+            self._short_circuits += 1
+            return False
+
+    def success(self) -> None:
+        with self._lock:
+            self._state, self._failures, self._opened_at = 'closed', 0, None
+
+    def failure(self, reason: str) -> None:
+        with self._lock:
+            self._failures += 1
+            self._last_error = reason
+            if self._state == 'half_open' or self._failures >= self.threshold:
+                self._state, self._opened_at = 'open', self._clock()
+
+    def state(self) -> dict:
+        """Estado, fallos seguidos, segundos hasta la prueba, último error y cortes."""
+        with self._lock:
+            retry_in = (max(0.0, self.cooldown_s - (self._clock() - self._opened_at))
+                        if self._state == 'open' else 0.0)
+            return {'state': self._state, 'failures': self._failures,
+                    'retry_in_s': retry_in, 'last_error': self._last_error,
+                    'short_circuits': self._short_circuits, 'threshold': self.threshold,
+                    'cooldown_s': self.cooldown_s}
+
+
+_lock = threading.Lock()
+_session = None
+_bucket = TokenBucket(_env_float('HTTP_RATE_PER_S', DEFAULT_RATE_PER_S),
+                      _env_float('HTTP_BURST', DEFAULT_BURST))
+_budget = RetryBudget(_env_float('HTTP_RETRY_RATIO', DEFAULT_RETRY_RATIO))
+_host_limit = max(1, int(_env_float('HTTP_HOST_CONCURRENCY', DEFAULT_HOST_CONCURRENCY)))
+_hosts: dict = {}                 # host → BoundedSemaphore
+_breakers: dict = {}              # dominio → CircuitBreaker
+_counts = dict(requests=0, new_connections=0, reused_connections=0, throttled=0,
+               throttle_wait_s=0.0, host_waits=0, retries=0, retries_denied=0, errors=0,
+               short_circuits=0)
+
+
+def _count(**delta) -> None:
+    with _lock:
+        for k, v in delta.items():
+            _counts[k] += v
+
+
+def _domain(url_or_host: str) -> str:
+    """`query1.finance.yahoo.com` → `yahoo.com` (acepta URL u host)."""
+    host = urlsplit(str(url_or_host)).hostname if '/' in str(url_or_host) else str(url_or_host)
+    return '.'.join((host or '').lower().split('.')[-2:])
+
+
+def _breaker(domain: str) -> CircuitBreaker:
+    with _lock:
+        br = _breakers.get(domain)
+        if br is None:
+            br = _breakers[domain] = CircuitBreaker(
+                int(_env_float('HTTP_BREAKER_FAILURES', DEFAULT_BREAKER_FAILURES)),
+                _env_float('HTTP_BREAKER_COOLDOWN_S', DEFAULT_BREAKER_COOLDOWN_S))
+        return br
+
+
+def breaker_state(domain: str) -> dict:
+    """Estado del circuito de `domain` (ver `CircuitBreaker.state`)."""
+    return _breaker(_domain(domain)).state()
+
+
+def circuit_open(domain: str) -> bool:
+    """Cierto mientras el circuito de `domain` corta requests (abierto o a prueba)."""
+    st = breaker_state(domain)
+    return st['state'] == 'half_open' or (st['state'] == 'open' and st['retry_in_s'] > 0)
+
+
+class Observed:
+    """Requests de un hilo dentro de `observe()`: cuántas salieron y cuántas fallaron."""
+    __slots__ = ('requests', 'failures', 'last_error')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+
+
+_local = threading.local()
+
+
+@contextmanager
+def observe():
+    """`Observed` de las requests que hace el hilo actual dentro del bloque."""
+    previo = getattr(_local, 'observed', None)
+    visto = _local.observed = Observed()
+    try:
+        yield visto
+    finally:
+        _local.observed = previo
+
+
+def _observe(error: str = None) -> None:
+    visto = getattr(_local, 'observed', None)
+    if visto is not None:
+        visto.requests += 1
+        if error is not None:
+            visto.failures += 1
+            visto.last_error = error
+
+
+def _admit(url: str) -> threading.BoundedSemaphore:
+    """Cupo del host y token del ritmo global; devuelve el semáforo a liberar."""
+    host = urlsplit(str(url)).hostname or ''
+    with _lock:
+        sem = _hosts.get(host)
+        if sem is None:
+            sem = _hosts[host] = threading.BoundedSemaphore(_host_limit)
+    if not sem.acquire(blocking=False):
+        _count(host_waits=1)
+        sem.acquire()
+    waited = _bucket.acquire()
+    if waited > 0:
+        _count(throttled=1, throttle_wait_s=waited)
+    return sem
+
+
+def _record(resp) -> None:
+    """Cuenta la request y si viajó por una conexión ya abierta (libcurl NUM_CONNECTS)."""
+    _budget.deposit()
+    nuevas = None
+    try:
+        from curl_cffi import CurlInfo
+        nuevas = resp.curl.getinfo(CurlInfo.NUM_CONNECTS)
+    except Exception:
+        pass
+    if nuevas is None:
+        _count(requests=1)
+    elif nuevas:
+        _count(requests=1, new_connections=1)
+    else:
+        _count(requests=1, reused_connections=1)
+
+
+def _session_class():
+    from curl_cffi import requests as crequests
+
+    class PooledSession(crequests.Session):
+        """`curl_cffi.Session` que pasa cada request por `_admit` y la cuenta."""
+
+        def request(self, method, url, *args, **kwargs):
+            br = _breaker(_domain(url))
+            if not br.allow():
+                _count(short_circuits=1)
+                _observe('CircuitOpen')
+                raise CircuitOpen(f"{_domain(url)}: circuito abierto")
+            sem = _admit(url)
+            try:
+                resp = super().request(method, url, *args, **kwargs)
+            except Exception as e:
+                br.failure(type(e).__name__)
+                _observe(type(e).__name__)
+                _count(requests=1, errors=1)
+                _budget.deposit()
+                raise
+            finally:
+                sem.release()
+            if resp.status_code in RETRY_STATUS:
+                br.failure(f"HTTP {resp.status_code}")
+                _observe(f"HTTP {resp.status_code}")
+            else:
+                br.success()
+                _observe()
+            _record(resp)
+            return resp
+
+    return PooledSession
+
+
+def session():
+    """La sesión compartida del proceso (se crea la primera vez)."""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _session_class()(impersonate="chrome")
+    return _session
+
+
+def retry_allowed() -> bool:
+    """¿Queda presupuesto para un reintento? Si sí, lo gasta."""
+    if _budget.withdraw():
+        _count(retries=1)
+        return True
+    _count(retries_denied=1)
+    return False
+
+
+def _retry_after(resp, default: float) -> float:
+    try:
+        return min(RETRY_AFTER_MAX_S, float(resp.headers.get('Retry-After')))
+    except (TypeError, ValueError, AttributeError):
+        return default
+
+
+def get(url: str, retries: int = 2, backoff: float = 0.5, **kwargs):
+    """GET por la sesión compartida. Reintenta 429/5xx y errores de red hasta `retries`
+    veces mientras haya presupuesto; devuelve la última respuesta (o relanza el error)."""
+    for attempt in range(retries + 1):
+        pause = backoff * 2 ** attempt
+        try:
+            resp = session().get(url, **kwargs)
+        except CircuitOpen:
+            raise
+        except Exception:
+            if attempt == retries or not retry_allowed():
+                raise
+        else:
+            if resp.status_code not in RETRY_STATUS or attempt == retries or not retry_allowed():
+                return resp
+            pause = _retry_after(resp, pause)
+        time.sleep(pause)
+
+
+def stats() -> dict:
+    with _lock:
+        out = dict(_counts)
+    conexiones = out['new_connections'] + out['reused_connections']
+    out['reuse_rate'] = out['reused_connections'] / conexiones if conexiones else 0.0
+    out['throttle_wait_s'] = round(out['throttle_wait_s'], 3)
+    return out
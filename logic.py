@@ -1,20 +1,28 @@
 import pandas as pd
 import numpy as np
-import numpy_financial as npf
-import yfinance as yf
 import datetime
 import streamlit as st
-from curl_cffi import requests as crequests
 import re
 import io
 import os
-from collections import defaultdict
+import itertools
+import threading
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import ItemsView, ValuesView
+
+import http_pool
+import single_flight
 
 try:
     import yaml as _yaml
 except Exception:
     _yaml = None
 
+# yfinance, curl_cffi y numpy_financial se importan dentro de las funciones que los usan
+# (como openpyxl, pdfplumber o google.genai): juntos son más de medio segundo de import que
+# pagaban el arranque en frío y cada recarga de `stale_guard`, y la primera pantalla —la de
+# carga, sin archivo— no los necesita. `test_importtime.py` vigila que no vuelvan arriba.
+
 GEMINI_VISION_MODEL = "gemini-2.5-flash"
 GEMINI_VISION_FALLBACKS = ["gemini-2.5-flash-lite"]
 
@@ -682,7 +690,8 @@ def build_1042s_validation(results: dict, parsed: dict):
     for _tk, s in (results or {}).items():
         if not isinstance(s, dict) or s.get('skipped') or 'error' in s:
             continue
-        bruto_portafolio += _csv_dividends_in_window(s.get('history'), start=start, end=end)
+        hist, led = _result_ledger(s)
+        bruto_portafolio += _csv_dividends_in_window(hist, start=start, end=end, led=led)
 
     out['bruto_portafolio'] = round(bruto_portafolio, 2)
 
@@ -717,9 +726,12 @@ def build_1042s_validation(results: dict, parsed: dict):
 
 def get_session():
     """
-    Creates a curl_cffi session mimicking Chrome to bypass bot detection.
+    curl_cffi session mimicking Chrome to bypass bot detection.
+
+    Es la sesión compartida del proceso (`http_pool.session()`): keep-alive, ritmo global y
+    tope por host para todo lo que baja de Yahoo, también lo que yfinance pide por dentro.
     """
-    return crequests.Session(impersonate="chrome")
+    return http_pool.session()
 
 
 def _cumul_split_factor(tx_date, splits_series: pd.Series) -> float:
@@ -771,17 +783,38 @@ def _net_transfer_pairs(df: pd.DataFrame) -> pd.DataFrame:
     transfer_in = act.str.contains('transfer', na=False) & (qty > 0)
     if not journal_out.any() or not transfer_in.any():
         return df
-    drop_idx = []
-    in_idx = list(out.index[transfer_in])
-    for i in out.index[journal_out]:
-        t, d, q = out.at[i, 'Ticker'], out.at[i, 'Date'], abs(qty[i])
-        for j in in_idx:
-            if (out.at[j, 'Ticker'] == t and out.at[j, 'Date'] == d
-                    and abs(abs(qty[j]) - q) < 1e-6 and j not in drop_idx):
-                drop_idx.append(i)
-                in_idx.remove(j)  # cada entrada empareja con una sola salida
-                break
-    return out.drop(index=drop_idx) if drop_idx else df
+    # Join por clave (Ticker, Date, |Quantity|) con tablas hash en vez de escanear todas las
+    # entradas por cada salida. La cantidad se indexa en micro-acciones enteras: dos
+    # cantidades a menos de 1e-6 caen en la misma o en una clave vecina, así que mirar k-1,
+    # k, k+1 conserva la tolerancia de siempre. Cada cola guarda las entradas en el orden del
+    # archivo y cada salida toma la PRIMERA entrada libre que empareja: el mismo resultado
+    # uno a uno que el recorrido anidado, en O(n).
+    tickers, dates, q_abs = out['Ticker'].to_numpy(), out['Date'].to_numpy(), qty.abs().to_numpy()
+    ins = {}
+    for pos in np.flatnonzero(transfer_in.to_numpy()):
+        if pd.isna(tickers[pos]) or pd.isna(dates[pos]):
+            continue
+        ins.setdefault((tickers[pos], dates[pos]), {}).setdefault(
+            int(round(q_abs[pos] * 1e6)), deque()).append(pos)
+    drop_pos = []
+    for pos in np.flatnonzero(journal_out.to_numpy()):
+        if pd.isna(tickers[pos]) or pd.isna(dates[pos]):
+            continue
+        by_qty = ins.get((tickers[pos], dates[pos]))
+        if not by_qty:
+            continue
+        q, k = q_abs[pos], int(round(q_abs[pos] * 1e6))
+        match = None
+        for queue in (by_qty.get(k - 1), by_qty.get(k), by_qty.get(k + 1)):
+            for j in queue or ():
+                if abs(q_abs[j] - q) < 1e-6:
+                    if match is None or j < match[0]:
+                        match = (j, queue)
+                    break
+        if match is not None:
+            drop_pos.append(pos)
+            match[1].remove(match[0])  # cada entrada empareja con una sola salida
+    return out.drop(index=out.index[drop_pos]) if drop_pos else df
 
 
 def _winsorize_returns(returns, lower=0.01, upper=0.99, min_len=20):
@@ -821,6 +854,70 @@ def _sortino_ratio(daily_returns, rf_daily, periods: int = 252):
     return float((excess / dd) * np.sqrt(periods))
 
 
+# Potential keywords that signify a header row
+_HEADER_KEYWORDS = (
+    'ticker', 'symbol', 'símbolo', 'simbolo',
+    'date', 'fecha', 'time',
+    'quantity', 'cantidad', 'shares', 'acciones',
+    'price', 'precio',
+    'amount', 'monto', 'total', 'valor',
+    'action', 'accion', 'operacion', 'operation', 'tipo'
+)
+
+
+# Nombre de columna del broker (en minúsculas) → columna estándar de `normalize_csv`.
+_COLUMN_ALIASES = {
+    'fecha': 'Date', 'date': 'Date', 'time': 'Date',
+    'descripción': 'Action', 'descripcion': 'Action', 'action': 'Action', 'operación': 'Action', 'operacion': 'Action',
+    'símbolo': 'Ticker', 'simbolo': 'Ticker', 'ticker': 'Ticker', 'symbol': 'Ticker',
+    'cantidad': 'Quantity', 'quantity': 'Quantity', 'shares': 'Quantity',
+    'precio': 'Price', 'price': 'Price',
+    'monto': 'Amount', 'amount': 'Amount', 'total': 'Amount', 'value': 'Amount'
+}
+
+
+def _header_keyword_hits(cells) -> int:
+    """Cuántas palabras clave de encabezado aparecen en alguna celda de la fila.
+    Con >= 2 (p. ej. Date Y Ticker) la fila se toma como encabezado."""
+    joined = '\x00'.join(str(x).lower() for x in cells)
+    return sum(1 for key in _HEADER_KEYWORDS if key in joined)
+
+
+# Celda (una por línea) cuyo ÚLTIMO separador es una coma → decimal europeo.
+_EUROPEAN_CELL = re.compile(r'^[^\n]*,[^.,\n]*$', re.M)
+_NOT_NUMERIC = re.compile(r'[^\d.\n-]')
+
+
+def _clean_numeric_column(col: pd.Series) -> pd.Series:
+    """Quantity/Price/Amount del broker → float, con operaciones de texto por columna.
+
+    Disambiguates US (1,234.56) vs European (1.234,56) by the LAST separator: whichever of
+    '.'/',' appears last is the decimal point; the other is the thousands separator and gets
+    stripped. Only a comma present: treat as decimal (European / IB '0,155').
+    NOTA: no se puede distinguir la coma de miles US ("1,234"→1234) del decimal europeo
+    ("579,314"→579.314) desde el string — ambos son \\d{1,3},\\d{3}. Se prioriza IB (formato
+    real en uso); un CSV genérico US con miles y sin decimales es un caso hipotético que no se
+    soporta.
+
+    La regla es la misma celda a celda que antes, pero sin un `.apply` de Python por celda:
+    la columna se une en un solo texto (una celda por línea) y se limpia con `re`/`str` en C.
+    Una sola pasada de regex marca las celdas europeas y solo esas (la minoría) pasan por
+    Python; la coma de miles US se quita de todo el texto de una vez. Luego se quita todo lo
+    que no sea dígito, punto o signo menos; lo ilegible queda en 0.0.
+    """
+    if col.empty:
+        return pd.to_numeric(col.astype(str), errors='coerce').fillna(0.0)
+    cells = col.astype(str)
+    text = '\n'.join(cells.tolist())
+    if text.count('\n') != len(cells) - 1:
+        # Alguna celda trae un salto de línea: no es dígito ni separador, se puede cambiar.
+        text = '\n'.join(cells.str.replace('\n', ' ', regex=False).tolist())
+    text = _EUROPEAN_CELL.sub(lambda m: m.group(0).replace('.', '').replace(',', '.'), text)
+    text = _NOT_NUMERIC.sub('', text.replace(',', ''))
+    return pd.to_numeric(pd.Series(text.split('\n'), index=col.index),
+                         errors='coerce').fillna(0.0)
+
+
 def normalize_csv(df: pd.DataFrame) -> pd.DataFrame:
     """
     Standardizes a broker's CSV export into a unified format for analysis.
@@ -834,38 +931,21 @@ def normalize_csv(df: pd.DataFrame) -> pd.DataFrame:
     # 0. Smart Header Detection (Metadata Skipping)
     # Check if we need to find the header row
     # Heuristic: If "Ticker" or "Date" is not in columns, scan first 20 rows
-    
-    # Potential keywords that signify a header row
-    header_keywords = [
-        'ticker', 'symbol', 'símbolo', 'simbolo', 
-        'date', 'fecha', 'time',
-        'quantity', 'cantidad', 'shares', 'acciones',
-        'price', 'precio', 
-        'amount', 'monto', 'total', 'valor',
-        'action', 'accion', 'operacion', 'operation', 'tipo'
-    ]
-    
-    def is_likely_header(row_vals):
-        # Count how many keywords appear in this row
-        matches = 0
-        row_str = [str(x).lower() for x in row_vals]
-        for key in header_keywords:
-            if any(key in str(cell) for cell in row_str):
-                matches += 1
-        return matches >= 2 # At least 2 matches to be confident (e.g. Date AND Ticker)
-
-    # Check current columns first
-    if not is_likely_header(df.columns):
-        # Scan first 20 rows
-        for i in range(min(20, len(df))):
-            row = df.iloc[i]
-            if is_likely_header(row.values):
-                # Found the header!
-                # Set this row as header
+    if _header_keyword_hits(df.columns) < 2:
+        head = df.head(20)
+        if not head.empty:
+            # Cada fila se une en un solo texto (el separador \x00 no aparece en ninguna
+            # palabra clave, así que un match no cruza de una celda a otra) y cada palabra
+            # clave se busca con una sola operación sobre las ≤20 filas.
+            joined = head.astype(str).apply(lambda c: c.str.lower()).agg('\x00'.join, axis=1)
+            hits = sum(joined.str.contains(key, regex=False).astype(int)
+                       for key in _HEADER_KEYWORDS)
+            found = np.flatnonzero(hits.to_numpy() >= 2)
+            if found.size:
+                i = int(found[0])
+                # Found the header! Set this row as header and slice data from next row
                 df.columns = df.iloc[i]
-                # Mod: slice data from next row
                 df = df[i+1:].reset_index(drop=True)
-                break
 
     # 1. Robust Column Renaming
     # Strip whitespace from headers and try to match case-insensitively
@@ -883,22 +963,12 @@ def normalize_csv(df: pd.DataFrame) -> pd.DataFrame:
             new_cols.append(c)
     df.columns = new_cols
     
-    # Internal map (lowercase keys for matching)
-    col_map_lower = {
-        'fecha': 'Date', 'date': 'Date', 'time': 'Date',
-        'descripción': 'Action', 'descripcion': 'Action', 'action': 'Action', 'operación': 'Action', 'operacion': 'Action',
-        'símbolo': 'Ticker', 'simbolo': 'Ticker', 'ticker': 'Ticker', 'symbol': 'Ticker',
-        'cantidad': 'Quantity', 'quantity': 'Quantity', 'shares': 'Quantity',
-        'precio': 'Price', 'price': 'Price',
-        'monto': 'Amount', 'amount': 'Amount', 'total': 'Amount', 'value': 'Amount'
-    }
-    
     # Create a rename dict by checking lowercase versions of actual columns
     actual_rename_map = {}
     for col in df.columns:
         col_lower = str(col).lower()
-        if col_lower in col_map_lower:
-            actual_rename_map[col] = col_map_lower[col_lower]
+        if col_lower in _COLUMN_ALIASES:
+            actual_rename_map[col] = _COLUMN_ALIASES[col_lower]
             
     df = df.rename(columns=actual_rename_map)
     
@@ -915,47 +985,116 @@ def normalize_csv(df: pd.DataFrame) -> pd.DataFrame:
     cols_to_clean = ['Quantity', 'Price', 'Amount']
     for col in cols_to_clean:
         if col in df.columns:
-            # European Format Handling: 1.000,00 -> 1000.00
-            # 1. Remove thousands separator (.) if present
-            # 2. Replace decimal separator (,) with (.)
-            # NOTE: This approach optimizes for the user's specific Screenshot format ($ 2,34)
-            # It assumes the file is NOT using commas for thousands (e.g. 1,000.00 would break)
-            
-            # Helper to clean single value
-            # Disambiguates US (1,234.56) vs European (1.234,56) by the LAST
-            # separator: whichever of '.'/',' appears last is the decimal point;
-            # the other is the thousands separator and gets stripped.
-            def clean_val(x):
-                s = str(x).strip()
-                has_comma = ',' in s
-                has_dot = '.' in s
-                if has_comma and has_dot:
-                    if s.rfind(',') > s.rfind('.'):
-                        # European: 12.500,00 -> dot=thousands, comma=decimal
-                        s = s.replace('.', '').replace(',', '.')
-                    else:
-                        # US: 12,500.00 -> comma=thousands, dot=decimal
-                        s = s.replace(',', '')
-                elif has_comma:
-                    # Only a comma present: treat as decimal (European / IB '0,155').
-                    # NOTA: no se puede distinguir la coma de miles US ("1,234"→1234) del
-                    # decimal europeo ("579,314"→579.314) desde el string — ambos son
-                    # \d{1,3},\d{3}. Se prioriza IB (formato real en uso); un CSV genérico
-                    # US con miles y sin decimales es un caso hipotético que no se soporta.
-                    s = s.replace(',', '.')
-                # only a dot or no separator: already valid
-                return s
-
-            df[col] = df[col].apply(clean_val)
-            
-            # 1. Convert to string
-            # 2. Remove anything that is NOT a digit, dot, or minus sign
-            # 3. Handle empty strings resulting from bad data
-            df[col] = df[col].astype(str).str.replace(r'[^\d.-]', '', regex=True)
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0)
+            df[col] = _clean_numeric_column(df[col])
 
     return df
 
+# ── Tabla canónica de transacciones ───────────────────────────────────────────
+# Clase de una fila, calculada UNA vez al ingerir (columna 'ActionKind', int8). El orden de
+# los códigos es la precedencia del if/elif de `analyze_portfolio`: una fila que matchea
+# varias palabras clave se queda con la primera clase de esta lista.
+TXN_OTHER, TXN_BUY, TXN_DEPOSIT, TXN_DRIP, TXN_DIVIDEND, TXN_SELL, TXN_TAX = range(7)
+
+TXN_KIND_LABELS = {
+    TXN_OTHER: 'other', TXN_BUY: 'buy', TXN_DEPOSIT: 'deposit', TXN_DRIP: 'drip',
+    TXN_DIVIDEND: 'dividend', TXN_SELL: 'sell', TXN_TAX: 'tax',
+}
+
+# Esquema declarado de `_wizard_df_clean`. Columnas extra del broker se conservan tal cual.
+TRANSACTION_SCHEMA = {
+    'Date': 'datetime64[ns]',
+    'Action': 'category',      # texto crudo del broker (la clase va en ActionKind)
+    'ActionKind': 'int8',
+    'Ticker': 'category',
+    'Quantity': 'float64',
+    'Price': 'float64',
+    'Amount': 'float64',
+}
+
+
+def classify_actions(actions) -> np.ndarray:
+    """Clase canónica (`TXN_*`, int8) de cada texto de Action.
+
+    Palabras clave (en minúsculas, como las escribe cada broker):
+      DRIP      reinvest, reinversión, drip
+      BUY       buy, bought, compra — salvo que sea reinversión
+      SELL      sell, sold, venta
+      DEPOSIT   deposit, depósito, transfer, journal, contribution
+      DIVIDEND  dividend, dividendo, yield, interest — salvo reinversión. Incluye la
+                retención de IB ('Dividend - Foreign Tax Withholding'), que netea aquí.
+      TAX       retención en fila aparte (Schwab 'NRA Tax Adj'): nra tax, tax adj,
+                withholding, foreign tax, retención — si no es ya DIVIDEND.
+    Se evalúa sobre los valores DISTINTOS (unas decenas) y se expande con los códigos, así
+    que cuesta lo mismo con 100 filas que con 100k.
+    """
+    raw = pd.Series(actions, copy=False).astype(str)
+    codes, uniques = pd.factorize(raw)
+    low = pd.Series(uniques, dtype=object).str.lower()
+
+    def has(pattern):
+        return low.str.contains(pattern, regex=True, na=False).to_numpy()
+
+    drip = has('reinvest|reinversión|drip')
+    div = has('dividend|dividendo|yield|interest') & ~drip
+    kinds = np.select(
+        [has('buy|bought|compra') & ~drip,
+         has('deposit|depósito|transfer|journal|contribution'),
+         drip,
+         div,
+         has('sell|sold|venta'),
+         has('nra tax|tax adj|withholding|foreign tax|retención|retencion') & ~div],
+        [TXN_BUY, TXN_DEPOSIT, TXN_DRIP, TXN_DIVIDEND, TXN_SELL, TXN_TAX],
+        TXN_OTHER,
+    ).astype(np.int8)
+    return kinds[codes] if len(codes) else np.zeros(0, dtype=np.int8)
+
+
+def transaction_schema_errors(df: pd.DataFrame) -> list:
+    """Diferencias de `df` contra `TRANSACTION_SCHEMA` (lista vacía = válido)."""
+    if df is None:
+        return ['sin tabla']
+    errors = []
+    for col, dtype in TRANSACTION_SCHEMA.items():
+        if col not in df.columns:
+            errors.append(f'falta la columna {col}')
+        elif col == 'Date':
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                errors.append(f'{col}: {df[col].dtype} (se espera datetime64)')
+        elif str(df[col].dtype) != dtype:
+            errors.append(f'{col}: {df[col].dtype} (se espera {dtype})')
+    if 'ActionKind' in df.columns and len(df) and not df['ActionKind'].isin(TXN_KIND_LABELS).all():
+        errors.append('ActionKind con códigos fuera de TXN_KIND_LABELS')
+    return errors
+
+
+def canonical_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convierte la salida de `normalize_csv` (o de `merge_transaction_frames`) en la tabla
+    canónica de `TRANSACTION_SCHEMA`: Date datetime64, Ticker y Action categóricas, la clase
+    de la acción en `ActionKind` (int8) y los montos en float64. Es lo que se guarda en
+    `_wizard_df_clean`.
+
+    Ticker/Action categóricas ocupan un código por fila en vez de un str de Python, y los
+    consumidores que filtran por texto (`.str.lower().str.contains`) lo hacen sobre las
+    categorías, no sobre cada fila. Faltando Quantity/Price se rellenan con 0.0 (lo mismo que
+    leía `analyze_portfolio` con `row.get(..., 0)`); las filas sin fecha se descartan.
+    """
+    if df is None or df.empty:
+        return df
+    out = df.copy()
+    out['Date'] = pd.to_datetime(out['Date'], errors='coerce')
+    out = out[out['Date'].notna()]
+    action = (out['Action'].astype(str) if 'Action' in out.columns
+              else pd.Series('', index=out.index))
+    out['Action'] = action.astype('category')
+    out['ActionKind'] = classify_actions(action)
+    out['Ticker'] = out['Ticker'].astype(str).str.strip().astype('category')
+    for col in ('Quantity', 'Price', 'Amount'):
+        out[col] = (pd.to_numeric(out[col], errors='coerce').fillna(0.0).astype('float64')
+                    if col in out.columns else 0.0)
+    return out.reset_index(drop=True)
+
+
 @st.cache_data(ttl=3600)
 
 def fetch_data_from_html(ticker):
@@ -967,8 +1106,7 @@ def fetch_data_from_html(ticker):
     url = f"https://finance.yahoo.com/quote/{ticker}/history?p={ticker}"
     
     try:
-        session = get_session()
-        response = session.get(url, timeout=10)
+        response = http_pool.get(url, timeout=10)
         
         if response.status_code == 200:
             if "Historical Data" in response.text:
@@ -1005,11 +1143,141 @@ def fetch_data_from_html(ticker):
         print(f"HTML Scrape Exception: {e}")
         return pd.DataFrame()
 
+_MARKET_FLIGHT = single_flight.group('market_data')
+_DOWNLOAD_FLIGHT = single_flight.group('yf_download')
+
+# Tickers que Yahoo no conoce (o deslistados): TICKER → (vence, motivo). Sin esto, cada
+# análisis y cada sesión repetían la cascada completa (dos `yf.download`, `history`,
+# scraper) para el mismo símbolo inexistente. Solo se anota cuando la propia cascada vio
+# a Yahoo contestar sano (`_fetch_market_data` → 'sin_datos'): un vacío por 429 o red
+# caída no dice nada del ticker.
+NEGATIVE_TTL_S = 6 * 3600
+YAHOO_DOMAIN = 'yahoo.com'
+_NEGATIVE = {}
+
+# De dónde salió el marco de `fetch_market_data` (y el `market_source` de cada resultado):
+# 'yahoo' en vivo; 'memoria' o 'price_cache', guardado porque Yahoo no respondía;
+# 'sin_datos', Yahoo no tiene el ticker; 'caido', Yahoo no respondía y no había nada
+# guardado. Un resultado con alguna fuente degradada no se comparte ni se persiste.
+STALE_MARKET_SOURCES = frozenset({'memoria', 'price_cache'})
+DEGRADED_MARKET_SOURCES = STALE_MARKET_SOURCES | {'caido'}
+
+
 def fetch_market_data(ticker, start_date):
     """
     Fetches raw market data (auto_adjust=False) to correctly calculate dividends and splits.
     Includes robust keys and fallback mechanisms.
+
+    Devuelve `(marco, error, fuente)`; `fuente` según `DEGRADED_MARKET_SOURCES` y compañía.
+
+    Sesiones concurrentes que piden el mismo (ticker, inicio) comparten UNA descarga en
+    vuelo (`single_flight`); quien se une a la de otra recibe una copia del marco.
+
+    Un ticker que Yahoo no tiene queda en caché negativo `NEGATIVE_TTL_S` y se contesta
+    sin red. Con el circuito de Yahoo abierto (`http_pool`, tras varios fallos seguidos), o
+    si la cascada no obtuvo respuesta, se sirve lo guardado (`_stale_market_data`).
     """
+    import time as _time
+    tk = str(ticker).upper()
+    vetado = _NEGATIVE.get(tk)
+    if vetado is not None and vetado[0] > _time.time():
+        return pd.DataFrame(), vetado[1], 'sin_datos'
+    if http_pool.circuit_open(YAHOO_DOMAIN):
+        return _stale_market_data(ticker, start_date)
+
+    key = (tk, pd.Timestamp(start_date), 'raw', 'actions')
+    (data, error_msg, fuente), shared = _MARKET_FLIGHT.do(
+        key, lambda: _fetch_market_data(ticker, start_date))
+    if fuente == 'caido':
+        return _stale_market_data(ticker, start_date)
+    if fuente == 'sin_datos':
+        _NEGATIVE[tk] = (_time.time() + NEGATIVE_TTL_S, error_msg)
+    return (data.copy() if shared else data), error_msg, fuente
+
+
+def _stale_market_data(ticker, start_date):
+    """Marco de `ticker` sin ir a la red: el que ya bajó el proceso desde un inicio igual o
+    anterior (`_MARKET_FRAMES`) o, si no, el del caché de precios aunque esté vencido, con
+    su fuente; sin ninguno, vacío con el motivo y fuente 'caido'."""
+    tk = str(ticker).upper()
+    start = pd.Timestamp(start_date)
+    desde = start - datetime.timedelta(days=10)
+    with _MARKET_LOCK:
+        guardados = list(_MARKET_FRAMES.items())
+    for (t, s), frame in guardados:
+        if t == tk and s <= start:
+            return frame[frame.index >= desde].copy(), None, 'memoria'
+    import price_cache
+    frame = price_cache.cached_history(tk)
+    if frame is not None and not frame.empty:
+        return frame[frame.index >= desde], None, 'price_cache'
+    estado = http_pool.breaker_state(YAHOO_DOMAIN)
+    return pd.DataFrame(), (f"Yahoo Finance no responde ({estado['last_error'] or 'sin respuesta'}) "
+                            f"y no hay datos guardados de {tk}"), 'caido'
+
+
+def _market_sources(resultados):
+    """(ticker, fuente, error) de cada posición de `resultados` y de su subyacente."""
+    for t, r in (resultados or {}).items():
+        if not isinstance(r, dict):
+            continue
+        if r.get('market_source'):
+            yield str(t).upper(), r['market_source'], r.get('error')
+        if r.get('underlying_market_source') and r.get('underlying_ticker'):
+            yield str(r['underlying_ticker']).upper(), r['underlying_market_source'], None
+
+
+def market_degraded(resultados) -> bool:
+    """¿Algún precio de `resultados` salió de una fuente degradada (`DEGRADED_MARKET_SOURCES`)?
+    Ese análisis vale para quien lo pidió, pero no se comparte ni se guarda en un snapshot:
+    el siguiente, con Yahoo de vuelta, tiene que volver a consultarlo."""
+    return any(f in DEGRADED_MARKET_SOURCES for _t, f, _r in _market_sources(resultados))
+
+
+def market_data_health(resultados) -> dict:
+    """Estado de la fuente de mercado para el panel de Validación datos: el circuito de
+    Yahoo (`http_pool.breaker_state`, del proceso) y, de las posiciones de `resultados` (y
+    sus subyacentes), las que salieron de datos guardados ('stale'), las que Yahoo no tiene
+    ('missing') y las que no se pudieron obtener ('down'). Se lee del `market_source` de
+    cada resultado, no de un estado del proceso: otra sesión no cambia lo que ve esta."""
+    salud = {'breaker': http_pool.breaker_state(YAHOO_DOMAIN), 'stale': {}, 'missing': {},
+             'down': {}}
+    for t, fuente, error in _market_sources(resultados):
+        if fuente in STALE_MARKET_SOURCES:
+            salud['stale'][t] = fuente
+        elif fuente == 'sin_datos':
+            salud['missing'][t] = error or ''
+        elif fuente == 'caido':
+            salud['down'][t] = error or ''
+    return salud
+
+
+def _coalesced_download(ticker, start, session=None, **flags):
+    """`yf.download(ticker, start=start, progress=False, **flags)` con una sola descarga
+    en vuelo por (ticker, inicio, flags) en todo el proceso; copia si fue compartida."""
+    import yfinance as yf
+    key = (str(ticker).upper(), pd.Timestamp(start), tuple(sorted(flags.items())))
+    data, shared = _DOWNLOAD_FLIGHT.do(
+        key, lambda: yf.download(ticker, start=start, progress=False, session=session, **flags))
+    return data.copy() if shared and data is not None else data
+
+
+def _fetch_market_data(ticker, start_date):
+    """La cascada de `_market_cascade` como `(marco, error, fuente)`. Si vuelve vacía, la
+    fuente dice por qué, según lo que vieron SUS requests (`http_pool.observe`): 'sin_datos'
+    si Yahoo contestó y ninguna falló (el ticker no existe), 'caido' si alguna falló (429,
+    5xx, red, circuito) o no salió ninguna por la sesión compartida."""
+    with http_pool.observe() as visto:
+        data, error_msg = _market_cascade(ticker, start_date)
+    if not data.empty:
+        return data, error_msg, 'yahoo'
+    if visto.requests and not visto.failures:
+        return data, error_msg, 'sin_datos'
+    return data, error_msg, 'caido'
+
+
+def _market_cascade(ticker, start_date):
+    import yfinance as yf
     # Extend start date back a bit to ensure we cover the first transaction
     start_date_obj = pd.to_datetime(start_date)
     buffer_date = start_date_obj - datetime.timedelta(days=10)
@@ -1036,9 +1304,16 @@ def fetch_market_data(ticker, start_date):
         session = None
 
     for attempt in range(2):
+        # El segundo intento sale del presupuesto común de reintentos (`http_pool`): con
+        # Yahoo limitando, no se duplica la carga.
+        if attempt and not http_pool.retry_allowed():
+            break
         try:
             # print(f"Downloading {ticker} (Attempt {attempt+1})...")
-            data = yf.download(ticker, start=buffer_date, progress=False, auto_adjust=False, actions=True, session=session)
+            # threads=False: un solo ticker, y así sus requests corren en este hilo y las
+            # cuenta `http_pool.observe` (ver `_fetch_market_data`).
+            data = yf.download(ticker, start=buffer_date, progress=False, auto_adjust=False,
+                               actions=True, session=session, threads=False)
             
             if not data.empty:
                 # Flatten MultiIndex if present
@@ -1171,9 +1446,153 @@ def xirr(flows, guess_lo: float = -0.9999, guess_hi: float = 10.0):
     return (lo + hi) / 2.0
 
 
+# Marcos de mercado que ya bajó `analyze_portfolio`, por (TICKER, fecha de inicio) y
+# compartidos por todas las sesiones del proceso. Solo los usa `_stale_market_data` para
+# servir lo ya bajado cuando Yahoo no responde: ningún resultado depende de que sigan aquí
+# (sus series de mercado son copias de una columna, `_market_series`). Sale primero el usado
+# hace más tiempo al pasar el tope; lo escriben y leen los hilos de todas las sesiones, de
+# ahí el lock.
+MARKET_STORE_MAX = 128
+_MARKET_FRAMES = OrderedDict()
+_MARKET_LOCK = threading.Lock()
+
+
+def _remember_market(ticker, start, frame):
+    if frame is None or frame.empty:
+        return
+    with _MARKET_LOCK:
+        clave = (str(ticker).upper(), pd.Timestamp(start))
+        _MARKET_FRAMES[clave] = frame
+        _MARKET_FRAMES.move_to_end(clave)
+        while len(_MARKET_FRAMES) > MARKET_STORE_MAX:
+            _MARKET_FRAMES.popitem(last=False)
+
+
+def _market_series(frame, column):
+    """Copia de la columna `column` del marco de mercado, para guardarla en el resultado.
+
+    Es la ventana exacta que usó el análisis y no retiene el marco entero (Open, High,
+    Volume…). No se deja perezosa sobre `_MARKET_FRAMES`: si el marco ya no estuviera (tope,
+    recarga de `logic`, snapshot leído en otro proceso) habría que volver a pedirlo en el
+    render de la vista, con otra ventana y quizá de datos guardados, en un resultado que
+    `market_degraded` daría por sano."""
+    if frame is None or column not in frame.columns:
+        return None
+    return frame[column].copy()
+
+
+def _monthly_income(ticker, ticker_df, ticker_mode, led=None):
+    """Ingreso por mes (índice 'YYYY-MM') de un ticker mode_a / mode_b.
+
+    Mode A: all dividend/reinvest rows (YieldMax pays monthly)
+    Mode B: cash dividends only (VTI, SCHB, SCHD pay quarterly cash divs)
+    """
+    monthly_income = pd.Series(dtype=float)
+    try:
+        if ticker_mode == 'mode_a':
+            # Fuente única: _dividend_events cuenta 'Reinvest Dividend' (bruto) y
+            # omite 'Reinvest Shares' (compra neta post-tax). Evita el neteo del DRIP
+            # de Schwab que subestimaba los meses con reinversión.
+            div_events = _dividend_events(ticker_df, led=led)
+            if not div_events.empty:
+                monthly_income = div_events.groupby(
+                    div_events.index.to_period('M').astype(str)
+                ).sum()
+        else:
+            # mode_b: cash dividends only (exclude reinvest rows to avoid double-count)
+            div_rows = ticker_df[
+                ticker_df['Action'].str.lower().str.contains('dividend|dividendo|yield', na=False) &
+                ~ticker_df['Action'].str.lower().str.contains('reinvest|reinversión|drip', na=False)
+            ].copy()
+            if not div_rows.empty:
+                div_rows['Month'] = div_rows['Date'].dt.to_period('M').astype(str)
+                monthly_income = div_rows.groupby('Month')['Amount'].sum().abs()
+    except Exception as e:
+        print(f"Income calc error for {ticker}: {e}")
+    return monthly_income
+
+
+# Cargadores de los campos perezosos, por nombre: `LazyField` guarda el nombre y no la
+# función para que el resultado se serialice igual con pickle (`st.cache_data`) que en un
+# snapshot (`snapshot_store`), y sobreviva a una recarga del módulo.
+LAZY_LOADERS = {
+    'monthly_income': _monthly_income,
+}
+
+
+class LazyField:
+    """Campo de `TickerResult` pendiente: `LAZY_LOADERS[loader](*args)` al primer acceso."""
+    __slots__ = ('loader', 'args')
+
+    def __init__(self, loader, *args):
+        self.loader = loader
+        self.args = args
+
+    def __call__(self):
+        return LAZY_LOADERS[self.loader](*self.args)
+
+    def __repr__(self):
+        return f"<lazy {self.loader}{self.args[:1]!r}>"
+
+
+class TickerResult(dict):
+    """Resultado por ticker de `analyze_portfolio`.
+
+    Es un dict —las vistas siguen con `stats['x']`, `stats.get('x')`, `'x' in stats`— cuyos
+    campos perezosos (`monthly_income`, que sale de `history`) se guardan como `LazyField` y
+    se calculan la primera vez que alguien los lee; desde ahí quedan en el dict. Un cargador
+    nunca va a la red. Las series de mercado del fondo y del subyacente son copias de una
+    columna (`_market_series`), no el marco entero. Las métricas escalares, `history` y
+    `daily_trend` (que sale de la simulación diaria y no se puede recortar de otro lado) se
+    calculan como siempre.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazyField):
+            value = value()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        # Redefinirlo obliga a `dict(r)` / `{**r}` a leer por `__getitem__` y no copiar los
+        # `LazyField` crudos.
+        return dict.__iter__(self)
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def pop(self, key, *default):
+        if key in self:
+            self[key]
+        return dict.pop(self, key, *default)
+
+    def copy(self):
+        return TickerResult(self._raw())
+
+    def _raw(self) -> dict:
+        # `dict.copy` sobre esta subclase pasaría por `__getitem__` y calcularía todo.
+        return dict(dict.items(self))
+
+    def pending(self) -> list:
+        """Campos que todavía no se calcularon."""
+        return [k for k, v in dict.items(self) if isinstance(v, LazyField)]
+
+    def __reduce__(self):
+        # Se serializan los pendientes como tales: la copia de cada sesión no los calcula.
+        return (TickerResult, (self._raw(),))
+
+
 @st.cache_data(show_spinner=False)
 def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_map: dict = None,
-                      position_overrides: dict = None) -> dict:
+                      position_overrides: dict = None, _progreso=None) -> dict:
     """
     Performs a forensic analysis of a portfolio history to calculate true ROI and dividend performance.
     
@@ -1183,6 +1602,10 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
     Args:
         df: Normalized DataFrame containing transaction history.
         version: Cache-busting version string.
+        _progreso: callback opcional `_progreso(hechos, total, ticker, resultado)`, llamado
+            al terminar cada ticker con su resultado parcial (ver `analysis_jobs`). El guion
+            bajo lo deja fuera de la clave de `st.cache_data`; en un acierto de caché no se
+            llama.
         
     Returns:
         A dictionary keyed by Ticker containing detailed performance metrics and daily history.
@@ -1203,8 +1626,16 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
 
     # Group by Ticker
     tickers = df['Ticker'].unique()
-    
-    for ticker in tickers:
+    if _progreso is not None:
+        _progreso(0, len(tickers), None, None)
+
+    # Cada ticker sale del cuerpo por varios `continue`: el aviso del anterior se da al
+    # empezar el siguiente (y el del último, al cerrar el bucle).
+    previo = None
+    for i, ticker in enumerate(tickers):
+        if _progreso is not None and previo is not None:
+            _progreso(i, len(tickers), previo, results.get(previo))
+        previo = ticker
         ticker_df = df[df['Ticker'] == ticker].sort_values('Date')
         if ticker_df.empty:
             continue
@@ -1231,10 +1662,12 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
             continue
 
         first_date = ticker_df['Date'].min()
-        market_data, error_msg = fetch_market_data(ticker, first_date)
-        
+        market_data, error_msg, market_source = fetch_market_data(ticker, first_date)
+        _remember_market(ticker, first_date, market_data)
+
         if market_data.empty:
-            results[ticker] = {"error": f"No market data found: {error_msg}"}
+            results[ticker] = {"error": f"No market data found: {error_msg}",
+                               "market_source": market_source}
             continue
 
         # Último cierre CON DATO, no la última fila. yfinance devuelve una barra para la
@@ -1248,7 +1681,8 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         # la apertura del mercado.
         _closes = market_data['Close'].dropna()
         if _closes.empty:
-            results[ticker] = {"error": f"No usable close price: {error_msg or 'serie sin cierres'}"}
+            results[ticker] = {"error": f"No usable close price: {error_msg or 'serie sin cierres'}",
+                               "market_source": market_source}
             continue
         current_price = _closes.iloc[-1]
         
@@ -1293,45 +1727,28 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         irr_flows_dated = []   # (date, signed_amount) para cálculo de IRR real
         dist_dated      = []   # (date, monto) de distribuciones recibidas (cash + reinvertido) p/ ROC 19a
         divs_by_year    = defaultdict(float)  # año calendario -> dividendos netos del año (cash + drip)
-        for idx, row in ticker_df.iterrows():
+        # Clase de cada fila: la de la tabla canónica si ya viene (`canonical_transactions`),
+        # si no se clasifica aquí con las mismas reglas (`classify_actions`).
+        _kinds = (ticker_df['ActionKind'].to_numpy() if 'ActionKind' in ticker_df.columns
+                  else classify_actions(ticker_df['Action']))
+        for (idx, row), kind in zip(ticker_df.iterrows(), _kinds):
             action = str(row['Action']).lower()
             qty = safe_float(row.get('Quantity', 0))
             amount = safe_float(row.get('Amount', 0))
             
             # --- Semantic Classification (Robust) ---
-            # Determine intent based on description keywords
-            
-            # 1. DRIP (Reinversión)
-            # Keywords: reinvest, reinversión, drip
-            is_drip = 'reinvest' in action or 'reinversión' in action or 'drip' in action
-            
-            # 2. Buy (Compra)
-            # Keywords: buy, bought, compra
-            # Exclusion: Ensure it's not a 'reinvest' buy (which is handled by DRIP logic)
-            is_buy = ('buy' in action or 'bought' in action or 'compra' in action) and not is_drip
-            
-            # 3. Sell (Venta)
-            # Keywords: sell, sold, venta
-            is_sell = 'sell' in action or 'sold' in action or 'venta' in action
-            
-            # 5. Deposit / Transfer (Depósito / Transferencia)
-            # Keywords: deposit, deposito, transfer, journal, contribution
-            is_deposit = 'deposit' in action or 'depósito' in action or 'transfer' in action or 'journal' in action or 'contribution' in action
-            
-            # 6. Dividend Payout (Pago de Dividendo en Efectivo)
-            # Keywords: dividend, payout, yield, interest (excluding reinvestment)
-            is_div_payout = ('dividend' in action or 'dividendo' in action or 'yield' in action or 'interest' in action) and not is_drip
-
-            # 7. Retención de impuesto en fila aparte (convención Schwab: 'NRA Tax Adj' sin
-            # 'dividend' en el Action -> is_div_payout no la agarra). La convención IB
-            # ('Dividend - Foreign Tax Withholding') SÍ contiene 'dividend' y ya la cubre
-            # is_div_payout de arriba -> se excluye aquí con `not is_div_payout` para no
-            # procesarla dos veces. Sin este branch, el retiro de caja por impuesto era
-            # invisible para el cronograma de IRR (mismo bug de fondo que gross_value, pero
-            # de timing): IRR salía sobreestimado igual que ROI/Retorno Total.
-            is_tax_only = (('nra tax' in action or 'tax adj' in action or 'withholding' in action
-                            or 'foreign tax' in action or 'retención' in action or 'retencion' in action)
-                           and not is_div_payout)
+            # Keywords y precedencia documentadas en `classify_actions`. TAX es la retención
+            # en fila aparte (convención Schwab: 'NRA Tax Adj' sin 'dividend' en el Action);
+            # la convención IB ('Dividend - Foreign Tax Withholding') cae en DIVIDEND. Sin el
+            # branch TAX, el retiro de caja por impuesto era invisible para el cronograma de
+            # IRR (mismo bug de fondo que gross_value, pero de timing): IRR salía
+            # sobreestimado igual que ROI/Retorno Total.
+            is_buy = kind == TXN_BUY
+            is_deposit = kind == TXN_DEPOSIT
+            is_drip = kind == TXN_DRIP
+            is_div_payout = kind == TXN_DIVIDEND
+            is_sell = kind == TXN_SELL
+            is_tax_only = kind == TXN_TAX
 
             # Logic
             row_cash_flow = 0.0
@@ -1512,6 +1929,7 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
                 if _m > 12:
                     _m, _y = 1, _y + 1
             _cf_list = [_buckets.get(k, 0.0) for k in _keys]
+            import numpy_financial as npf
             _monthly  = npf.irr(_cf_list)
             if _monthly is not None and not np.isnan(_monthly) and not np.isinf(_monthly) and _monthly > -1:
                 irr_anual = round(((1 + _monthly) ** 12 - 1) * 100, 2)
@@ -1570,7 +1988,10 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         # la convención por fila -> solo restamos la retención cuando NO viene plegada, para
         # no restarla dos veces en IB. `dividends_collected_drip` no se toca: ese dinero ya
         # está dentro de `market_value` (acciones compradas con el neto post-retención).
-        _tax_totals_early = build_dividend_tax_totals(ticker_df)
+        # Ledger fiscal por fila (ver `fiscal_ledger`): se construye una vez por ticker, se
+        # pasa a cada helper fiscal y queda en el resultado para los que lo lean después.
+        _ledger = fiscal_ledger(ticker_df)
+        _tax_totals_early = build_dividend_tax_totals(ticker_df, led=_ledger)
         _cash_collected_net = (dividends_collected_cash if _tax_totals_early['netted']
                                 else dividends_collected_cash - _tax_totals_early['withheld'])
 
@@ -1731,8 +2152,8 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
 
             # auto_adjust=False mantiene precios históricos reales (no ajustados por dividendos).
             # actions=True trae columna Dividends para reinvertirlos en la simulación.
-            spy_data = yf.download(benchmark_ticker, start=first_date, progress=False,
-                                   auto_adjust=False, actions=True, session=session)
+            spy_data = _coalesced_download(benchmark_ticker, first_date, session=session,
+                                           auto_adjust=False, actions=True)
 
             if isinstance(spy_data.columns, pd.MultiIndex):
                 spy_data.columns = spy_data.columns.get_level_values(0)
@@ -1961,28 +2382,12 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         # --- v2.0: Monthly income & yield on cost (Mode A and Mode B) ---
         # Mode A: all dividend/reinvest rows (YieldMax pays monthly)
         # Mode B: cash dividends only (VTI, SCHB, SCHD pay quarterly cash divs)
+        # El ingreso mensual se arma al primer acceso (ver `_monthly_income`).
         monthly_income = pd.Series(dtype=float)
         yield_on_cost = 0.0
         if ticker_mode in ('mode_a', 'mode_b'):
+            monthly_income = LazyField('monthly_income', ticker, ticker_df, ticker_mode, _ledger)
             try:
-                if ticker_mode == 'mode_a':
-                    # Fuente única: _dividend_events cuenta 'Reinvest Dividend' (bruto) y
-                    # omite 'Reinvest Shares' (compra neta post-tax). Evita el neteo del DRIP
-                    # de Schwab que subestimaba los meses con reinversión.
-                    div_events = _dividend_events(ticker_df)
-                    if not div_events.empty:
-                        monthly_income = div_events.groupby(
-                            div_events.index.to_period('M').astype(str)
-                        ).sum()
-                else:
-                    # mode_b: cash dividends only (exclude reinvest rows to avoid double-count)
-                    div_rows = ticker_df[
-                        ticker_df['Action'].str.lower().str.contains('dividend|dividendo|yield', na=False) &
-                        ~ticker_df['Action'].str.lower().str.contains('reinvest|reinversión|drip', na=False)
-                    ].copy()
-                    if not div_rows.empty:
-                        div_rows['Month'] = div_rows['Date'].dt.to_period('M').astype(str)
-                        monthly_income = div_rows.groupby('Month')['Amount'].sum().abs()
                 years = max((ticker_df['Date'].max() - ticker_df['Date'].min()).days / 365.25, 0.01)
                 ann_divs = total_dividends / years
                 yield_on_cost = (ann_divs / pocket_investment * 100) if pocket_investment > 0 else 0
@@ -2004,7 +2409,8 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         csv_coverage_pct  = None
         csv_inception_yf  = None
         try:
-            _fi = yf.Ticker(ticker).fast_info
+            import yfinance as yf
+            _fi = yf.Ticker(ticker, session=get_session()).fast_info
             _ep = getattr(_fi, 'first_trade_date', None)
             if _ep:
                 _inc = pd.Timestamp(_ep).tz_localize(None)
@@ -2077,7 +2483,7 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
                 _roc_source = '19a'
 
         # ── Forward vs realized yield + retención real (Mejoras 3 y 4) ────
-        _fy = forward_realized_yield(ticker_df, market_value, today=_snapshot_date)
+        _fy = forward_realized_yield(ticker_df, market_value, today=_snapshot_date, led=_ledger)
         # Objeto fiscal único de bruto/retención/neto (PR B): `divs_by_year` mezcla bases
         # según el broker (bruto para Schwab-cash, neto para IB) y `gross = net + withheld`
         # solo es correcto para IB — para Schwab duplica la retención. `build_dividend_tax_totals`
@@ -2088,9 +2494,9 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         _dividend_tax_totals = _tax_totals_early
         _withheld = _dividend_tax_totals['withheld']
         _withheld_by_year = _dividend_tax_totals['withheld_by_year']
-        _refund_obs_by_year = observed_tax_refund_by_year(ticker_df)
+        _refund_obs_by_year = observed_tax_refund_by_year(ticker_df, led=_ledger)
         _gross_by_year = _dividend_tax_totals['gross_by_year']
-        _cadence_change = detect_cadence_change(ticker_df)
+        _cadence_change = detect_cadence_change(ticker_df, led=_ledger)
 
         # CAGR de precio puro (no contaminado por DRIP/aportes): la erosión/apreciación
         # observada del NAV. Se calcula sobre toda la ventana Y sobre los últimos 12 meses;
@@ -2101,8 +2507,8 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         _close = None
         _fund_divs = None
         try:
-            _close = market_data['Close'] if 'Close' in market_data.columns else None
-            _fund_divs = market_data['Dividends'] if 'Dividends' in market_data.columns else None
+            _close = _market_series(market_data, 'Close')
+            _fund_divs = _market_series(market_data, 'Dividends')
             if _close is not None:
                 _price_cagr = _annualized_cagr(_close)
                 _price_cagr_recent = _annualized_cagr(_close, days=365)
@@ -2116,6 +2522,7 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         # MSTY sigue a MSTR, TSLY a TSLA, etc. Traemos el retorno reciente del subyacente
         # para contrastar la asimetría: el fondo captura casi toda la caída pero capa la subida.
         _underlying_tk = None
+        _underlying_source = None
         _underlying_cagr_recent = None
         _underlying_hold_value = None
         _underlying_close = None
@@ -2126,11 +2533,12 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
             _u = _info_u.get('underlying')
             if _is_ym and _u and str(_u).upper() not in ('N/A', 'NA', ''):
                 _underlying_tk = str(_u).upper()
-                _udf, _uerr = fetch_market_data(_underlying_tk, first_date)
+                _udf, _uerr, _underlying_source = fetch_market_data(_underlying_tk, first_date)
+                _remember_market(_underlying_tk, first_date, _udf)
                 if _udf is not None and not _udf.empty and 'Close' in _udf.columns:
                     _underlying_cagr_recent = _annualized_cagr(_udf['Close'], days=365)
-                    _underlying_close = _udf['Close']
-                    _underlying_divs = _udf['Dividends'] if 'Dividends' in _udf.columns else None
+                    _underlying_close = _market_series(_udf, 'Close')
+                    _underlying_divs = _market_series(_udf, 'Dividends')
                     # #1: ¿y si hubieras tenido el subyacente directo? (misma plata y timing)
                     _up = _udf['Close'].reindex(daily_history.index).ffill()
                     _ud = (_udf['Dividends'].reindex(daily_history.index).fillna(0)
@@ -2140,7 +2548,7 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         except Exception:
             pass
 
-        results[ticker] = {
+        results[ticker] = TickerResult({
             # Métricas existentes (sin cambios)
             "current_price": current_price,
             "shares_owned": shares_owned,
@@ -2154,6 +2562,10 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
             "net_profit": net_profit,
             "roi_percent": roi,
             "history": ticker_df,
+            # Ledger fiscal por fila del historial (ver `fiscal_ledger`), construido una vez
+            # arriba. Los helpers fiscales que parten de un resultado lo reciben de aquí
+            # (`led=stats['fiscal_ledger']`) en vez de reconstruirlo.
+            "fiscal_ledger": _ledger,
             "daily_trend": daily_history[['User Profit', 'SPY Profit', 'User Return %', 'Invested Capital', 'Market Value', 'User Total Value', 'Drawdown %']],
             # Métricas cuantitativas
             "volatilidad_anualizada": volatilidad_anualizada,
@@ -2221,14 +2633,16 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
             "price_cagr_recent": _price_cagr_recent,
             "price_history_days": _price_history_days,
             "cadence_change":    _cadence_change,
+            "market_source":     market_source,
             "underlying_ticker": _underlying_tk,
+            "underlying_market_source": _underlying_source,
             "underlying_cagr_recent": _underlying_cagr_recent,
             "underlying_hold_value": _underlying_hold_value,
             "fund_close_series": _close,
             "underlying_close_series": _underlying_close,
             "fund_dividends_series": _fund_divs,
             "underlying_dividends_series": _underlying_divs,
-        }
+        })
         # Objeto fiscal único (Regla 3, specs/roc-nra-invariants.md): capa 1, SIN DECLARAR.
         # Esta función está cacheada con @st.cache_data y el país vive en session_state, así
         # que aquí no se puede conocer la residencia del cliente. Antes se rellenaba con
@@ -2239,6 +2653,8 @@ def analyze_portfolio(df: pd.DataFrame, version: str = "1.2.1", ib_cost_basis_ma
         results[ticker]['tax_summary'] = build_tax_summary(
             results[ticker], ticker, base_rate_pct=RATE_UNDECLARED)
 
+    if _progreso is not None and previo is not None:
+        _progreso(len(tickers), len(tickers), previo, results.get(previo))
     return results
 
 def get_params_from_csv(df):
@@ -2259,7 +2675,7 @@ def simulate_strategy(ticker, start_date, initial_investment):
     """
     Simulates a perfect DRIP vs No-DRIP strategy for comparison.
     """
-    market_data, error_msg = fetch_market_data(ticker, start_date)
+    market_data, error_msg, _fuente = fetch_market_data(ticker, start_date)
     if market_data.empty:
         return None, error_msg
 
@@ -2535,6 +2951,12 @@ def _clean_money(raw) -> float:
         return float('nan')
 
 
+def _clean_money_series(col: pd.Series) -> pd.Series:
+    """`_clean_money` sobre una columna entera, con operaciones de texto vectorizadas."""
+    s = col.astype(str).str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(s, errors='coerce').astype(float).where(col.notna())
+
+
 def _resolve_income_ticker(symbol, description):
     """Resuelve la identidad de una fila del income file -> (ticker, folded_bool).
 
@@ -2623,7 +3045,7 @@ def parse_schwab_income_csv(raw_bytes: bytes):
     out['TxnType'] = df[c_txn].astype(str) if c_txn else ''
     out['IncomeType'] = df[c_inc].astype(str).str.strip()
     out['Account'] = df[c_acct].astype(str).str.strip() if c_acct else ''
-    out['Amount'] = df[c_amt].apply(_clean_money)
+    out['Amount'] = _clean_money_series(df[c_amt])
 
     # Excluir interés de cash (no es de un ticker) y montos/fechas malformados.
     mask_cash = (out['SecurityType'].str.contains('cash', case=False, na=False)
@@ -2671,194 +3093,316 @@ def summarize_income(df) -> dict:
     return {'tickers': tickers, 'multi_account': len(accounts) > 1, 'accounts': accounts}
 
 
+IBKR_CHUNK_BYTES = 1 << 20   # tamaño de bloque al decodificar una sección (memoria acotada)
+
+# Acción canónica por 'Transaction Type' del export "Transaction History" de IB.
+IBKR_TH_ACTIONS = {
+    'Dividend':              'Dividend',
+    'Buy':                   'Buy',
+    'Sell':                  'Sell',
+    'Payment in Lieu':       'Dividend',   # pago sustituto de dividendo (securities lending)
+    # Retención de impuesto — monto con signo (negativo=cargo, positivo=reverso).
+    # Se mantiene 'Dividend' en el nombre para que siga neteando dentro de
+    # dividends_collected_cash (is_div_payout matchea por 'dividend' en Action,
+    # ver línea ~1150), pero ahora conserva 'Foreign Tax Withholding' como rastro
+    # explícito para que withheld_tax_total() / *_by_year() / observed_tax_refund_by_year()
+    # (que buscan 'foreign tax'/'withholding' en Action) puedan detectarla — antes se
+    # perdía al fundirse en 'Dividend' puro y withheld_tax_total() reportaba $0 para IB.
+    'Foreign Tax Withholding': 'Dividend - Foreign Tax Withholding',
+}
+
+_IBKR_RECORD = re.compile(rb'^(\xef\xbb\xbf)?("[^"\r\n]*"|[^,\r\n]*),', re.M)
+
+
+def _ibkr_section_index(raw_bytes: bytes) -> dict:
+    """Índice de secciones de un export de IB: {nombre: [(inicio, fin), ...]} en bytes.
+
+    Un Activity Statement es una sucesión de bloques de líneas que empiezan todas por el
+    nombre de su sección (`Trades,Header,…`, `Trades,Data,…`). No se recorre línea a línea en
+    Python: por cada bloque se lee el nombre de su primera línea y una regex (en C) salta a
+    la primera línea que ya no empieza por ese nombre. El costo en Python es por bloque, no
+    por línea, y nada se decodifica todavía. Un nombre puede repetirse (extractos de varias
+    cuentas): cada aparición es un rango más.
+    """
+    index = {}
+    pos, size = 0, len(raw_bytes)
+    while pos < size:
+        m = _IBKR_RECORD.match(raw_bytes, pos)
+        if m is None:
+            eol = raw_bytes.find(b'\n', pos)
+            pos = size if eol < 0 else eol + 1
+            continue
+        prefix = m.group(2)
+        run_end = re.compile(rb'^(?!' + re.escape(prefix) + rb',)', re.M).search(raw_bytes, m.end())
+        end = size if run_end is None else run_end.start()
+        name = prefix.strip(b'"').decode('utf-8', errors='replace').strip()
+        index.setdefault(name, []).append((pos, end))
+        pos = end if end > pos else size
+    return index
+
+
+def _ibkr_section_records(raw_bytes: bytes, spans, chunk_bytes: int = IBKR_CHUNK_BYTES):
+    """Recorre los rangos de una sección con `csv.reader` y produce (header, fila) por cada
+    fila 'Data', con `header` la última fila 'Header' vista (IB repite el header cuando cambia
+    la categoría de activo). Decodifica por bloques de ~`chunk_bytes` cortados en fin de
+    línea: la memoria pico es un bloque, no el archivo entero."""
+    import csv as _csv
+    header = None
+    for start, end in spans:
+        pos = start
+        while pos < end:
+            cut = end if end - pos <= chunk_bytes else raw_bytes.rfind(b'\n', pos, pos + chunk_bytes) + 1
+            if cut <= pos:
+                cut = end
+            chunk = raw_bytes[pos:cut]
+            try:
+                text = chunk.decode('utf-8')
+            except UnicodeDecodeError:
+                text = chunk.decode('latin1')
+            for parts in _csv.reader(io.StringIO(text.lstrip('﻿'))):
+                if len(parts) < 2:
+                    continue
+                kind = parts[1].strip()
+                if kind == 'Header':
+                    header = [p.strip() for p in parts[2:]]
+                elif kind == 'Data' and header:
+                    row = [p.strip() for p in parts[2:]]
+                    if len(row) < len(header):
+                        row += [''] * (len(header) - len(row))
+                    yield header, row
+            pos = cut
+
+
+def _ibkr_float(raw: str) -> float:
+    s = str(raw).strip().replace(',', '')
+    if s in ('', '-'):
+        return 0.0
+    try:
+        return float(s)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def _ibkr_col(header, pred):
+    return next((i for i, c in enumerate(header) if pred(c.lower())), None)
+
+
+def _ibkr_frame(cols: dict) -> pd.DataFrame:
+    """Columnas ya tipadas → DataFrame en el formato unificado (fechas como texto: las
+    interpreta `normalize_csv`, igual que para los demás brokers)."""
+    return pd.DataFrame({
+        'Date': pd.Series(cols['Date'], dtype=object),
+        'Action': pd.Series(cols['Action'], dtype=object),
+        'Ticker': pd.Series(cols['Ticker'], dtype=object),
+        'Quantity': np.asarray(cols['Quantity'], dtype=float),
+        'Price': np.asarray(cols['Price'], dtype=float),
+        'Amount': np.asarray(cols['Amount'], dtype=float),
+    })
+
+
+def _ibkr_new_cols() -> dict:
+    return {k: [] for k in ('Date', 'Action', 'Ticker', 'Quantity', 'Price', 'Amount')}
+
+
+def _ibkr_transaction_history(raw_bytes, spans):
+    """Export "Transaction History" de IB (no el Activity Statement)."""
+    cols, layout, last = _ibkr_new_cols(), None, None
+    for header, row in _ibkr_section_records(raw_bytes, spans):
+        if header is not last:
+            last = header
+            layout = {
+                'type': _ibkr_col(header, lambda c: 'transaction type' in c or 'tipo' in c),
+                'gross': _ibkr_col(header, lambda c: 'gross' in c),
+                'net': _ibkr_col(header, lambda c: c == 'net amount' or (c.startswith('net') and 'amount' in c)),
+                'symbol': _ibkr_col(header, lambda c: c in ('symbol', 'símbolo', 'simbolo', 'ticker')),
+                'qty': _ibkr_col(header, lambda c: 'quantity' in c or 'cantidad' in c),
+                'price': _ibkr_col(header, lambda c: c in ('price', 'precio')),
+                'date': _ibkr_col(header, lambda c: c in ('date', 'fecha')),
+            }
+
+        def get(key):
+            i = layout[key]
+            return row[i] if i is not None else '-'
+
+        action = IBKR_TH_ACTIONS.get(get('type'), '')
+        if not action:
+            continue
+        raw_ticker = get('symbol')
+        # Normalizar sufijos IB: TSLY.OLD → TSLY, XYZ.WS → XYZ, etc.
+        norm_ticker = (raw_ticker.split('.')[0] if '.' in raw_ticker
+                       and raw_ticker.split('.')[-1].upper() in ('OLD', 'WS', 'WI', 'RT', 'CV')
+                       else raw_ticker)
+        if not norm_ticker or norm_ticker == '-':
+            continue
+        net_raw = get('net')
+        amount_raw = ((net_raw if net_raw not in ('-', '') else get('gross'))
+                      if action.startswith('Dividend') else get('gross'))
+        cols['Date'].append(get('date') if layout['date'] is not None else '')
+        cols['Action'].append(action)
+        cols['Ticker'].append(norm_ticker)
+        cols['Quantity'].append(_ibkr_float(get('qty')))
+        cols['Price'].append(_ibkr_float(get('price')))
+        cols['Amount'].append(_ibkr_float(amount_raw))
+    return _ibkr_frame(cols) if cols['Date'] else None
+
+
+def _ibkr_trades(raw_bytes, spans):
+    """Sección Trades del Activity Statement: solo acciones/ETFs; Buy/Sell por el signo."""
+    cols, layout, last = _ibkr_new_cols(), None, None
+    for header, row in _ibkr_section_records(raw_bytes, spans):
+        if header is not last:
+            last = header
+            layout = {
+                'category': _ibkr_col(header, lambda c: c == 'asset category'),
+                'date': _ibkr_col(header, lambda c: 'date' in c or 'time' in c),
+                'symbol': _ibkr_col(header, lambda c: c == 'symbol'),
+                'qty': _ibkr_col(header, lambda c: 'quantity' in c),
+                'price': _ibkr_col(header, lambda c: 't. price' in c or 'trade price' in c),
+                'amount': _ibkr_col(header, lambda c: 'proceeds' in c),
+            }
+        cat = layout['category']
+        if cat is not None and not re.search('stock|equity', row[cat].lower()):
+            continue
+        qty = _ibkr_float(row[layout['qty']]) if layout['qty'] is not None else 0.0
+        cols['Date'].append(row[layout['date']] if layout['date'] is not None else '')
+        cols['Action'].append('Buy' if qty > 0 else 'Sell')
+        cols['Ticker'].append(row[layout['symbol']] if layout['symbol'] is not None else '')
+        cols['Quantity'].append(abs(qty))
+        cols['Price'].append(_ibkr_float(row[layout['price']]) if layout['price'] is not None else 0.0)
+        cols['Amount'].append(_ibkr_float(row[layout['amount']]) if layout['amount'] is not None else 0.0)
+    return _ibkr_frame(cols) if cols['Date'] else None
+
+
+def _ibkr_cash_section(raw_bytes, spans, action):
+    """Secciones Dividends / Withholding Tax del Activity Statement: el ticker sale de la
+    descripción ("MSFT(US123) Cash Dividend …"); las filas de total no tienen ticker y se
+    descartan."""
+    cols, layout, last = _ibkr_new_cols(), None, None
+    for header, row in _ibkr_section_records(raw_bytes, spans):
+        if header is not last:
+            last = header
+            layout = {
+                'date': _ibkr_col(header, lambda c: 'date' in c),
+                'amount': _ibkr_col(header, lambda c: 'amount' in c),
+                'desc': _ibkr_col(header, lambda c: c == 'description'),
+            }
+        m = re.match(r'^([A-Z]+)', row[layout['desc']]) if layout['desc'] is not None else None
+        if m is None:
+            continue
+        cols['Date'].append(row[layout['date']] if layout['date'] is not None else '')
+        cols['Action'].append(action)
+        cols['Ticker'].append(m.group(1))
+        cols['Quantity'].append(0.0)
+        cols['Price'].append(0.0)
+        cols['Amount'].append(_ibkr_float(row[layout['amount']]) if layout['amount'] is not None else 0.0)
+    return _ibkr_frame(cols) if cols['Date'] else None
+
+
 def parse_ibkr_csv(raw_bytes: bytes) -> pd.DataFrame:
     """
-    Parses an Interactive Brokers Activity Statement CSV.
+    Parses an Interactive Brokers CSV (Activity Statement or Transaction History).
     IBKR exports are multi-section: each section has a Header row and Data rows.
-    Extracts Trades (Stocks) and Dividends sections and merges into unified format.
+
+    Reads the bytes once to index section offsets (`_ibkr_section_index`) and then parses
+    only the sections it needs — Transaction History, or else Trades (Stocks), Dividends and
+    Withholding Tax — straight into typed columns, chunk by chunk, so peak memory stays near
+    one chunk plus the output instead of several copies of a tens-of-MB statement.
     """
-    for encoding in ['utf-8', 'latin1', 'cp1252']:
+    index = _ibkr_section_index(raw_bytes)
+
+    # --- Transaction History format (IB "Transaction History" export, not Activity Statement) ---
+    # Rows look like: Transaction History,Data,Date,Account,Description,Transaction Type,Symbol,...
+    if 'Transaction History' in index:
+        try:
+            th = _ibkr_transaction_history(raw_bytes, index['Transaction History'])
+            if th is not None:
+                return th
+        except Exception as e:
+            print(f"IBKR Transaction History parse error: {e}")
+
+    frames = []
+    for section, build in (('Trades', _ibkr_trades),
+                           ('Dividends', lambda b, s: _ibkr_cash_section(b, s, 'Dividend')),
+                           ('Withholding Tax', lambda b, s: _ibkr_cash_section(
+                               b, s, 'Dividend - Foreign Tax Withholding'))):
+        if section not in index:
+            continue
+        try:
+            frame = build(raw_bytes, index[section])
+            if frame is not None:
+                frames.append(frame)
+        except Exception as e:
+            print(f"IBKR {section.lower()} parse error: {e}")
+
+    if frames:
+        return pd.concat(frames, ignore_index=True)
+
+    # Fallback: return raw first-pass parse
+    for encoding in ['utf-8', 'latin1']:
         try:
             text = raw_bytes.decode(encoding)
             break
         except Exception:
             continue
-    else:
-        text = raw_bytes.decode('utf-8', errors='replace')
+    return pd.read_csv(io.StringIO(text.lstrip('﻿')), engine='python', on_bad_lines='skip')
 
-    import csv as _csv
-    text = text.lstrip('﻿')  # Remove BOM if present
-    lines = text.splitlines()
-    frames = []
 
-    def _safe_float(raw: str) -> float:
-        s = str(raw).strip().replace(',', '')
-        try:
-            return float(s)
-        except (ValueError, TypeError):
-            return 0.0
+CSV_SNIFF_BYTES = 64 * 1024   # prefijo que se decodifica para inferir encoding y separador
 
-    def _ibkr_reader(section_name: str):
-        """Yield (header, [data_rows]) for a named IB section using csv.reader."""
-        header = None
-        rows = []
-        for parts in _csv.reader(io.StringIO(text)):
-            parts = [p.strip() for p in parts]
-            if len(parts) < 2:
-                continue
-            if parts[0] == section_name and parts[1] == 'Header':
-                header = parts[2:]
-            elif parts[0] == section_name and parts[1] == 'Data' and header:
-                row = parts[2:]
-                if len(row) >= len(header):
-                    rows.append(row[:len(header)])
-                elif row:
-                    rows.append(row + [''] * (len(header) - len(row)))
-        return header, rows
 
-    # --- Transaction History format (IB "Transaction History" export, not Activity Statement) ---
-    # Rows look like: Transaction History,Data,Date,Account,Description,Transaction Type,Symbol,...
-    try:
-        tx_header, tx_rows = _ibkr_reader('Transaction History')
-
-        if tx_header and tx_rows:
-            tx_df = pd.DataFrame(tx_rows, columns=tx_header)
-
-            action_map = {
-                'Dividend':              'Dividend',
-                'Buy':                   'Buy',
-                'Sell':                  'Sell',
-                'Payment in Lieu':       'Dividend',   # pago sustituto de dividendo (securities lending)
-                # Retención de impuesto — monto con signo (negativo=cargo, positivo=reverso).
-                # Se mantiene 'Dividend' en el nombre para que siga neteando dentro de
-                # dividends_collected_cash (is_div_payout matchea por 'dividend' en Action,
-                # ver línea ~1150), pero ahora conserva 'Foreign Tax Withholding' como rastro
-                # explícito para que withheld_tax_total() / *_by_year() / observed_tax_refund_by_year()
-                # (que buscan 'foreign tax'/'withholding' en Action) puedan detectarla — antes se
-                # perdía al fundirse en 'Dividend' puro y withheld_tax_total() reportaba $0 para IB.
-                'Foreign Tax Withholding': 'Dividend - Foreign Tax Withholding',
-            }
-            tx_type_col = next((c for c in tx_df.columns if 'transaction type' in c.lower() or 'tipo' in c.lower()), None)
-            if tx_type_col:
-                tx_df = tx_df[tx_df[tx_type_col].isin(action_map)].copy()
-            else:
-                tx_type_col = 'Transaction Type'
-
-            gross_col = next((c for c in tx_df.columns if 'gross' in c.lower()), None)
-            net_col = next((c for c in tx_df.columns if c.lower() == 'net amount' or (c.lower().startswith('net') and 'amount' in c.lower())), None)
-            symbol_col = next((c for c in tx_df.columns if c.lower() in ('symbol', 'símbolo', 'simbolo', 'ticker')), None) or 'Symbol'
-            qty_col = next((c for c in tx_df.columns if 'quantity' in c.lower() or 'cantidad' in c.lower()), None) or 'Quantity'
-            price_col = next((c for c in tx_df.columns if c.lower() == 'price' or c.lower() == 'precio'), None) or 'Price'
-            date_col = next((c for c in tx_df.columns if c.lower() in ('date', 'fecha')), None) or 'Date'
-
-            result_rows = []
-            for _, row in tx_df.iterrows():
-                action = action_map.get(str(row.get(tx_type_col, '')).strip(), '')
-                if not action:
-                    continue
-                qty_raw = str(row.get(qty_col, '-')).strip()
-                price_raw = str(row.get(price_col, '-')).strip()
-                gross_raw = str(row.get(gross_col, '-')).strip() if gross_col else '-'
-                net_raw = str(row.get(net_col, '-')).strip() if net_col else '-'
-                qty = 0.0 if qty_raw in ('-', '') else _safe_float(qty_raw)
-                price = 0.0 if price_raw in ('-', '') else _safe_float(price_raw)
-                amount_raw = (net_raw if net_raw not in ('-', '') else gross_raw) if action.startswith('Dividend') else gross_raw
-                amount = 0.0 if amount_raw in ('-', '') else _safe_float(amount_raw)
-                raw_ticker = str(row.get(symbol_col, '')).strip()
-                # Normalizar sufijos IB: TSLY.OLD → TSLY, XYZ.WS → XYZ, etc.
-                norm_ticker = raw_ticker.split('.')[0] if '.' in raw_ticker and raw_ticker.split('.')[-1].upper() in ('OLD', 'WS', 'WI', 'RT', 'CV') else raw_ticker
-                if not norm_ticker or norm_ticker == '-':
-                    continue
-                result_rows.append({
-                    'Date': str(row.get(date_col, '')).strip(),
-                    'Action': action,
-                    'Ticker': norm_ticker,
-                    'Quantity': qty,
-                    'Price': price,
-                    'Amount': amount,
-                })
-
-            if result_rows:
-                frames.append(pd.DataFrame(result_rows))
-                return pd.concat(frames, ignore_index=True)
-    except Exception as e:
-        print(f"IBKR Transaction History parse error: {e}")
+def _sniff_csv_format(raw_bytes: bytes) -> tuple:
+    """
+    Infiere (encoding, sep) de un CSV genérico mirando solo un prefijo.
 
-    # --- Extract Trades section ---
+    Encoding: BOM de UTF-16 → 'utf-16'; muchos NUL sin BOM → UTF-16 LE/BE; prefijo UTF-8
+    válido → 'utf-8' (pandas quita el BOM UTF-8 solo); si no, 'latin1' — el mismo orden que
+    el bucle de siempre, donde latin1 nunca falla y cp1252/utf-16 no se llegaban a probar.
+    Separador: `csv.Sniffer` sobre la primera línea, lo mismo que hace `sep=None` en el motor
+    python. (None, None) si el prefijo está vacío; sep None si no se pudo inferir.
+    """
+    import csv as _csv
+    head = raw_bytes[:CSV_SNIFF_BYTES]
+    if not head.strip():
+        return None, None
+    if head.startswith((b'\xff\xfe', b'\xfe\xff')):
+        encoding = 'utf-16'
+    elif head.count(b'\x00') > len(head) // 4:
+        encoding = 'utf-16-le' if head[1:2] == b'\x00' else 'utf-16-be'
+    else:
+        try:
+            head.decode('utf-8')
+            encoding = 'utf-8'
+        except UnicodeDecodeError as e:
+            # Un carácter multibyte cortado justo al final del prefijo no cuenta.
+            encoding = 'utf-8' if e.start >= len(head) - 3 and len(raw_bytes) > len(head) else 'latin1'
+    text = head.decode(encoding, errors='ignore').lstrip('\ufeff')
     try:
-        trade_header, trade_rows = _ibkr_reader('Trades')
-
-        if trade_header and trade_rows:
-            trades_df = pd.DataFrame(trade_rows, columns=trade_header)
-            # Filter stocks only
-            if 'Asset Category' in trades_df.columns:
-                trades_df = trades_df[trades_df['Asset Category'].str.lower().str.contains('stock|equity', na=False)]
-
-            # Map columns
-            col_map = {}
-            for col in trades_df.columns:
-                cl = col.lower()
-                if 'date' in cl or 'time' in cl:
-                    col_map[col] = 'Date'
-                elif col.lower() == 'symbol':
-                    col_map[col] = 'Ticker'
-                elif 'quantity' in cl:
-                    col_map[col] = 'Quantity'
-                elif 't. price' in cl or 'trade price' in cl:
-                    col_map[col] = 'Price'
-                elif 'proceeds' in cl:
-                    col_map[col] = 'Amount'
-
-            trades_df = trades_df.rename(columns=col_map)
-
-            # Derive Action from Quantity sign
-            if 'Quantity' in trades_df.columns:
-                trades_df['Quantity_num'] = pd.to_numeric(
-                    trades_df['Quantity'].astype(str).str.replace(',', ''), errors='coerce').fillna(0)
-                trades_df['Action'] = trades_df['Quantity_num'].apply(
-                    lambda q: 'Buy' if q > 0 else 'Sell')
-                trades_df['Quantity'] = trades_df['Quantity_num'].abs()
-                trades_df = trades_df.drop(columns=['Quantity_num'])
-
-            keep = [c for c in ['Date', 'Action', 'Ticker', 'Quantity', 'Price', 'Amount'] if c in trades_df.columns]
-            frames.append(trades_df[keep])
-    except Exception as e:
-        print(f"IBKR trades parse error: {e}")
+        sep = _csv.Sniffer().sniff(text.split('\n', 1)[0]).delimiter
+    except _csv.Error:
+        sep = None
+    return encoding, sep
 
-    # --- Extract Dividends section ---
-    try:
-        div_header, div_rows = _ibkr_reader('Dividends')
-
-        if div_header and div_rows:
-            divs_df = pd.DataFrame(div_rows, columns=div_header)
-
-            # Extract ticker from Description (pattern: "TICKER(CUSIP) Cash Dividend")
-            if 'Description' in divs_df.columns:
-                divs_df['Ticker'] = divs_df['Description'].str.extract(r'^([A-Z]+)', expand=False)
-
-            col_map = {}
-            for col in divs_df.columns:
-                cl = col.lower()
-                if 'date' in cl:
-                    col_map[col] = 'Date'
-                elif 'amount' in cl:
-                    col_map[col] = 'Amount'
-
-            divs_df = divs_df.rename(columns=col_map)
-            divs_df['Action'] = 'Dividend'
-            divs_df['Quantity'] = 0
-            divs_df['Price'] = 0
-
-            keep = [c for c in ['Date', 'Action', 'Ticker', 'Quantity', 'Price', 'Amount'] if c in divs_df.columns]
-            frames.append(divs_df[keep])
-    except Exception as e:
-        print(f"IBKR dividends parse error: {e}")
 
-    if frames:
-        return pd.concat(frames, ignore_index=True)
+def _read_generic_csv(raw_bytes: bytes):
+    """CSV genérico parseado UNA vez con el motor C, a partir de `_sniff_csv_format`.
 
-    # Fallback: return raw first-pass parse
-    return pd.read_csv(io.StringIO(text), engine='python', on_bad_lines='skip')
+    Prueba el separador inferido y, si no da más de una columna, ';' y tab (los de siempre).
+    None si nada funciona: el llamador cae al bucle encoding × separador con el motor python.
+    """
+    encoding, sep = _sniff_csv_format(raw_bytes)
+    if encoding is None:
+        return None
+    for candidate in dict.fromkeys(c for c in (sep, ';', '\t') if c):
+        try:
+            # low_memory=False: tipos inferidos sobre la columna entera (como el motor python),
+            # no por bloques — si no, una columna con texto a mitad queda mitad str, mitad float.
+            df = pd.read_csv(io.BytesIO(raw_bytes), sep=candidate, encoding=encoding,
+                             low_memory=False)
+        except Exception:
+            continue
+        if len(df.columns) > 1:
+            return df
+    return None
 
 
 def load_and_detect_csv(uploaded_file) -> tuple:
@@ -2883,9 +3427,11 @@ def load_and_detect_csv(uploaded_file) -> tuple:
         elif broker == 'ibkr':
             df = parse_ibkr_csv(raw_bytes)
         else:
-            # Generic: try encodings
-            success = False
-            for encoding in ['utf-8', 'latin1', 'cp1252', 'utf-16']:
+            # Generic: sniff once and parse once with the C engine
+            df = _read_generic_csv(raw_bytes)
+            success = df is not None
+            # Fallback (casos exóticos): try encodings × separators as before
+            for encoding in ([] if success else ['utf-8', 'latin1', 'cp1252', 'utf-16']):
                 for sep in [None, ';', '\t']:
                     try:
                         uploaded_file.seek(0)
@@ -2906,6 +3452,196 @@ def load_and_detect_csv(uploaded_file) -> tuple:
     return df, broker
 
 
+XLSX_HEADER_SCAN = 20        # filas de cada hoja donde se busca el encabezado (como normalize_csv)
+XLSX_PROGRESS_ROWS = 5000    # cada cuántas filas se avisa a `progress` al leer un .xlsx
+
+
+def _xlsx_header(head: list):
+    """Índice de la primera fila de `head` que parece encabezado (>= 2 palabras clave)."""
+    for i, row in enumerate(head):
+        if _header_keyword_hits(c for c in row if c is not None) >= 2:
+            return i
+    return None
+
+
+def _xlsx_columns(header: tuple) -> tuple:
+    """(posiciones, nombres) de las columnas a leer: las que `normalize_csv` reconoce
+    (`_COLUMN_ALIASES`) o, si no reconoce ninguna, todas. Nombres como los de `read_excel`
+    ('Unnamed: i' para celdas vacías, '.1', '.2'… para repetidos)."""
+    names = [f'Unnamed: {i}' if c is None else str(c).strip() for i, c in enumerate(header)]
+    keep = [i for i, n in enumerate(names) if n.lower() in _COLUMN_ALIASES] or list(range(len(names)))
+    seen, out = {}, []
+    for i in keep:
+        n = names[i]
+        out.append(n if n not in seen else f'{n}.{seen[n]}')
+        seen[n] = seen.get(n, 0) + 1
+    return keep, out
+
+
+def read_xlsx_transactions(source, progress=None) -> pd.DataFrame:
+    """
+    Lee las transacciones de un .xlsx en streaming (openpyxl `read_only=True`).
+
+    `pd.read_excel` materializa el libro completo (todas las hojas, con estilos) para devolver
+    solo la primera. Aquí las hojas se recorren fila a fila: la de transacciones es la primera
+    con un encabezado — buscado en sus primeras `XLSX_HEADER_SCAN` filas con las palabras
+    clave de `normalize_csv` — y de ella solo se guardan las columnas que `normalize_csv`
+    reconoce, una lista por columna que pandas convierte a su array tipado (float64,
+    datetime64, object) al armar el DataFrame.
+
+    Args:
+        source: bytes, ruta o archivo abierto (p. ej. el UploadedFile de Streamlit).
+        progress: callback opcional `progress(fracción)`, con fracción entre 0 y 1; se llama
+                  cada `XLSX_PROGRESS_ROWS` filas (solo si la hoja declara su tamaño).
+
+    Returns:
+        DataFrame crudo para `normalize_csv`, con el encabezado ya aplicado. Si ninguna hoja
+        tiene encabezado reconocible, la primera hoja con su primera fila como encabezado (lo
+        que devolvía `read_excel`). DataFrame vacío si el libro no se puede abrir.
+    """
+    import openpyxl
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    try:
+        wb = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    except Exception as e:
+        print(f"read_xlsx_transactions error: {e}")
+        return pd.DataFrame()
+
+    try:
+        sheet, start, head, rows = None, 0, [], iter(())
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            head = list(itertools.islice(rows, XLSX_HEADER_SCAN))
+            found = _xlsx_header(head)
+            if found is not None:
+                sheet, start = ws, found
+                break
+        if sheet is None:
+            if not wb.worksheets:
+                return pd.DataFrame()
+            sheet = wb.worksheets[0]
+            rows = sheet.iter_rows(values_only=True)
+            head = list(itertools.islice(rows, XLSX_HEADER_SCAN))
+        if len(head) <= start:
+            return pd.DataFrame()
+
+        keep, names = _xlsx_columns(head[start])
+        width = max(keep) + 1
+        total = sheet.max_row if progress is not None else None
+        cols = [[] for _ in keep]
+        for n, row in enumerate(itertools.chain(head[start + 1:], rows), start + 2):
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            vals = [row[i] for i in keep]
+            if all(v is None for v in vals):
+                continue
+            for col, v in zip(cols, vals):
+                col.append(v)
+            if total and n % XLSX_PROGRESS_ROWS == 0:
+                progress(min(1.0, n / total))
+        if total:
+            progress(1.0)
+        return pd.DataFrame({name: pd.Series(col, dtype=None if col else object)
+                             for name, col in zip(names, cols)})
+    except Exception as e:
+        print(f"read_xlsx_transactions error: {e}")
+        return pd.DataFrame()
+    finally:
+        wb.close()
+
+
+# Identidad de una transacción al fusionar exports que se solapan: misma fecha (día), acción,
+# ticker, cantidad y monto. El precio no entra: es derivable y los brokers lo redondean distinto.
+TXN_MERGE_KEY = ('Date', 'Action', 'Ticker', 'Quantity', 'Amount')
+
+
+def merge_transaction_frames(frames: list) -> tuple:
+    """
+    Fusiona varios exports YA normalizados (`normalize_csv`) en una sola tabla de transacciones.
+
+    Schwab limita cada export a ~3-4 años; quien tiene más historia sube varios archivos que se
+    solapan en los bordes. Una fila se descarta si un archivo ANTERIOR ya trae la misma
+    transacción (`TXN_MERGE_KEY`). Se respeta la multiplicidad: dos compras idénticas el mismo
+    día en un archivo son dos compras reales, así que la n-ésima repetición de una clave dentro
+    de un archivo solo se descarta si otro archivo anterior ya tenía al menos n. Es un
+    `duplicated` sobre (clave, ocurrencia) — una tabla hash, O(n) — no una comparación por pares.
+
+    Args:
+        frames: lista de (nombre, df_normalizado, broker) en el orden de subida.
+
+    Returns:
+        (df_fusionado, reporte). `reporte` = {files: [{name, broker, rows, added, duplicates,
+        first_date, last_date, error}], rows_in, rows_out, duplicates, brokers, broker}.
+        `broker` es el del único broker presente o 'mixto' si hay varios. Un archivo vacío o
+        sin columnas Date/Ticker/Amount queda en el reporte con `error` (y, si faltan
+        columnas, `missing`/`columns`) y no se fusiona.
+    """
+    report = {'files': [], 'rows_in': 0, 'rows_out': 0, 'duplicates': 0,
+              'brokers': [], 'broker': 'generic'}
+    parts = []
+    for name, df, broker in frames:
+        entry = {'name': name, 'broker': broker, 'rows': 0, 'added': 0, 'duplicates': 0,
+                 'first_date': None, 'last_date': None, 'error': None}
+        report['files'].append(entry)
+        if df is None or df.empty:
+            entry['error'] = 'vacío'
+            continue
+        missing = [c for c in ('Date', 'Ticker', 'Amount') if c not in df.columns]
+        if missing:
+            entry['error'] = f"faltan columnas: {', '.join(missing)}"
+            entry['missing'], entry['columns'] = missing, list(df.columns)
+            continue
+        entry['rows'] = len(df)
+        dates = pd.to_datetime(df['Date'], errors='coerce')
+        if dates.notna().any():
+            entry['first_date'] = dates.min().strftime('%Y-%m-%d')
+            entry['last_date'] = dates.max().strftime('%Y-%m-%d')
+        if broker not in report['brokers']:
+            report['brokers'].append(broker)
+        parts.append((entry, df))
+
+    if not parts:
+        return pd.DataFrame(), report
+
+    report['broker'] = report['brokers'][0] if len(report['brokers']) == 1 else 'mixto'
+    report['rows_in'] = sum(e['rows'] for e, _ in parts)
+    if len(parts) == 1:
+        entry, df = parts[0]
+        entry['added'] = len(df)
+        report['rows_out'] = len(df)
+        return df, report
+
+    merged = pd.concat([df for _, df in parts], ignore_index=True)
+    source = np.repeat(np.arange(len(parts)), [len(df) for _, df in parts])
+
+    def _num(col, decimals):
+        if col not in merged.columns:
+            return np.zeros(len(merged))
+        return pd.to_numeric(merged[col], errors='coerce').fillna(0.0).round(decimals).to_numpy()
+
+    key = pd.DataFrame({
+        'Date': pd.to_datetime(merged['Date'], errors='coerce').dt.normalize(),
+        'Action': (merged['Action'].astype(str).str.strip().str.lower()
+                   if 'Action' in merged.columns else ''),
+        'Ticker': merged['Ticker'].astype(str).str.strip().str.upper(),
+        'Quantity': _num('Quantity', 6),
+        'Amount': _num('Amount', 2),
+    })
+    key['_src'] = source
+    key['_occ'] = key.groupby(list(TXN_MERGE_KEY) + ['_src'], dropna=False, sort=False).cumcount()
+    dup = key.duplicated(subset=list(TXN_MERGE_KEY) + ['_occ'], keep='first').to_numpy()
+
+    dup_per_file = np.bincount(source[dup], minlength=len(parts))
+    for i, (entry, df) in enumerate(parts):
+        entry['duplicates'] = int(dup_per_file[i])
+        entry['added'] = len(df) - int(dup_per_file[i])
+    out = merged.loc[~dup].reset_index(drop=True)
+    report['duplicates'] = int(dup.sum())
+    report['rows_out'] = len(out)
+    return out, report
+
+
 # ============================================================
 # v2.0 — TICKER CLASSIFICATION
 # ============================================================
@@ -3751,7 +4487,8 @@ def get_etf_holdings(ticker: str) -> list:
     Falls back gracefully through 3 yfinance paths.
     """
     try:
-        t = yf.Ticker(ticker)
+        import yfinance as yf
+        t = yf.Ticker(ticker, session=get_session())
 
         # Path 1: funds_data.top_holdings (yfinance >= 0.2.37)
         try:
@@ -3945,7 +4682,116 @@ def _cost_incomplete(results: dict, ticker: str) -> bool:
     return assess_ticker_quality(results, ticker)['level'] in ('unreliable', 'reconciled')
 
 
-def _csv_dividends_in_window(history_df, start=None, end=None) -> float:
+# ── Ledger fiscal por fila ────────────────────────────────────────────────────
+# Palabras clave de una fila de impuesto (Schwab 'NRA Tax Adj', IB 'Foreign Tax Withholding').
+_TAX_ROW_PATTERN = 'nra tax|tax adj|withholding|foreign tax|retención|retencion'
+
+FISCAL_LEDGER_COLUMNS = ('date', 'year', 'amount', 'is_dividend', 'is_tax', 'netted',
+                         'withheld', 'refund')
+
+def _build_fiscal_ledger(history_df) -> pd.DataFrame:
+    """Ver `fiscal_ledger`. Las palabras clave se evalúan sobre los Action DISTINTOS."""
+    cols = history_df.columns
+    if 'Action' in cols:
+        codes, uniques = pd.factorize(history_df['Action'].astype(str))
+        low = pd.Series(uniques, dtype=object).str.lower()
+    else:
+        codes, low = np.zeros(len(history_df), dtype=int), pd.Series([''], dtype=object)
+
+    def has(pattern):
+        return low.str.contains(pattern, regex=True, na=False).to_numpy()[codes]
+
+    div_kw = has('dividend')                   # incluye 'dividendo'
+    # 'Reinvest Shares' = compra de acciones con el neto post-impuesto, no un cobro.
+    drip_shares = has('reinvest|reinversión|drip') & has('share|acciones')
+    is_div = div_kw & ~drip_shares
+    is_tax = has(_TAX_ROW_PATTERN)
+    keep = is_div | is_tax
+
+    sub = history_df.loc[keep]
+    if 'Amount' in cols:
+        amount = sub['Amount']
+        amount = (amount.astype(float) if pd.api.types.is_numeric_dtype(amount)
+                  else _clean_money_series(amount))
+        amount = amount.to_numpy(dtype=float)
+    else:
+        amount = np.zeros(len(sub))
+    if 'Date' in cols:
+        date = sub['Date']
+        if not pd.api.types.is_datetime64_any_dtype(date):
+            date = pd.to_datetime(date, errors='coerce', format='mixed')
+        date = date.to_numpy()
+    else:
+        date = np.full(len(sub), np.datetime64('NaT'), dtype='datetime64[ns]')
+
+    is_tax, is_div = is_tax[keep], is_div[keep]
+    ledger = pd.DataFrame({
+        'date': date,
+        'amount': amount,
+        'is_dividend': is_div,
+        'is_tax': is_tax,
+        # Convención IB: la retención es una fila con 'dividend' en el Action.
+        'netted': is_tax & div_kw[keep],
+        'withheld': np.where(is_tax & (amount < 0), -amount, 0.0),
+        # Reembolso observado: fila de impuesto positiva SIN 'dividend' (ver
+        # `observed_tax_refund_by_year` para por qué IB queda fuera).
+        'refund': np.where(is_tax & ~div_kw[keep] & (amount > 0), amount, 0.0),
+    })
+    ledger.insert(1, 'year', ledger['date'].dt.year.astype('Int64'))
+    return ledger
+
+
+def fiscal_ledger(history_df) -> pd.DataFrame:
+    """
+    Ledger fiscal de un historial: una fila por cada fila de dividendo o de impuesto, con la
+    clasificación ya resuelta. Base común de `_csv_dividends_in_window`,
+    `_csv_dividends_by_year`, `_dividend_tax_netted`, `_dividend_events`,
+    `withheld_tax_total(_by_year)`, `withheld_at_payment_by_year` y
+    `observed_tax_refund_by_year`, que pasan a ser filtros y group-bys sobre él.
+
+    Columnas (`FISCAL_LEDGER_COLUMNS`):
+      date         fecha de pago (NaT si falta o no se puede leer).
+      year         año calendario de `date` (Int64, <NA> sin fecha).
+      amount       monto con signo tal cual el CSV (NaN si no se puede leer).
+      is_dividend  cuenta como dividendo declarado: 'dividend'/'dividendo' en el Action,
+                   salvo 'Reinvest Shares'. Con convención IB incluye la retención plegada.
+      is_tax       fila de retención/reembolso (nra tax, tax adj, withholding, foreign tax,
+                   retención).
+      netted       fila de impuesto plegada en el dividendo (convención IB, ver
+                   `_dividend_tax_netted`).
+      withheld     retención al cobro (≥0): −amount de las filas de impuesto negativas.
+      refund       reembolso observado (≥0): filas de impuesto positivas sin 'dividend'.
+
+    No guarda nada: cada llamada lo construye. `analyze_portfolio` lo arma una vez por ticker,
+    se lo pasa a cada helper (`led=`) y lo deja en `results[t]['fiscal_ledger']`; quien parte
+    de un resultado lo toma de ahí (`_result_ledger`). Sin columna Action (o sin filas)
+    devuelve un ledger vacío con las mismas columnas.
+    """
+    if history_df is None or len(history_df) == 0:
+        return _build_fiscal_ledger(pd.DataFrame())
+    return _build_fiscal_ledger(history_df)
+
+
+def _result_ledger(stats):
+    """`(history, fiscal_ledger)` de un resultado de `analyze_portfolio`. El ledger es el que
+    se guardó con el resultado; si falta (resultado armado a mano) se construye."""
+    hist = (stats or {}).get('history')
+    led = (stats or {}).get('fiscal_ledger')
+    if led is None and hist is not None and len(hist):
+        led = fiscal_ledger(hist)
+    return hist, led
+
+
+def _ledger_by_year(rows: pd.DataFrame, col: str) -> dict:
+    """Suma de `col` por año sobre las filas del ledger que tienen año."""
+    rows = rows[rows['year'].notna()]
+    if rows.empty:
+        return {}
+    sums = rows.groupby(rows['year'].astype(int))[col].sum()
+    return {int(y): float(v) for y, v in sums.items()}
+
+
+def _csv_dividends_in_window(history_df, start=None, end=None, led=None) -> float:
     """Suma el dividendo BRUTO declarado en el CSV, opcionalmente restringido a una ventana.
 
     Misma base que el income file del broker (que reporta dividendo bruto, antes de la
@@ -3953,61 +4799,35 @@ def _csv_dividends_in_window(history_df, start=None, end=None) -> float:
     bruto reinvertido) y los dividendos en efectivo ('Qualified/Cash Dividend'). NO suma
     las filas 'Reinvest Shares' (esas son la COMPRA neta de acciones tras impuesto, que
     subestima el bruto) ni las 'NRA Tax Adj'. Los dividendos son dólares, no se ajustan
-    por split.
+    por split. Lee el `fiscal_ledger` del historial.
     """
     if history_df is None or len(history_df) == 0:
         return 0.0
-    df = history_df
-    if 'Date' in df.columns and (start is not None or end is not None):
-        d = pd.to_datetime(df['Date'], errors='coerce')
+    led = fiscal_ledger(history_df) if led is None else led
+    rows = led[led['is_dividend']]
+    if 'Date' in history_df.columns and (start is not None or end is not None):
         if start is not None:
-            df = df[d >= start]
-            d = pd.to_datetime(df['Date'], errors='coerce')
+            rows = rows[rows['date'] >= start]
         if end is not None:
-            df = df[d <= end]
-    total = 0.0
-    for _, row in df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        amount = _clean_money(row.get('Amount', 0))
-        if pd.isna(amount):
-            amount = 0.0
-        is_drip = 'reinvest' in action or 'reinversión' in action or 'drip' in action
-        # 'Reinvest Shares' = compra de acciones (monto neto post-tax) -> omitir.
-        if is_drip and ('share' in action or 'acciones' in action):
-            continue
-        # 'Reinvest Dividend' (bruto) o dividendo en efectivo -> contar.
-        if 'dividend' in action or 'dividendo' in action:
-            total += amount
-    return total
+            rows = rows[rows['date'] <= end]
+    return float(rows['amount'].fillna(0.0).sum())
 
 
-def _csv_dividends_by_year(history_df) -> dict:
+def _csv_dividends_by_year(history_df, led=None) -> dict:
     """Como `_csv_dividends_in_window` pero agrupada por año calendario de la fila (`Date`).
 
     Mismo filtro exacto de filas (ver docstring de `_csv_dividends_in_window`): cuenta
     'Reinvest Dividend'/'Cash Dividend'/'Qualified Dividend' (lo que el CSV declara), omite
     'Reinvest Shares' (compra neta post-impuesto). Base del objeto fiscal único por año.
     """
-    out = {}
     if history_df is None or len(history_df) == 0:
-        return out
-    for _, row in history_df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        amount = _clean_money(row.get('Amount', 0))
-        if pd.isna(amount):
-            amount = 0.0
-        is_drip = 'reinvest' in action or 'reinversión' in action or 'drip' in action
-        if is_drip and ('share' in action or 'acciones' in action):
-            continue
-        if 'dividend' in action or 'dividendo' in action:
-            y = _row_year(row.get('Date'))
-            if y is None:
-                continue
-            out[y] = out.get(y, 0.0) + amount
-    return {y: round(v, 2) for y, v in out.items()}
+        return {}
+    led = fiscal_ledger(history_df) if led is None else led
+    rows = led[led['is_dividend']].assign(amount=lambda d: d['amount'].fillna(0.0))
+    return {y: round(v, 2) for y, v in _ledger_by_year(rows, 'amount').items()}
 
 
-def _dividend_tax_netted(history_df) -> bool:
+def _dividend_tax_netted(history_df, led=None) -> bool:
     """Detecta, POR FILA (no por broker asumido), si la retención NRA de este historial
     viene PLEGADA dentro de las filas de dividendo o registrada APARTE.
 
@@ -4024,16 +4844,11 @@ def _dividend_tax_netted(history_df) -> bool:
     """
     if history_df is None or len(history_df) == 0 or 'Action' not in history_df.columns:
         return False
-    for _, row in history_df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        is_tax = ('nra tax' in action or 'tax adj' in action or 'withholding' in action
-                  or 'foreign tax' in action or 'retención' in action or 'retencion' in action)
-        if is_tax and ('dividend' in action or 'dividendo' in action):
-            return True
-    return False
+    led = fiscal_ledger(history_df) if led is None else led
+    return bool(led['netted'].any())
 
 
-def build_dividend_tax_totals(history_df) -> dict:
+def build_dividend_tax_totals(history_df, led=None) -> dict:
     """Objeto fiscal único de bruto/retención/neto por ticker (regla dura del invariante
     ROC/NRA: nunca reconstruir el bruto sumando hacia atrás si el CSV ya lo entrega).
 
@@ -4055,11 +4870,13 @@ def build_dividend_tax_totals(history_df) -> dict:
       netted: bool, la convención detectada (True = IB-style, False = Schwab-style).
       gross_by_year, net_by_year, withheld_by_year: mismos tres campos, por año calendario.
     """
-    withheld = withheld_tax_total(history_df)
-    withheld_by_year = withheld_tax_total_by_year(history_df)
-    ledger = round(_csv_dividends_in_window(history_df), 2)
-    ledger_by_year = _csv_dividends_by_year(history_df)
-    netted = _dividend_tax_netted(history_df)
+    if led is None and history_df is not None and len(history_df):
+        led = fiscal_ledger(history_df)
+    withheld = withheld_tax_total(history_df, led=led)
+    withheld_by_year = withheld_tax_total_by_year(history_df, led=led)
+    ledger = round(_csv_dividends_in_window(history_df, led=led), 2)
+    ledger_by_year = _csv_dividends_by_year(history_df, led=led)
+    netted = _dividend_tax_netted(history_df, led=led)
     years = set(ledger_by_year) | set(withheld_by_year)
 
     if netted:
@@ -4083,34 +4900,23 @@ def build_dividend_tax_totals(history_df) -> dict:
     }
 
 
-def _dividend_events(history_df) -> 'pd.Series':
+def _dividend_events(history_df, led=None) -> 'pd.Series':
     """Serie de dividendo BRUTO por fecha de pago (un valor por día con dividendo).
 
     Misma base que `_csv_dividends_in_window`: cuenta filas 'dividend'/'dividendo'
     (incluye 'Reinvest Dividend' bruto y dividendo en efectivo) y omite 'Reinvest Shares'
     (compra neta post-impuesto). Índice = fecha normalizada, valor = monto del pago (positivo).
     Sirve para derivar frecuencia, último pago y TTM sin depender del income file del broker.
+    Lee el `fiscal_ledger` del historial.
     """
     if history_df is None or len(history_df) == 0 or 'Date' not in history_df.columns:
         return pd.Series(dtype=float)
-    rows = []
-    for _, row in history_df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        if 'dividend' not in action and 'dividendo' not in action:
-            continue
-        is_drip = 'reinvest' in action or 'reinversión' in action or 'drip' in action
-        if is_drip and ('share' in action or 'acciones' in action):
-            continue
-        amt = _clean_money(row.get('Amount', 0))
-        if pd.isna(amt) or amt == 0:
-            continue
-        rows.append((pd.to_datetime(row.get('Date'), errors='coerce'), abs(float(amt))))
-    if not rows:
-        return pd.Series(dtype=float)
-    df = pd.DataFrame(rows, columns=['Date', 'Amount']).dropna(subset=['Date'])
-    if df.empty:
+    led = fiscal_ledger(history_df) if led is None else led
+    rows = led[led['is_dividend'] & led['amount'].notna() & (led['amount'] != 0)
+               & led['date'].notna()]
+    if rows.empty:
         return pd.Series(dtype=float)
-    df['Date'] = df['Date'].dt.normalize()
+    df = pd.DataFrame({'Date': rows['date'].dt.normalize(), 'Amount': rows['amount'].abs()})
     return df.groupby('Date')['Amount'].sum().sort_index()
 
 
@@ -4151,7 +4957,7 @@ def _simulate_hold_value(price_s, div_s, flow_s):
     return last_val
 
 
-def forward_realized_yield(history_df, market_value, today=None) -> dict:
+def forward_realized_yield(history_df, market_value, today=None, led=None) -> dict:
     """Forward yield (lo que ANUNCIAN) vs realized yield (lo que COBRASTE), ambos sobre el
     valor de mercado actual.
 
@@ -4168,7 +4974,7 @@ def forward_realized_yield(history_df, market_value, today=None) -> dict:
     """
     out = {'forward_yield': None, 'realized_yield': None, 'payments_per_year': None,
            'last_payment': None, 'ttm_income': None, 'stale': False}
-    ev = _dividend_events(history_df)
+    ev = _dividend_events(history_df, led=led)
     if ev.empty or not market_value or market_value <= 0:
         return out
     today = pd.Timestamp.today().normalize() if today is None else pd.Timestamp(today).normalize()
@@ -4311,7 +5117,7 @@ def build_hoja_excel(results, classify_map=None, tax_summaries=None):
         # semanal (un solo pago puede ser atípico). Cae a `last_payment` si no hay historial.
         last_div_avg = s.get('last_payment')
         try:
-            _ev = _dividend_events(hist)
+            _ev = _dividend_events(hist, led=s.get('fiscal_ledger'))
             if _ev is not None and len(_ev):
                 last_div_avg = float(_ev.tail(4).mean())
         except Exception:
@@ -4391,7 +5197,7 @@ def _ppy_from_dates(dates):
     return max(1, round(365 / g)) if g > 0 else None
 
 
-def detect_cadence_change(history_df, window=6):
+def detect_cadence_change(history_df, window=6, led=None):
     """Detecta cambios de frecuencia de pago (p.ej. mensual → semanal) comparando la
     cadencia de la ventana reciente vs la anterior. Devuelve None si no hay pagos
     suficientes, o {recent_ppy, old_ppy, recent_label, old_label, changed, note}.
@@ -4400,7 +5206,7 @@ def detect_cadence_change(history_df, window=6):
     uno mensual de $200. El yield realizado (TTM) es inmune (suma 12m reales); solo el
     forward depende de acertar la frecuencia actual, que la mediana móvil ya resuelve.
     """
-    ev = _dividend_events(history_df)
+    ev = _dividend_events(history_df, led=led)
     dts = list(ev.index)
     if len(dts) < 6:                       # mínimo: dos ventanas de 3 pagos
         return None
@@ -4817,7 +5623,7 @@ def _ticker_roc_fraction(ticker, results=None):
     return 0.0
 
 
-def withheld_tax_total(history_df) -> float:
+def withheld_tax_total(history_df, led=None) -> float:
     """Retención de impuesto NETA REAL registrada en el CSV (retenciones − reembolsos), ≥0.
 
     Schwab deja la retención en filas aparte ('NRA Tax Adj') que sobreviven en el historial;
@@ -4838,21 +5644,12 @@ def withheld_tax_total(history_df) -> float:
     """
     if history_df is None or len(history_df) == 0 or 'Action' not in history_df.columns:
         return 0.0
-    signed = 0.0                       # + reembolsos, − retenciones (tal cual el CSV)
-    for _, row in history_df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        is_tax = ('nra tax' in action or 'tax adj' in action or 'withholding' in action
-                  or 'foreign tax' in action or 'retención' in action or 'retencion' in action)
-        if not is_tax:
-            continue
-        amt = _clean_money(row.get('Amount', 0))
-        if pd.isna(amt):
-            continue
-        signed += float(amt)
+    led = fiscal_ledger(history_df) if led is None else led
+    signed = float(led.loc[led['is_tax'], 'amount'].sum())   # + reembolsos, − retenciones
     return round(max(0.0, -signed), 2)  # retención neta soportada (≥0)
 
 
-def withheld_tax_total_by_year(history_df) -> dict:
+def withheld_tax_total_by_year(history_df, led=None) -> dict:
     """Como `withheld_tax_total` pero agrupada por año calendario de la fila (`Date`).
 
     Netea por signo dentro de cada año (retenciones − reembolsos), acotado a ≥0, igual que
@@ -4864,29 +5661,15 @@ def withheld_tax_total_by_year(history_df) -> dict:
     ESTIMA (`estimate_roc_refund_by_year`), no se lee de aquí: es una recuperación teórica que
     el inversor tendría que reclamar (1040-NR), no un reembolso automático garantizado.
     """
-    out = {}
     if history_df is None or len(history_df) == 0 or 'Action' not in history_df.columns:
-        return out
-    signed = {}                        # por año: + reembolsos, − retenciones (tal cual el CSV)
-    for _, row in history_df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        is_tax = ('nra tax' in action or 'tax adj' in action or 'withholding' in action
-                  or 'foreign tax' in action or 'retención' in action or 'retencion' in action)
-        if not is_tax:
-            continue
-        amt = _clean_money(row.get('Amount', 0))
-        if pd.isna(amt):
-            continue
-        y = _row_year(row.get('Date'))
-        if y is None:
-            continue
-        signed[y] = signed.get(y, 0.0) + float(amt)
-    for y, s in signed.items():
-        out[y] = round(max(0.0, -s), 2)  # retención neta del año (≥0)
-    return out
+        return {}
+    led = fiscal_ledger(history_df) if led is None else led
+    # por año: + reembolsos, − retenciones (tal cual el CSV)
+    signed = _ledger_by_year(led[led['is_tax'] & led['amount'].notna()], 'amount')
+    return {y: round(max(0.0, -v), 2) for y, v in signed.items()}  # retención neta del año (≥0)
 
 
-def withheld_at_payment_by_year(history_df) -> dict:
+def withheld_at_payment_by_year(history_df, led=None) -> dict:
     """Retención AL COBRO por año: solo las filas negativas, SIN netear reembolsos.
 
     Es el complemento de `withheld_tax_total_by_year`, que netea. La diferencia importa por
@@ -4900,26 +5683,14 @@ def withheld_at_payment_by_year(history_df) -> dict:
     Misma detección de filas de impuesto que `withheld_tax_total` — incluidas las de IB, que
     llevan 'dividend' en el Action.
     """
-    out = {}
     if history_df is None or len(history_df) == 0 or 'Action' not in history_df.columns:
-        return out
-    for _, row in history_df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        is_tax = ('nra tax' in action or 'tax adj' in action or 'withholding' in action
-                  or 'foreign tax' in action or 'retención' in action or 'retencion' in action)
-        if not is_tax:
-            continue
-        amt = _clean_money(row.get('Amount', 0))
-        if pd.isna(amt) or float(amt) >= 0:       # solo retenciones (montos negativos)
-            continue
-        y = _row_year(row.get('Date'))
-        if y is None:
-            continue
-        out[y] = round(out.get(y, 0.0) - float(amt), 2)
-    return out
+        return {}
+    led = fiscal_ledger(history_df) if led is None else led
+    by_year = _ledger_by_year(led[led['withheld'] > 0], 'withheld')   # solo montos negativos
+    return {y: round(v, 2) for y, v in by_year.items()}
 
 
-def observed_tax_refund_by_year(history_df) -> dict:
+def observed_tax_refund_by_year(history_df, led=None) -> dict:
     """Reembolsos de retención NRA REALES ya acreditados en el CSV, por año calendario.
 
     Espejo POSITIVO de `withheld_tax_total_by_year`: cuando el bróker reclasifica una
@@ -4939,24 +5710,11 @@ def observed_tax_refund_by_year(history_df) -> dict:
     único (PR B, `estimate_roc_refund`/`build_tax_summary`), no de la capa de ingesta. Con esta
     exclusión el comportamiento para IB es igual al de antes del fix: devuelve {} (pendiente).
     """
-    out = {}
     if history_df is None or len(history_df) == 0 or 'Action' not in history_df.columns:
-        return out
-    for _, row in history_df.iterrows():
-        action = str(row.get('Action', '')).lower()
-        is_tax = ('nra tax' in action or 'tax adj' in action or 'withholding' in action
-                  or 'foreign tax' in action or 'retención' in action or 'retencion' in action)
-        is_tax = is_tax and 'dividend' not in action  # excluye IB (ver docstring)
-        if not is_tax:
-            continue
-        amt = _clean_money(row.get('Amount', 0))
-        if pd.isna(amt) or float(amt) <= 0:      # solo reembolsos (montos positivos)
-            continue
-        y = _row_year(row.get('Date'))
-        if y is None:
-            continue
-        out[y] = round(out.get(y, 0.0) + float(amt), 2)
-    return out
+        return {}
+    led = fiscal_ledger(history_df) if led is None else led
+    by_year = _ledger_by_year(led[led['refund'] > 0], 'refund')   # excluye IB (ver docstring)
+    return {y: round(v, 2) for y, v in by_year.items()}
 
 
 # ============================================================
@@ -4999,6 +5757,61 @@ def _yieldmax_nav_from_underlying(scenario_return, underlying_obs, fund_obs,
     return round(cap(scenario_return) - drag, 2)
 
 
+def _simulate_forward_batch(shares0, price0, fwd_yield_pct, months, monthly_contribution=0.0,
+                            drip=True, tax_rate=0.0, annual_price_growth=0.0,
+                            annual_div_growth=0.0) -> dict:
+    """Simula N activos mes a mes en una sola pasada, sin bucle por mes ni por activo: cada
+    argumento es escalar o arreglo (N,) y el resultado es un dict de
+    matrices (N, months) — 'shares', 'price', 'value', 'annual_income_net', 'cum_div_net',
+    'cum_contrib' — donde la columna j es el fin del mes j+1.
+
+    Precio y dividendo por acción son geométricos (no dependen de las acciones), así que se
+    calculan con potencias. Las acciones siguen s_m = a_m·(s_{m−1} + c/precio), con
+    a_m = 1 + dps/12·(1−tax)/precio si hay DRIP (1 si no): una recurrencia lineal que se
+    resuelve con productos y sumas acumuladas, s_m = P_m·(s_0 + Σ c_j/(precio_j·P_{j−1})).
+    """
+    n = max(np.size(v) for v in (shares0, price0, fwd_yield_pct, monthly_contribution, drip,
+                                 tax_rate, annual_price_growth, annual_div_growth))
+
+    def col(v):
+        return np.broadcast_to(np.asarray(v, dtype=float), (n,))[:, None]
+
+    s0, p0 = col(shares0), col(price0)
+    tax = col(tax_rate)
+    contrib = col(monthly_contribution)
+    drip = np.broadcast_to(np.asarray(drip, dtype=bool), (n,))[:, None]
+    mpg = (1 + col(annual_price_growth) / 100.0) ** (1 / 12.0) - 1
+    mdg = (1 + col(annual_div_growth) / 100.0) ** (1 / 12.0) - 1
+    k = np.arange(months, dtype=float)[None, :]
+
+    # Precio y dps al INICIO de cada mes (antes de crecer), y al final.
+    price_prev = p0 * (1 + mpg) ** k
+    dps_prev = (col(fwd_yield_pct) / 100.0) * p0 * (1 + mdg) ** k
+    price = price_prev * (1 + mpg)
+    dps = dps_prev * (1 + mdg)
+
+    pos = price_prev > 0
+    safe_price = np.where(pos, price_prev, 1.0)
+    c = np.where(pos & (contrib > 0), contrib, 0.0)
+    buy = c / safe_price
+    reinvest = drip & pos
+    a = np.where(reinvest, 1 + dps_prev / 12.0 * (1 - tax) / safe_price, 1.0)
+    growth = np.cumprod(a, axis=1)
+    growth_prev = np.concatenate([np.ones((n, 1)), growth[:, :-1]], axis=1)
+    shares = growth * (s0 + np.cumsum(buy / growth_prev, axis=1))
+    shares_pre = shares / a                      # tras el aporte, antes de reinvertir
+
+    net = shares_pre * (dps_prev / 12.0) * (1 - tax)
+    cum_div_net = np.cumsum(net, axis=1)
+    cash = np.cumsum(np.where(reinvest, 0.0, net), axis=1)
+    value = shares * price + np.where(drip, 0.0, cash)
+    return {
+        'shares': shares, 'price': price, 'value': value,
+        'annual_income_net': shares * dps * (1 - tax),
+        'cum_div_net': cum_div_net, 'cum_contrib': np.cumsum(c, axis=1),
+    }
+
+
 def _simulate_forward(shares0, price0, fwd_yield_pct, months, monthly_contribution=0.0,
                       drip=True, tax_rate=0.0, annual_price_growth=0.0, annual_div_growth=0.0):
     """Simula un ticker mes a mes. Devuelve lista de tuplas mensuales
@@ -5008,44 +5821,122 @@ def _simulate_forward(shares0, price0, fwd_yield_pct, months, monthly_contributi
     fwd_yield_pct/100 × price0. El precio evoluciona a `annual_price_growth` y el dividendo
     por acción a `annual_div_growth` (en el modelo de erosión ambos van juntos: el yield se
     mantiene fijo sobre un NAV que cae). `value` incluye el efectivo acumulado si DRIP está off.
+    Es la vista de un solo activo de `_simulate_forward_batch`.
     """
-    dps_annual = (fwd_yield_pct / 100.0) * price0
-    mpg = (1 + annual_price_growth / 100.0) ** (1 / 12.0) - 1
-    mdg = (1 + annual_div_growth / 100.0) ** (1 / 12.0) - 1
-    shares, price, cash = float(shares0), float(price0), 0.0
-    cum_div_net, cum_contrib = 0.0, 0.0
-    monthly = []
-    for m in range(1, months + 1):
-        if monthly_contribution > 0 and price > 0:
-            shares += monthly_contribution / price
-            cum_contrib += monthly_contribution
-        gross = shares * (dps_annual / 12.0)
-        net = gross * (1 - tax_rate)
-        cum_div_net += net
-        if drip and price > 0:
-            shares += net / price
+    sim = _simulate_forward_batch(shares0, price0, fwd_yield_pct, months, monthly_contribution,
+                                  drip, tax_rate, annual_price_growth, annual_div_growth)
+    cols = [sim[k][0].tolist() for k in ('shares', 'price', 'value', 'annual_income_net',
+                                         'cum_div_net', 'cum_contrib')]
+    return [(m, *vals) for m, vals in enumerate(zip(*cols), start=1)]
+
+
+def _yearly_from_monthly(sim) -> list:
+    """Resume la simulación mensual (`_simulate_forward_batch`) a filas anuales por activo
+    (snapshot de fin de cada año): un reshape (N, años, 12) que toma el mes 12 de cada año.
+    Devuelve una lista por activo de filas {'year', 'shares', …}."""
+    n, months = sim['shares'].shape
+    n_years = months // 12
+
+    def year_end(key, nd=2):
+        return np.round(sim[key][:, :n_years * 12].reshape(n, n_years, 12)[:, :, -1], nd).tolist()
+
+    shares, price, value = year_end('shares', 4), year_end('price'), year_end('value')
+    inc, cdiv, ccon = year_end('annual_income_net'), year_end('cum_div_net'), year_end('cum_contrib')
+    return [[{'year': y + 1, 'shares': shares[i][y], 'price': price[i][y],
+              'portfolio_value': value[i][y], 'annual_income': inc[i][y],
+              'cumulative_dividends': cdiv[i][y], 'cumulative_contributions': ccon[i][y]}
+             for y in range(n_years)]
+            for i in range(n)]
+
+
+def _projection_assets(results, classify_map=None) -> list:
+    """Invariantes por activo de la proyección: lo que NO depende de los supuestos del usuario
+    (horizonte, aporte, DRIP, país, escenario). Elegibilidad (yield forward, acciones y precio
+    > 0), clasificación YieldMax, fracción ROC para el escudo fiscal y volatilidad acotada.
+    Se calcula una vez y lo comparten `project_portfolio_forward`, `monte_carlo_projection`
+    y `sweep_projection`, así un barrido de supuestos no repite la lectura de 19a por ticker.
+    """
+    classify_map = classify_map or classify_tickers(list(results.keys()))
+    instruments = load_instruments()
+    assets = []
+    for tk, s in results.items():
+        if not isinstance(s, dict) or 'error' in s:
+            continue
+        fwd = s.get('forward_yield') or 0
+        shares0 = s.get('shares_owned') or 0
+        price0 = s.get('current_price') or 0
+        if fwd <= 0 or shares0 <= 0 or price0 <= 0:
+            continue
+        info = instruments.get(str(tk).upper(), {})
+        is_ym = classify_map.get(tk) == 'mode_a' or (info.get('type') or '').lower() == 'yieldmax'
+        # Vol anualizada (%); acotada a [5, 100]: algunos tickers traen vol corrupta
+        # (p.ej. SCHB/XLK con miles de %), que sin tope haría explotar el Monte Carlo.
+        vol = s.get('volatilidad_anualizada')
+        try:
+            vol = min(max(5.0, float(vol)), 100.0) if vol is not None else 30.0
+        except (TypeError, ValueError):
+            vol = 30.0
+        assets.append({'tk': tk, 's': s, 'shares0': shares0, 'price0': price0, 'fwd': fwd,
+                       'is_ym': is_ym, 'vol': vol, 'roc_frac': _ticker_roc_fraction(tk, results)})
+    return assets
+
+
+def _projection_tax(asset, p) -> tuple:
+    """(tasa en fracción, tasa efectiva %) de un activo. Si hay país, tasa efectiva = país ×
+    (1 − ROC); si no, la plana `tax_rate_pct`."""
+    country = p.get('country')
+    if country:
+        _base, _ = NRA_COUNTRY_RATES.get(country, (NRA_DEFAULT_RATE, False))
+        eff_rate = round(_base * (1 - asset['roc_frac'] / 100.0), 2)
+        return max(0.0, min(1.0, eff_rate / 100.0)), eff_rate
+    tax = max(0.0, min(1.0, float(p['tax_rate_pct']) / 100.0))
+    return tax, round(tax * 100, 2)
+
+
+def _projection_growth(asset, p) -> tuple:
+    """(crecimiento anual del precio %, del dividendo %, ventana del decaimiento) de un activo
+    bajo los supuestos `p` — la rama YieldMax/ETF de `project_portfolio_forward`."""
+    if not asset['is_ym']:
+        return p['price_appreciation_pct'], p['dividend_growth_pct'], None
+    s, tk = asset['s'], asset['tk']
+    _scen = (p.get('underlying_scenarios') or {}).get(tk)
+    _scen_nav = None
+    if _scen is not None:
+        # Escenario del subyacente: deriva el NAV del fondo vía captura asimétrica.
+        _scen_nav = _yieldmax_nav_from_underlying(
+            float(_scen), s.get('underlying_cagr_recent'), s.get('price_cagr_recent'),
+            p['upside_capture'], p['downside_capture'])
+    if _scen_nav is not None:
+        decay = _scen_nav            # puede ser positivo: el escenario lo permite a propósito
+        decay_window = 'escenario'
+    else:
+        decay = p.get('nav_decay_overrides', {}).get(tk)
+        if decay is None:
+            # Preferir el decaimiento de los últimos 12 meses (régimen actual) sobre el de
+            # toda la vida del fondo: no extrapola una caída vieja como si fuera eterna.
+            obs = s.get('price_cagr_recent')
+            decay_window = '12m'
+            if obs is None:
+                obs = s.get('price_cagr'); decay_window = 'vida'
+            decay = min(obs, 0.0) if obs is not None else p['yieldmax_decay_fallback_pct']
+            if obs is None:
+                decay_window = 'default'
         else:
-            cash += net
-        price *= (1 + mpg)
-        dps_annual *= (1 + mdg)
-        annual_income_net = shares * dps_annual * (1 - tax_rate)
-        value = shares * price + (0.0 if drip else cash)
-        monthly.append((m, shares, price, value, annual_income_net, cum_div_net, cum_contrib))
-    return monthly
+            decay_window = 'manual'
+    return decay, decay, decay_window  # yield fijo sobre NAV que cae
 
 
-def _yearly_from_monthly(monthly):
-    """Resume la simulación mensual a filas anuales (snapshot de fin de cada año)."""
-    rows = []
-    for (m, shares, price, value, ann_inc, cum_div, cum_contrib) in monthly:
-        if m % 12 == 0:
-            rows.append({
-                'year': m // 12, 'shares': round(shares, 4), 'price': round(price, 2),
-                'portfolio_value': round(value, 2), 'annual_income': round(ann_inc, 2),
-                'cumulative_dividends': round(cum_div, 2),
-                'cumulative_contributions': round(cum_contrib, 2),
-            })
-    return rows
+def _portfolio_yearly(sim, n_assets) -> np.ndarray:
+    """Consolidado anual de uno o varios portafolios apilados en `sim` (bloques contiguos de
+    `n_assets` filas): reshape (portafolios, activos, años, 12) → fin de año → suma entre
+    activos de las cifras ya redondeadas (la misma suma que la tabla por activo). Devuelve
+    (portafolios, años, 4) con valor, ingreso anual, dividendos y aportes acumulados."""
+    rows, months = sim['value'].shape
+    n_years = months // 12
+    cols = [np.round(sim[k][:, :n_years * 12].reshape(rows // n_assets, n_assets, n_years, 12)
+                     [..., -1], 2)
+            for k in ('value', 'annual_income_net', 'cum_div_net', 'cum_contrib')]
+    return np.stack(cols, axis=-1).sum(axis=1)
 
 
 def project_portfolio_forward(results, params=None, classify_map=None) -> dict:
@@ -5068,146 +5959,99 @@ def project_portfolio_forward(results, params=None, classify_map=None) -> dict:
     if params:
         p.update({k: v for k, v in params.items() if v is not None})
     months = max(1, int(round(float(p['horizon_years']) * 12)))
-    tax = max(0.0, min(1.0, float(p['tax_rate_pct']) / 100.0))
-    country = p.get('country')   # si se da, la retención es por país × escudo ROC (por ticker)
     contrib = max(0.0, float(p['monthly_contribution']))
     drip = bool(p['drip'])
-    classify_map = classify_map or classify_tickers(list(results.keys()))
-    instruments = load_instruments()
     roc19a = load_roc_19a()
 
-    per_ticker, eligible = {}, []
-    n_eligible = sum(1 for t, s in results.items()
-                     if isinstance(s, dict) and 'error' not in s and (s.get('forward_yield') or 0) > 0
-                     and (s.get('shares_owned') or 0) > 0 and (s.get('current_price') or 0) > 0)
-    contrib_each = contrib / n_eligible if n_eligible > 0 else 0.0  # reparte el aporte mensual
-
-    for tk, s in results.items():
-        if not isinstance(s, dict) or 'error' in s:
-            continue
-        fwd = s.get('forward_yield') or 0
-        shares0 = s.get('shares_owned') or 0
-        price0 = s.get('current_price') or 0
-        if fwd <= 0 or shares0 <= 0 or price0 <= 0:
-            continue
-        eligible.append(tk)
-
-        info = instruments.get(str(tk).upper(), {})
-        is_ym = classify_map.get(tk) == 'mode_a' or (info.get('type') or '').lower() == 'yieldmax'
-
-        # Retención por ticker: si hay país, tasa efectiva = país × (1 − ROC); si no, la plana.
-        if country:
-            _base, _ = NRA_COUNTRY_RATES.get(country, (NRA_DEFAULT_RATE, False))
-            _roc_frac = _ticker_roc_fraction(tk, results)
-            tk_eff_rate = round(_base * (1 - _roc_frac / 100.0), 2)
-            tk_tax = max(0.0, min(1.0, tk_eff_rate / 100.0))
-        else:
-            tk_tax = tax
-            tk_eff_rate = round(tax * 100, 2)
-
-        decay_window = None
-        if is_ym:
-            _scen = (p.get('underlying_scenarios') or {}).get(tk)
-            _scen_nav = None
-            if _scen is not None:
-                # Escenario del subyacente: deriva el NAV del fondo vía captura asimétrica.
-                _scen_nav = _yieldmax_nav_from_underlying(
-                    float(_scen), s.get('underlying_cagr_recent'), s.get('price_cagr_recent'),
-                    p['upside_capture'], p['downside_capture'])
-            if _scen_nav is not None:
-                decay = _scen_nav            # puede ser positivo: el escenario lo permite a propósito
-                decay_window = 'escenario'
-            else:
-                decay = p.get('nav_decay_overrides', {}).get(tk)
-                if decay is None:
-                    # Preferir el decaimiento de los últimos 12 meses (régimen actual) sobre el de
-                    # toda la vida del fondo: no extrapola una caída vieja como si fuera eterna.
-                    obs = s.get('price_cagr_recent')
-                    decay_window = '12m'
-                    if obs is None:
-                        obs = s.get('price_cagr'); decay_window = 'vida'
-                    decay = min(obs, 0.0) if obs is not None else p['yieldmax_decay_fallback_pct']
-                    if obs is None:
-                        decay_window = 'default'
-                else:
-                    decay_window = 'manual'
-            price_growth, div_growth = decay, decay  # yield fijo sobre NAV que cae
-        else:
-            price_growth = p['price_appreciation_pct']
-            div_growth = p['dividend_growth_pct']
-
-        monthly = _simulate_forward(
-            shares0, price0, fwd, months, monthly_contribution=contrib_each, drip=drip,
-            tax_rate=tk_tax, annual_price_growth=price_growth, annual_div_growth=div_growth)
-        monthly_nodrip = _simulate_forward(
-            shares0, price0, fwd, months, monthly_contribution=contrib_each, drip=False,
-            tax_rate=tk_tax, annual_price_growth=price_growth, annual_div_growth=div_growth)
-
-        end_val_drip = monthly[-1][3]
-        end_val_nodrip = monthly_nodrip[-1][3]
-        entry = {
-            'is_yieldmax': is_ym,
-            'forward_yield': fwd,
-            'realized_yield': s.get('realized_yield'),
-            'price_growth_pct': round(price_growth, 2),
-            'div_growth_pct': round(div_growth, 2),
-            'yearly': _yearly_from_monthly(monthly),
-            'end_value': round(end_val_drip, 2),
-            'end_value_nodrip': round(end_val_nodrip, 2),
-            'drip_advantage': round(end_val_drip - end_val_nodrip, 2),
-            'cumulative_dividends_net': round(monthly[-1][5], 2),
-            'start_value': round(shares0 * price0, 2),
-            'cadence_change': s.get('cadence_change'),
-            'tax_effective_rate': tk_eff_rate,
-        }
-
-        if is_ym:
+    per_ticker = {}
+    assets = _projection_assets(results, classify_map)
+    eligible = [a['tk'] for a in assets]
+    contrib_each = contrib / len(assets) if assets else 0.0  # reparte el aporte mensual
+    for a in assets:
+        a['tax'], a['eff_rate'] = _projection_tax(a, p)
+        a['price_growth'], a['div_growth'], a['decay_window'] = _projection_growth(a, p)
+
+    if assets:
+        # Todos los activos en una sola pasada: matrices (activos × meses), sin bucle por mes.
+        arr = {k: np.array([a[k] for a in assets], dtype=float)
+               for k in ('shares0', 'price0', 'fwd', 'tax', 'price_growth', 'div_growth')}
+        common = dict(tax_rate=arr['tax'], annual_price_growth=arr['price_growth'],
+                      annual_div_growth=arr['div_growth'])
+        sim = _simulate_forward_batch(arr['shares0'], arr['price0'], arr['fwd'], months,
+                                      monthly_contribution=contrib_each, drip=drip, **common)
+        sim_nodrip = (_simulate_forward_batch(arr['shares0'], arr['price0'], arr['fwd'], months,
+                                              monthly_contribution=contrib_each, drip=False, **common)
+                      if drip else sim)
+        yearly = _yearly_from_monthly(sim)
+        end_drip = sim['value'][:, -1].tolist()
+        end_nodrip = sim_nodrip['value'][:, -1].tolist()
+        cum_div_end = sim['cum_div_net'][:, -1].tolist()
+
+        ym_idx = [i for i, a in enumerate(assets) if a['is_ym']]
+        race = None
+        if ym_idx:
             # Carrera ingreso vs erosión: buy-and-hold, distribuciones en cash, sin aportes.
-            race = _simulate_forward(shares0, price0, fwd, months, monthly_contribution=0.0,
-                                     drip=False, tax_rate=tk_tax,
-                                     annual_price_growth=price_growth, annual_div_growth=div_growth)
-            start_principal = shares0 * price0
-            breakeven_m, race_rows = None, []
-            for (m, sh, pr, val, ann, cum_div, _c) in race:
-                capital_loss = start_principal - sh * pr  # sh es constante (sin DRIP/aporte)
-                if breakeven_m is None and cum_div >= capital_loss:
-                    breakeven_m = m
-                race_rows.append({'month': m, 'cum_income_net': round(cum_div, 2),
-                                  'capital_loss': round(capital_loss, 2),
-                                  'principal_value': round(sh * pr, 2)})
-            end_income = race[-1][5]
-            end_principal = race[-1][1] * race[-1][2]
-            honest_tr = ((end_income + end_principal - start_principal) / start_principal * 100
-                         if start_principal > 0 else None)
-            wpct = roc19a.get(str(tk).upper(), {}).get('weighted_pct')
-            entry.update({
-                'breakeven_month': breakeven_m,
-                'race': race_rows,
-                'total_income_net': round(end_income, 2),
-                'ending_principal': round(end_principal, 2),
-                'honest_total_return_pct': round(honest_tr, 1) if honest_tr is not None else None,
-                'roc_fraction_pct': round(float(wpct), 1) if wpct is not None else s.get('roc_percent'),
-                'decay_window': decay_window,
-            })
-        per_ticker[tk] = entry
+            race = _simulate_forward_batch(
+                arr['shares0'][ym_idx], arr['price0'][ym_idx], arr['fwd'][ym_idx], months,
+                monthly_contribution=0.0, drip=False, tax_rate=arr['tax'][ym_idx],
+                annual_price_growth=arr['price_growth'][ym_idx],
+                annual_div_growth=arr['div_growth'][ym_idx])
+            principal = race['shares'] * race['price']   # las acciones no cambian (sin DRIP/aporte)
+            start_principal = (arr['shares0'] * arr['price0'])[ym_idx][:, None]
+            capital_loss = start_principal - principal
+            covered = race['cum_div_net'] >= capital_loss
+            breakeven = np.where(covered.any(axis=1), covered.argmax(axis=1) + 1, 0).tolist()
+
+        for i, a in enumerate(assets):
+            tk, s, shares0, price0 = a['tk'], a['s'], a['shares0'], a['price0']
+            entry = {
+                'is_yieldmax': a['is_ym'],
+                'forward_yield': a['fwd'],
+                'realized_yield': s.get('realized_yield'),
+                'price_growth_pct': round(a['price_growth'], 2),
+                'div_growth_pct': round(a['div_growth'], 2),
+                'yearly': yearly[i],
+                'end_value': round(end_drip[i], 2),
+                'end_value_nodrip': round(end_nodrip[i], 2),
+                'drip_advantage': round(end_drip[i] - end_nodrip[i], 2),
+                'cumulative_dividends_net': round(cum_div_end[i], 2),
+                'start_value': round(shares0 * price0, 2),
+                'cadence_change': s.get('cadence_change'),
+                'tax_effective_rate': a['eff_rate'],
+            }
+            if a['is_ym']:
+                j = ym_idx.index(i)
+                race_rows = [{'month': m, 'cum_income_net': cd, 'capital_loss': cl,
+                              'principal_value': pv}
+                             for m, cd, cl, pv in zip(range(1, months + 1),
+                                                      np.round(race['cum_div_net'][j], 2).tolist(),
+                                                      np.round(capital_loss[j], 2).tolist(),
+                                                      np.round(principal[j], 2).tolist())]
+                start_principal_i = shares0 * price0
+                end_income = float(race['cum_div_net'][j, -1])
+                end_principal = float(principal[j, -1])
+                honest_tr = ((end_income + end_principal - start_principal_i) / start_principal_i * 100
+                             if start_principal_i > 0 else None)
+                wpct = roc19a.get(str(tk).upper(), {}).get('weighted_pct')
+                entry.update({
+                    'breakeven_month': breakeven[j] or None,
+                    'race': race_rows,
+                    'total_income_net': round(end_income, 2),
+                    'ending_principal': round(end_principal, 2),
+                    'honest_total_return_pct': round(honest_tr, 1) if honest_tr is not None else None,
+                    'roc_fraction_pct': round(float(wpct), 1) if wpct is not None else s.get('roc_percent'),
+                    'decay_window': a['decay_window'],
+                })
+            per_ticker[tk] = entry
 
     # ── Consolidado del portafolio: suma por año entre tickers ──
     portfolio = {'yearly': [], 'start_value': 0.0, 'end_value': 0.0,
                  'end_value_nodrip': 0.0, 'drip_advantage': 0.0,
                  'cumulative_dividends_net': 0.0}
     if per_ticker:
-        n_years = max(len(e['yearly']) for e in per_ticker.values())
-        for y in range(1, n_years + 1):
-            v = inc = cdiv = contribs = 0.0
-            for e in per_ticker.values():
-                yr = next((r for r in e['yearly'] if r['year'] == y), None)
-                if yr:
-                    v += yr['portfolio_value']; inc += yr['annual_income']
-                    cdiv += yr['cumulative_dividends']; contribs += yr['cumulative_contributions']
-            portfolio['yearly'].append({
-                'year': y, 'portfolio_value': round(v, 2), 'annual_income': round(inc, 2),
-                'cumulative_dividends': round(cdiv, 2), 'cumulative_contributions': round(contribs, 2),
-            })
+        cols = ('portfolio_value', 'annual_income', 'cumulative_dividends', 'cumulative_contributions')
+        portfolio['yearly'] = [{'year': y + 1, **{c: round(v, 2) for c, v in zip(cols, row)}}
+                               for y, row in enumerate(_portfolio_yearly(sim, len(assets))[0].tolist())]
         portfolio['start_value'] = round(sum(e['start_value'] for e in per_ticker.values()), 2)
         portfolio['end_value'] = round(sum(e['end_value'] for e in per_ticker.values()), 2)
         portfolio['end_value_nodrip'] = round(sum(e['end_value_nodrip'] for e in per_ticker.values()), 2)
@@ -5228,44 +6072,210 @@ def project_portfolio_forward(results, params=None, classify_map=None) -> dict:
             'params': {**p, 'months': months}, 'eligible': eligible}
 
 
-def _mc_simulate_path(asset, n_years, contrib_each, drip, rng, div_growth_base):
-    """Un camino Monte Carlo de un activo: sortea un retorno anual NUEVO cada año (riesgo de
-    secuencia) ~ Normal(media, vol) y compone mes a mes. Devuelve (valores_por_año[],
-    ingreso_anual_final).
+def sweep_projection(results, grid, params=None, classify_map=None) -> pd.DataFrame:
+    """Evalúa de una vez una rejilla de supuestos de `project_portfolio_forward` para que la UI
+    tenga listos los vecinos del escenario actual (otro horizonte, otro aporte, DRIP sí/no,
+    otro país, otro escenario del subyacente) sin recalcular al mover un control.
+
+    `grid` = {parámetro: [valores]} con cualquier clave de `PROJ_DEFAULTS` más `country`; se
+    evalúa el producto cartesiano sobre `params`. La clave especial `scenario` recibe
+    {etiqueta: underlying_scenarios} y la columna del resultado lleva la etiqueta.
+
+    Los invariantes por activo (`_projection_assets`) se calculan una sola vez y la tasa y el
+    crecimiento se memorizan por país/escenario. Todas las combinaciones van en UNA llamada a
+    `_simulate_forward_batch`; como la simulación es causal, las que solo difieren en
+    horizonte comparten filas y se recortan a su horizonte.
+
+    Devuelve un DataFrame ordenado (una fila por combinación × año) con las columnas de la
+    rejilla, 'year', las cifras anuales del consolidado ('portfolio_value', 'annual_income',
+    'cumulative_dividends', 'cumulative_contributions') y las de fin de horizonte repetidas
+    por combinación ('end_value', 'end_value_nodrip', 'drip_advantage',
+    'cumulative_dividends_net', 'income_goal_year') — las mismas cifras que
+    `project_portfolio_forward(results, {**params, **combinación})['portfolio']`.
+    """
+    base = dict(PROJ_DEFAULTS)
+    if params:
+        base.update({k: v for k, v in params.items() if v is not None})
+    grid = dict(grid or {})
+    scenarios = grid.pop('scenario', None)
+    axes = {k: (list(v) if isinstance(v, (list, tuple)) else [v]) for k, v in grid.items()}
+    if scenarios is not None:
+        axes['scenario'] = list(scenarios)
+    keys = list(axes)
+    value_cols = ['portfolio_value', 'annual_income', 'cumulative_dividends',
+                  'cumulative_contributions']
+    end_cols = ['end_value', 'end_value_nodrip', 'drip_advantage', 'cumulative_dividends_net',
+                'income_goal_year']
+    empty = pd.DataFrame(columns=keys + ['year'] + value_cols + end_cols)
+
+    assets = _projection_assets(results, classify_map)
+    if not assets:
+        return empty
+
+    combos = []
+    for values in itertools.product(*(axes[k] for k in keys)):
+        combo = dict(zip(keys, values))
+        p = dict(base)
+        p.update({k: v for k, v in combo.items() if k != 'scenario' and v is not None})
+        if 'country' in combo:
+            p['country'] = combo['country']
+        if 'scenario' in combo:
+            p['underlying_scenarios'] = scenarios[combo['scenario']]
+        p['months'] = max(1, int(round(float(p['horizon_years']) * 12)))
+        combos.append((combo, p))
+
+    # Memo de supuestos por activo: la tasa solo depende del país/tasa plana y el crecimiento
+    # de los supuestos de crecimiento/escenario — no del horizonte, el aporte ni el DRIP.
+    tax_memo, growth_memo = {}, {}
+    growth_keys = ('price_appreciation_pct', 'dividend_growth_pct', 'yieldmax_decay_fallback_pct',
+                   'upside_capture', 'downside_capture')
+
+    def tax_for(p):
+        key = (p.get('country'), p['tax_rate_pct'])
+        if key not in tax_memo:
+            tax_memo[key] = [_projection_tax(a, p)[0] for a in assets]
+        return tax_memo[key]
+
+    def growth_for(p):
+        key = (repr(p.get('underlying_scenarios')), repr(p.get('nav_decay_overrides')),
+               *(p[k] for k in growth_keys))
+        if key not in growth_memo:
+            growth_memo[key] = [_projection_growth(a, p)[:2] for a in assets]
+        return growth_memo[key]
+
+    # Un bloque de filas (activos) por combinación distinta salvo el horizonte.
+    blocks, block_keys, block_idx = [], [], []
+    for _, p in combos:
+        sim_key = repr(sorted((k, v) for k, v in p.items() if k not in ('horizon_years', 'months')))
+        if sim_key not in block_keys:
+            block_keys.append(sim_key)
+            blocks.append(p)
+        block_idx.append(block_keys.index(sim_key))
+
+    n_assets, n_blocks = len(assets), len(blocks)
+    months = max(p['months'] for _, p in combos)
+    tax, growth, contrib, drip = [], [], [], []
+    for p in blocks:
+        tax += tax_for(p)
+        growth += growth_for(p)
+        contrib += [max(0.0, float(p['monthly_contribution'])) / n_assets] * n_assets
+        drip += [bool(p['drip'])] * n_assets
+    shares0 = np.tile([a['shares0'] for a in assets], 2 * n_blocks)
+    price0 = np.tile([a['price0'] for a in assets], 2 * n_blocks)
+    fwd = np.tile([a['fwd'] for a in assets], 2 * n_blocks)
+    growth = np.array(growth * 2, dtype=float).reshape(-1, 2)
+    # Primero los bloques con su DRIP, luego los mismos en efectivo (para la ventaja del DRIP).
+    sim = _simulate_forward_batch(
+        shares0, price0, fwd, months, monthly_contribution=np.array(contrib * 2),
+        drip=np.array(drip + [False] * len(drip)), tax_rate=np.array(tax * 2),
+        annual_price_growth=growth[:, 0], annual_div_growth=growth[:, 1])
+    yearly = _portfolio_yearly(sim, n_assets)[:n_blocks]
+
+    rows = []
+    for (combo, p), b in zip(combos, block_idx):
+        m = p['months']
+        rows_d = slice(b * n_assets, (b + 1) * n_assets)
+        rows_c = slice((n_blocks + b) * n_assets, (n_blocks + b + 1) * n_assets)
+        end_value = round(float(np.round(sim['value'][rows_d, m - 1], 2).sum()), 2)
+        end_nodrip = round(float(np.round(sim['value'][rows_c, m - 1], 2).sum()), 2)
+        cum_div = round(float(np.round(sim['cum_div_net'][rows_d, m - 1], 2).sum()), 2)
+        years = np.round(yearly[b, :m // 12], 2).tolist()
+        goal = p.get('income_goal_monthly')
+        goal_year = None
+        if goal and float(goal) > 0:
+            goal_year = next((y + 1 for y, r in enumerate(years) if r[1] / 12.0 >= float(goal)), None)
+        ends = [end_value, end_nodrip, round(end_value - end_nodrip, 2), cum_div, goal_year]
+        for y, r in enumerate(years):
+            rows.append([combo[k] for k in keys] + [y + 1] + r + ends)
+    if not rows:
+        return empty
+    return pd.DataFrame(rows, columns=empty.columns)
+
+
+def _mc_simulate_batch(assets, z, contrib_each, drip, div_growth_base):
+    """Todos los caminos Monte Carlo de todos los activos a la vez. `z` son normales estándar
+    (caminos, activos, años): el retorno anual de cada año es media + vol·z, un valor NUEVO
+    por año (riesgo de secuencia), y se compone mes a mes. `contrib_each` es escalar o un
+    arreglo (K,) de aportes mensuales por activo a evaluar con los MISMOS sorteos (números
+    aleatorios comunes). Devuelve (valor, ingreso_anual) del portafolio por año, cada uno
+    de forma (K, caminos, años).
 
     Modelo de YIELD-SOBRE-PRECIO: el dividendo se calcula como `yield × precio` cada mes, así
     que si el precio cae, el dividendo cae proporcional (realista) y el DRIP nunca explota
     (la compra de acciones queda atada al yield, no a un dividendo nominal fijo / precio→0).
     YieldMax: yield constante sobre el NAV que cae. ETF: el yield-on-price crece con `div_growth`.
     """
-    shares = float(asset['shares0']); price = float(asset['price0'])
-    yld = (asset['fwd'] or 0) / 100.0        # yield anual sobre el precio actual
-    tax = asset['tax']
-    cash = 0.0
-    yearly = []
-    for _y in range(n_years):
-        g = float(rng.normal(asset['mean'], asset['vol']))
-        if asset.get('ym_clamp', asset['is_ym']):
-            g = min(g, 0.0)                       # guardarraíl: YieldMax nunca aprecia (salvo escenario)
-        g = max(min(g, 150.0), -99.0)             # acota el año a [-99%, +150%]
-        mpg = (1 + g / 100.0) ** (1 / 12.0) - 1
-        # ETF: el yield-on-price crece con el dividendo. YieldMax: yield fijo sobre NAV.
-        # NOTA: se mantiene a propósito el modelo yield-on-price (dividendo atado al precio):
-        # desacoplar el dps del precio para igualar al determinista reintroduce la explosión
-        # del DRIP cuando el precio→0 bajo volatilidad corrupta (ver test_monte_carlo_corrupt_vol).
-        myg = 0.0 if asset['is_ym'] else ((1 + max(min(div_growth_base, 150.0), -99.0) / 100.0) ** (1 / 12.0) - 1)
+    def per_asset(key):
+        return np.array([a[key] for a in assets], dtype=float)
+
+    n_paths, _, n_years = z.shape
+    contrib = np.atleast_1d(np.asarray(contrib_each, dtype=float))[:, None, None]
+    g = per_asset('mean')[None, :, None] + per_asset('vol')[None, :, None] * z
+    clamp = np.array([a.get('ym_clamp', a['is_ym']) for a in assets])[None, :, None]
+    g = np.where(clamp, np.minimum(g, 0.0), g)   # guardarraíl: YieldMax nunca aprecia (salvo escenario)
+    g = np.clip(g, -99.0, 150.0)                 # acota el año a [-99%, +150%]
+    mpg = (1 + g / 100.0) ** (1 / 12.0) - 1
+    # ETF: el yield-on-price crece con el dividendo. YieldMax: yield fijo sobre NAV.
+    # NOTA: se mantiene a propósito el modelo yield-on-price (dividendo atado al precio):
+    # desacoplar el dps del precio para igualar al determinista reintroduce la explosión
+    # del DRIP cuando el precio→0 bajo volatilidad corrupta (ver test_monte_carlo_corrupt_vol).
+    myg_etf = (1 + max(min(div_growth_base, 150.0), -99.0) / 100.0) ** (1 / 12.0) - 1
+    myg = np.where([a['is_ym'] for a in assets], 0.0, myg_etf)
+    tax = per_asset('tax')
+
+    shape = (len(contrib), n_paths, len(assets))
+    shares = np.broadcast_to(per_asset('shares0'), shape).copy()
+    price = np.broadcast_to(per_asset('price0'), shape).copy()
+    cash = np.zeros(shape)
+    yld = per_asset('fwd') / 100.0               # yield anual sobre el precio actual
+    year_values = np.zeros((len(contrib), n_paths, n_years))
+    year_income = np.zeros((len(contrib), n_paths, n_years))
+    any_contrib = bool((contrib > 0).any())
+    for y in range(n_years):
+        growth = 1 + mpg[None, :, :, y]
         for _m in range(12):
-            if contrib_each > 0 and price > 0:
-                shares += contrib_each / price
+            if any_contrib:
+                shares += contrib / price
             net = shares * (yld / 12.0) * price * (1 - tax)   # dividendo del mes (atado al precio)
-            if drip and price > 0:
+            if drip:
                 shares += net / price                          # = shares × yld/12 × (1−tax): acotado
             else:
                 cash += net
-            price = max(price * (1 + mpg), 1e-9)
-            yld *= (1 + myg)
-        yearly.append(shares * price + (0.0 if drip else cash))
-    return yearly, shares * yld * price * (1 - tax)
+            price = np.maximum(price * growth, 1e-9)
+            yld = yld * (1 + myg)
+        year_values[..., y] = (shares * price + (0.0 if drip else cash)).sum(axis=-1)
+        year_income[..., y] = (shares * yld * price * (1 - tax)).sum(axis=-1)
+    return year_values, year_income
+
+
+def _mc_assumptions(asset, p) -> dict:
+    """Media del retorno anual, guardarraíl YieldMax y tasa de retención de un activo para el
+    Monte Carlo. A diferencia del determinista, la media YieldMax ignora los overrides
+    manuales y la tasa por país no se redondea."""
+    s, tk = asset['s'], asset['tk']
+    ym_clamp = asset['is_ym']   # YieldMax normalmente no aprecia; un escenario alcista lo desactiva
+    if asset['is_ym']:
+        _scen = (p.get('underlying_scenarios') or {}).get(tk)
+        _scen_nav = (_yieldmax_nav_from_underlying(
+            float(_scen), s.get('underlying_cagr_recent'), s.get('price_cagr_recent'),
+            p['upside_capture'], p['downside_capture']) if _scen is not None else None)
+        if _scen_nav is not None:
+            mean_growth = _scen_nav      # media centrada en el escenario del subyacente
+            ym_clamp = False             # permitir caminos positivos si el escenario es alcista
+        else:
+            obs = s.get('price_cagr_recent')
+            if obs is None:
+                obs = s.get('price_cagr')
+            mean_growth = min(obs, 0.0) if obs is not None else p['yieldmax_decay_fallback_pct']
+    else:
+        mean_growth = p['price_appreciation_pct']
+    country = p.get('country')
+    if country:
+        _base, _ = NRA_COUNTRY_RATES.get(country, (NRA_DEFAULT_RATE, False))
+        tk_tax = max(0.0, min(1.0, _base * (1 - asset['roc_frac'] / 100.0) / 100.0))
+    else:
+        tk_tax = max(0.0, min(1.0, float(p['tax_rate_pct']) / 100.0))
+    return {'mean': mean_growth, 'ym_clamp': ym_clamp, 'tax': tk_tax}
 
 
 def monte_carlo_projection(results, params=None, classify_map=None, n_paths=500, seed=None) -> dict:
@@ -5281,73 +6291,22 @@ def monte_carlo_projection(results, params=None, classify_map=None, n_paths=500,
     if params:
         p.update({k: v for k, v in params.items() if v is not None})
     n_years = max(1, int(round(float(p['horizon_years']))))
-    tax = max(0.0, min(1.0, float(p['tax_rate_pct']) / 100.0))
-    country = p.get('country')
     contrib = max(0.0, float(p['monthly_contribution']))
     drip = bool(p['drip'])
     inflation = float(p.get('inflation_pct', 3.0) or 0.0)
     real_view = bool(p.get('real_view', False))
     goal = p.get('income_goal_monthly')
-    classify_map = classify_map or classify_tickers(list(results.keys()))
-    instruments = load_instruments()
     rng = np.random.default_rng(seed)
 
-    assets = []
-    for tk, s in results.items():
-        if not isinstance(s, dict) or 'error' in s:
-            continue
-        fwd = s.get('forward_yield') or 0
-        shares0 = s.get('shares_owned') or 0
-        price0 = s.get('current_price') or 0
-        if fwd <= 0 or shares0 <= 0 or price0 <= 0:
-            continue
-        info = instruments.get(str(tk).upper(), {})
-        is_ym = classify_map.get(tk) == 'mode_a' or (info.get('type') or '').lower() == 'yieldmax'
-        ym_clamp = is_ym   # YieldMax normalmente no aprecia; un escenario alcista lo desactiva
-        if is_ym:
-            _scen = (p.get('underlying_scenarios') or {}).get(tk)
-            _scen_nav = (_yieldmax_nav_from_underlying(
-                float(_scen), s.get('underlying_cagr_recent'), s.get('price_cagr_recent'),
-                p['upside_capture'], p['downside_capture']) if _scen is not None else None)
-            if _scen_nav is not None:
-                mean_growth = _scen_nav      # media centrada en el escenario del subyacente
-                ym_clamp = False             # permitir caminos positivos si el escenario es alcista
-            else:
-                obs = s.get('price_cagr_recent')
-                if obs is None:
-                    obs = s.get('price_cagr')
-                mean_growth = min(obs, 0.0) if obs is not None else p['yieldmax_decay_fallback_pct']
-        else:
-            mean_growth = p['price_appreciation_pct']
-        # Vol anualizada (%); acotada a [5, 100]: algunos tickers traen vol corrupta
-        # (p.ej. SCHB/XLK con miles de %), que sin tope haría explotar el Monte Carlo.
-        vol = s.get('volatilidad_anualizada')
-        try:
-            vol = min(max(5.0, float(vol)), 100.0) if vol is not None else 30.0
-        except (TypeError, ValueError):
-            vol = 30.0
-        if country:
-            _base, _ = NRA_COUNTRY_RATES.get(country, (NRA_DEFAULT_RATE, False))
-            tk_tax = max(0.0, min(1.0, _base * (1 - _ticker_roc_fraction(tk, results) / 100.0) / 100.0))
-        else:
-            tk_tax = tax
-        assets.append({'tk': tk, 'shares0': shares0, 'price0': price0, 'fwd': fwd,
-                       'mean': mean_growth, 'vol': vol, 'is_ym': is_ym, 'ym_clamp': ym_clamp,
-                       'tax': tk_tax})
-
+    assets = [{**a, **_mc_assumptions(a, p)} for a in _projection_assets(results, classify_map)]
     if not assets:
         return {'bands': [], 'final': {}, 'prob_goal': None, 'n_paths': 0,
                 'real_view': real_view, 'params': {**p, 'n_years': n_years}}
 
-    contrib_each = contrib / len(assets)
-    div_growth_base = p['dividend_growth_pct']
-    year_values = np.zeros((n_paths, n_years))
-    final_income = np.zeros(n_paths)
-    for i in range(n_paths):
-        for a in assets:
-            yvals, fi = _mc_simulate_path(a, n_years, contrib_each, drip, rng, div_growth_base)
-            year_values[i, :] += np.array(yvals)
-            final_income[i] += fi
+    z = rng.standard_normal((n_paths, len(assets), n_years))
+    year_values, year_income = _mc_simulate_batch(assets, z, contrib / len(assets), drip,
+                                                  p['dividend_growth_pct'])
+    year_values, final_income = year_values[0], year_income[0, :, -1]
 
     # Deflactar a términos reales si se pide (poder de compra de hoy).
     if real_view and inflation != 0:
@@ -5374,6 +6333,98 @@ def monte_carlo_projection(results, params=None, classify_map=None, n_paths=500,
             'real_view': real_view, 'params': {**p, 'n_years': n_years}}
 
 
+GOAL_SOLVER_BATCH = 16              # candidatos evaluados por cada pasada del Monte Carlo
+GOAL_SOLVER_MAX_CONTRIB = 1_000_000.0  # techo del aporte mensual buscado ($/mes)
+
+
+def solve_income_goal(results, params=None, classify_map=None, solve_for='contribution',
+                      target_prob_pct=50.0, n_paths=500, seed=None, max_horizon_years=30,
+                      tol=1.0) -> dict:
+    """Resuelve la meta de ingreso del Monte Carlo al revés: en vez de reportar `prob_goal` para
+    el aporte que el usuario tecleó, busca el MENOR aporte mensual (`solve_for='contribution'`,
+    con el horizonte de `params`) o el MENOR horizonte en años (`solve_for='horizon'`, con el
+    aporte de `params`, hasta `max_horizon_years`) con el que la probabilidad de cobrar
+    `income_goal_monthly` llega a `target_prob_pct`.
+
+    Usa números aleatorios comunes: los sorteos se hacen UNA vez (mismo `seed` → mismos
+    caminos que `monte_carlo_projection` con ese horizonte) y cada candidato se evalúa sobre
+    ellos, así la probabilidad es monótona en el aporte y la búsqueda no se confunde con ruido.
+    El aporte se acota con una rejilla geométrica y luego se bisecta con `GOAL_SOLVER_BATCH`
+    candidatos por pasada vectorizada hasta `tol` dólares; el horizonte sale de una sola
+    pasada al horizonte máximo, leyendo la probabilidad al cierre de cada año.
+
+    Devuelve {solve_for, value (aporte $/mes o años; None si no se alcanza), reachable,
+    prob_goal (en `value`, o la mejor alcanzable), target_prob_pct, income_goal_monthly,
+    evaluations (pasadas del Monte Carlo), n_paths} y, para el horizonte, `prob_by_year`.
+    Cualquier otro `solve_for` es un error (ValueError), no un aporte por omisión.
+    """
+    if solve_for not in ('contribution', 'horizon'):
+        raise ValueError(f"solve_for debe ser 'contribution' o 'horizon', no {solve_for!r}")
+    p = dict(PROJ_DEFAULTS)
+    if params:
+        p.update({k: v for k, v in params.items() if v is not None})
+    goal = float(p.get('income_goal_monthly') or 0.0)
+    target = float(target_prob_pct)
+    out = {'solve_for': solve_for, 'value': None, 'reachable': False, 'prob_goal': None,
+           'target_prob_pct': target, 'income_goal_monthly': goal or None, 'evaluations': 0,
+           'n_paths': n_paths}
+    assets = [{**a, **_mc_assumptions(a, p)} for a in _projection_assets(results, classify_map)]
+    if not assets or goal <= 0:
+        return out
+
+    drip = bool(p['drip'])
+    inflation = float(p.get('inflation_pct', 3.0) or 0.0)
+    real_view = bool(p.get('real_view', False)) and inflation != 0
+    if solve_for == 'horizon':
+        n_years = max(1, int(max_horizon_years))
+    else:
+        n_years = max(1, int(round(float(p['horizon_years']))))
+    z = np.random.default_rng(seed).standard_normal((n_paths, len(assets), n_years))
+
+    def prob_by_year(contribs):
+        out['evaluations'] += 1
+        _, income = _mc_simulate_batch(assets, z, np.asarray(contribs, dtype=float) / len(assets),
+                                       drip, p['dividend_growth_pct'])
+        if real_view:
+            income = income / (1 + inflation / 100.0) ** np.arange(1, n_years + 1)
+        return np.mean(income / 12.0 >= goal, axis=1) * 100   # (candidatos, años)
+
+    if solve_for == 'horizon':
+        probs = prob_by_year([max(0.0, float(p['monthly_contribution']))])[0]
+        hit = np.flatnonzero(probs >= target)
+        out['prob_by_year'] = [{'year': y + 1, 'prob_goal': round(float(v), 1)}
+                               for y, v in enumerate(probs)]
+        if hit.size:
+            out.update(value=int(hit[0]) + 1, reachable=True,
+                       prob_goal=round(float(probs[hit[0]]), 1))
+        else:
+            out['prob_goal'] = round(float(probs.max()), 1)
+        return out
+
+    # Aporte: rejilla geométrica para acotar, luego bisección con K candidatos por pasada.
+    cands = np.concatenate([[0.0], np.geomspace(max(tol, 1.0), GOAL_SOLVER_MAX_CONTRIB,
+                                                GOAL_SOLVER_BATCH - 1)])
+    probs = prob_by_year(cands)[:, -1]
+    ok = np.flatnonzero(probs >= target)
+    if not ok.size:
+        out['prob_goal'] = round(float(probs[-1]), 1)
+        return out
+    if ok[0] == 0:
+        out.update(value=0.0, reachable=True, prob_goal=round(float(probs[0]), 1))
+        return out
+    lo, hi, hi_prob = cands[ok[0] - 1], cands[ok[0]], probs[ok[0]]
+    while hi - lo > tol:
+        cands = np.linspace(lo, hi, GOAL_SOLVER_BATCH + 2)[1:-1]
+        probs = prob_by_year(cands)[:, -1]
+        ok = np.flatnonzero(probs >= target)
+        if ok.size:
+            lo, hi, hi_prob = (cands[ok[0] - 1] if ok[0] > 0 else lo), cands[ok[0]], probs[ok[0]]
+        else:
+            lo = cands[-1]
+    out.update(value=round(float(hi), 2), reachable=True, prob_goal=round(float(hi_prob), 1))
+    return out
+
+
 def reconcile_income(results: dict, income_summary: dict) -> dict:
     """Cruza el ingreso por dividendos del CSV (cash+drip) contra el income file del
     broker, por ventana solapada. Es PURAMENTE INFORMATIVO: no muta `results` ni
@@ -5412,7 +6463,8 @@ def reconcile_income(results: dict, income_summary: dict) -> dict:
 
         # Dividendo BRUTO del CSV (misma base que el income file). Se reconstruye desde el
         # historial, NO desde dividends_collected_drip (que es neto post-NRA-tax).
-        csv_total = _csv_dividends_in_window(s.get('history'))
+        hist, led = _result_ledger(s)
+        csv_total = _csv_dividends_in_window(hist, led=led)
         hist_inc = bool(s.get('history_incomplete'))
 
         # Ticker en el CSV sin ingreso 'Received' en el income (fuera de ventana / solo Estimated).
@@ -5428,7 +6480,7 @@ def reconcile_income(results: dict, income_summary: dict) -> dict:
         win = i.get('received_window')
         if win and win[0] is not None and win[1] is not None:
             buf = pd.Timedelta(days=INCOME_WINDOW_BUFFER_DAYS)
-            csv_in_window = _csv_dividends_in_window(s.get('history'), win[0] - buf, win[1] + buf)
+            csv_in_window = _csv_dividends_in_window(hist, win[0] - buf, win[1] + buf, led=led)
         else:
             csv_in_window = csv_total
 
@@ -5520,13 +6572,14 @@ def project_income(income_df, results: dict = None) -> dict:
         schwab_recv_12m = float(rec[rec['Date'] >= yr_ago]['Amount'].sum())
         our_recv_12m = None
         if results and isinstance(results.get(tk), dict):
-            our_recv_12m = round(_csv_dividends_in_window(results[tk].get('history'), yr_ago, today), 2)
+            r_hist, r_led = _result_ledger(results[tk])
+            our_recv_12m = round(_csv_dividends_in_window(r_hist, yr_ago, today, led=r_led), 2)
 
         # Total histórico: Schwab (todas las filas Received) y nuestro (todo el CSV, sin ventana).
         schwab_recv_total = float(rec['Amount'].sum())
         our_recv_total = None
         if results and isinstance(results.get(tk), dict):
-            our_recv_total = round(_csv_dividends_in_window(results[tk].get('history')), 2)
+            our_recv_total = round(_csv_dividends_in_window(r_hist, led=r_led), 2)
 
         # Caída: promedio por pago del tercio reciente vs el más antiguo dentro de 12m.
         last_yr = rec[rec['Date'] >= yr_ago]
@@ -5885,7 +6938,7 @@ def simulate_triple_comparison(buy_flows_json: str) -> dict:
 
         for key, (sticker, label) in strategies.items():
             try:
-                mdata, _ = fetch_market_data(sticker, earliest)
+                mdata, _err, _fuente = fetch_market_data(sticker, earliest)
                 if mdata.empty:
                     continue
 
@@ -5943,13 +6996,16 @@ def build_yieldmax_total_return_series(tickers: list, start: str = None) -> pd.D
     normalizados a base 100 en la primera fecha común de la serie.
     Retorna long-format: Fecha, Ticker, Valor. Ignora tickers que fallen la descarga.
     """
+    import yfinance as yf
     frames = []
     for tk in tickers:
         try:
             if start:
-                raw = yf.download(tk, start=start, auto_adjust=True, progress=False)
+                raw = yf.download(tk, start=start, auto_adjust=True, progress=False,
+                                  session=get_session())
             else:
-                raw = yf.download(tk, period="max", auto_adjust=True, progress=False)
+                raw = yf.download(tk, period="max", auto_adjust=True, progress=False,
+                                  session=get_session())
             if raw is None or raw.empty:
                 continue
             if isinstance(raw.columns, pd.MultiIndex):
@@ -6000,15 +7056,15 @@ def applied_withholding_rate(stats: dict) -> dict:
     Devuelve {'applied_pct', 'gross', 'withheld_at_payment', 'by_year', 'years'} o
     `applied_pct=None` cuando no hay bruto suficiente para dividir.
     """
-    hist = (stats or {}).get('history')
+    hist, led = _result_ledger(stats)
     gross_by_year = (stats or {}).get('dividends_gross_by_year') or {}
     gross_total = (stats or {}).get('dividends_gross_total')
 
-    wh_by_year = withheld_at_payment_by_year(hist)
+    wh_by_year = withheld_at_payment_by_year(hist, led=led)
     wh_total = round(sum(wh_by_year.values()), 2)
 
     if gross_total is None:
-        totals = build_dividend_tax_totals(hist)
+        totals = build_dividend_tax_totals(hist, led=led)
         gross_total = totals.get('gross')
         gross_by_year = gross_by_year or totals.get('gross_by_year') or {}
 
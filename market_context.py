@@ -10,6 +10,8 @@ from datetime import date, datetime
 import os
 import sys
 
+import http_pool
+
 VAULT    = "/Users/danielzambrano/Desktop/Habilidades de agentes/Obsidian"
 OUT_PATH = f"{VAULT}/APPs/Dividend-Analyzer/contexto-mercado.md"
 
@@ -23,7 +25,7 @@ GROUPS = {
 
 def fetch(symbol: str) -> dict:
     try:
-        hist = yf.Ticker(symbol).history(period="max")
+        hist = yf.Ticker(symbol, session=http_pool.session()).history(period="max")
         if hist.empty:
             return {"error": "sin datos"}
 
@@ -194,6 +194,23 @@ def load_splits(ticker: str,
         raise
 
 
+def cached_history(ticker: str) -> Optional[pd.DataFrame]:
+    """Historia cacheada de `ticker` con la forma de `logic.fetch_market_data` (['Close',
+    'Dividends', 'Stock Splits']), SIN mirar su edad ni ir a la red; None si no esta en el
+    cache. Es para quien ya sabe que la red no responde (el circuito de Yahoo abierto, ver
+    `http_pool`) y declara por su cuenta que sirvio datos guardados."""
+    ticker = ticker.upper()
+    hist = _read_cached_history(ticker)
+    if hist is None:
+        return None
+    hist["Stock Splits"] = 0.0
+    splits = _read_cached_splits(ticker)
+    if splits is not None and not splits.empty:
+        hist.loc[hist.index.isin(splits.index), "Stock Splits"] = (
+            splits.reindex(hist.index[hist.index.isin(splits.index)]).to_numpy())
+    return hist
+
+
 def cache_coverage() -> dict:
     """`{ticker: {generated_at, start, end, rows}}` tal cual esta en `_meta.yaml` — para que
     la UI de la Fase 3.3 pueda mostrar 'datos al DD/MM' sin tener que leer el yaml a mano."""
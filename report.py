@@ -1,11 +1,16 @@
-from fpdf import FPDF
+import hashlib
+import json
+import os
 from datetime import date
 
+from fpdf import FPDF
+
 
 BROKER_LABELS = {
     "schwab": "Charles Schwab",
     "ibkr": "Interactive Brokers",
     "generic": "Formato Genérico",
+    "mixto": "Varios brokers",        # carga de varios archivos (ui/carga.py)
 }
 
 _BLUE  = (0,   68, 151)
@@ -194,6 +199,53 @@ class _PDF(FPDF):
         self.ln(2)
 
 
+# Lo único que `generate_report_pdf` lee de cada resultado. `report_fingerprint` hashea solo
+# esto —no el historial ni las series diarias—: si nada de aquí cambió, el PDF tampoco.
+_REPORT_FIELDS = (
+    "skipped", "error", "ticker_mode", "pocket_investment", "market_value",
+    "dividends_net_total", "dividends_collected_cash", "dividends_collected_drip",
+    "total_dividends", "irr_anual", "cagr", "yield_on_cost", "shares_bought", "shares_sold",
+    "shares_owned", "current_price", "splits_detected", "price_discrepancies",
+    "monthly_income",
+)
+
+# El código que arma el PDF entra también en la huella: `stale_guard` recarga solo `report`
+# al editarlo, y los bytes del diseño anterior seguían en `result_cache` hasta el cambio de
+# fecha. Se relee solo si cambió la fecha o el tamaño del archivo.
+_RUTA_CODIGO = os.path.abspath(__file__)
+_codigo_memo: dict = {"firma": None, "valor": ""}
+
+
+def _huella_codigo() -> str:
+    try:
+        st_ = os.stat(_RUTA_CODIGO)
+    except OSError:
+        return ""
+    firma = (_RUTA_CODIGO, st_.st_mtime_ns, st_.st_size)
+    if firma != _codigo_memo["firma"]:
+        with open(_RUTA_CODIGO, "rb") as fh:
+            _codigo_memo.update(firma=firma, valor=hashlib.sha256(fh.read()).hexdigest()[:16])
+    return _codigo_memo["valor"]
+
+
+def report_fingerprint(results: dict, broker: str, version: str = "2.0") -> str:
+    """Huella de lo que mostraría `generate_report_pdf(results, broker, version)`: los campos
+    de `_REPORT_FIELDS`, el bróker, la versión, la fecha (el reporte la imprime) y el código
+    de este módulo (`_huella_codigo`)."""
+    h = hashlib.sha256()
+    h.update(json.dumps([broker, version, date.today().isoformat(), _huella_codigo()]).encode())
+    for ticker in sorted(results, key=str):
+        s = results[ticker] or {}
+        fila = {}
+        for campo in _REPORT_FIELDS:
+            v = s.get(campo)
+            if hasattr(v, "items") and not isinstance(v, dict):      # Series
+                v = [[str(k), float(x)] for k, x in v.items()]
+            fila[campo] = v
+        h.update(json.dumps([str(ticker), fila], sort_keys=True, default=str).encode())
+    return h.hexdigest()[:32]
+
+
 def generate_report_pdf(results: dict, broker: str, version: str = "2.0") -> bytes:
     valid = {
         t: s for t, s in results.items()
@@ -0,0 +1,277 @@
+"""Caché de resultados del proceso, con tope de memoria y derrame opcional a disco.
+
+Cada sesión de Streamlit guardaba sus objetos pesados (`_vd_resultados`, los datos de
+Comparación y Método, la serie de estrategias) directamente en `st.session_state`, sin
+ningún tope común: con muchas sesiones abiertas la memoria del contenedor crecía hasta que
+el sistema lo mataba. Aquí esos objetos viven en UN caché por proceso con presupuesto en
+bytes, y la sesión solo guarda el handle (la clave) con el que los pide.
+
+- Tamaño: cada entrada se mide al guardarla; DataFrame/Series con
+  `memory_usage(deep=True)`, contenedores recorriéndolos, y un mismo objeto referenciado
+  dos veces (p. ej. `history` y el argumento de un campo perezoso) cuenta una sola vez.
+  Los campos perezosos de `logic.TickerResult` que se calculen después no se vuelven a
+  medir.
+- Desalojo: LRU. Al pasar el presupuesto (RESULT_CACHE_MB, 256 MB por defecto) salen las
+  entradas de uso más antiguo; la recién guardada se queda aunque sola lo exceda.
+- Derrame: si el operador define RESULT_CACHE_SPILL_DIR (o
+  st.secrets['result_cache']['spill_dir']), lo desalojado se escribe allí con pickle y
+  vuelve a memoria al pedirlo. Está APAGADO por defecto por la misma razón que
+  `snapshot_store`: PRIVACY.md promete que sin consentimiento todo queda en memoria. Sin
+  derrame, un handle desalojado simplemente falla y quien lo pidió recalcula.
+- Métricas: `stats()` → bytes actuales, entradas, aciertos, fallos, desalojos, derrames y
+  aciertos desde disco.
+
+Las claves compartibles (mismo contenido ⇒ mismo resultado, como el caso de estudio fijo
+de Método o el análisis de un mismo archivo) hacen que dos sesiones compartan el objeto en
+vez de duplicarlo; lo que depende de la sesión usa `new_key()`. Quien recibe un objeto del
+caché no debe mutarlo.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import logic
+
+DEFAULT_BUDGET_MB = 256
+DEFAULT_SPILL_MB = 2048
+
+_cache_override = None
+_default_cache = None
+
+
+def _secrets():
+    try:
+        import streamlit as st
+        return st.secrets
+    except Exception:
+        return {}
+
+
+def _conf(name: str, env: str):
+    v = os.getenv(env)
+    if v:
+        return v
+    try:
+        return _secrets().get('result_cache', {}).get(name)
+    except Exception:
+        return None
+
+
+def _mb(name: str, env: str, default: float) -> int:
+    try:
+        return int(float(_conf(name, env) or default) * 1024 * 1024)
+    except (TypeError, ValueError):
+        return int(default * 1024 * 1024)
+
+
+# ── Tamaño ───────────────────────────────────────────────────────────────────
+
+def sizeof(obj, _seen: set = None) -> int:
+    """Bytes aproximados de `obj` en memoria, contando cada objeto una sola vez."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        # `dict.items` y no `obj.items()`: medir no debe calcular campos perezosos.
+        for k, v in dict.items(obj):
+            size += sizeof(k, seen) + sizeof(v, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += sizeof(v, seen)
+    elif isinstance(obj, logic.LazyField):
+        size += sizeof(obj.args, seen)
+    return size
+
+
+# ── Caché ────────────────────────────────────────────────────────────────────
+
+class ResultCache:
+    """LRU con presupuesto en bytes y derrame opcional a `spill_dir`."""
+
+    def __init__(self, budget_bytes: int, spill_dir: str = None,
+                 spill_budget_bytes: int = DEFAULT_SPILL_MB * 1024 * 1024):
+        self.budget = int(budget_bytes)
+        self.spill_dir = spill_dir
+        self.spill_budget = int(spill_budget_bytes)
+        self._mem = OrderedDict()         # clave → (valor, bytes)
+        self._disk = OrderedDict()        # clave → bytes en disco
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._inflight = {}               # clave → Lock de quien la está produciendo
+        self._counts = dict(hits=0, misses=0, evictions=0, spills=0, spill_hits=0)
+
+    def put(self, key: str, value) -> str:
+        """Guarda `value` bajo `key` y devuelve el handle (la misma clave)."""
+        size = sizeof(value)
+        with self._lock:
+            self._drop(key)
+            self._mem[key] = (value, size)
+            self._bytes += size
+            self._evict()
+        return key
+
+    def get(self, key, default=None):
+        """El valor del handle `key`, o `default` si ya no está (ni en memoria ni en disco)."""
+        if key is None:
+            return default
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                self._mem.move_to_end(key)
+                self._counts['hits'] += 1
+                return hit[0]
+            value = self._unspill(key)
+            if value is None:
+                self._counts['misses'] += 1
+                return default
+            self._counts['spill_hits'] += 1
+        self.put(key, value)
+        return value
+
+    def get_or_put(self, key: str, produce):
+        """`get(key)`; si falta, `produce()` y se guarda (salvo que devuelva None).
+
+        Una sola producción por clave a la vez: las sesiones que llegan mientras otra la
+        calcula esperan su resultado en vez de repetir el trabajo.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            flight = self._inflight.setdefault(key, threading.Lock())
+        try:
+            with flight:
+                value = self.get(key)
+                if value is None:
+                    value = produce()
+                    if value is not None:
+                        self.put(key, value)
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts, bytes=self._bytes, entries=len(self._mem),
+                        budget=self.budget, spilled=len(self._disk),
+                        spill_bytes=sum(self._disk.values()))
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._disk):
+                self._remove_spill(key)
+            self._mem.clear()
+            self._bytes = 0
+
+    # ── interno ──
+
+    def _drop(self, key):
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._remove_spill(key)
+
+    def _evict(self):
+        while self._bytes > self.budget and len(self._mem) > 1:
+            key, (value, size) = self._mem.popitem(last=False)
+            self._bytes -= size
+            self._counts['evictions'] += 1
+            self._spill(key, value)
+
+    def _path(self, key) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha256(key.encode()).hexdigest()[:32] + '.pkl')
+
+    def _spill(self, key, value):
+        if not self.spill_dir:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            path = self._path(key)
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+            self._disk[key] = os.path.getsize(path)
+            self._counts['spills'] += 1
+            while sum(self._disk.values()) > self.spill_budget and len(self._disk) > 1:
+                self._remove_spill(next(iter(self._disk)))
+        except Exception as e:
+            print(f"result_cache spill error: {e}")
+
+    def _unspill(self, key):
+        if key not in self._disk:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                value = pickle.load(f)
+        except Exception as e:
+            print(f"result_cache unspill error: {e}")
+            value = None
+        self._remove_spill(key)
+        return value
+
+    def _remove_spill(self, key):
+        if self._disk.pop(key, None) is None:
+            return
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+def set_cache(c) -> None:
+    """Fija el caché (o None para volver al configurado por entorno/secrets)."""
+    global _cache_override
+    _cache_override = c
+
+
+def cache() -> ResultCache:
+    """El caché del proceso, creado la primera vez con la configuración vigente."""
+    global _default_cache
+    if _cache_override is not None:
+        return _cache_override
+    if _default_cache is None:
+        _default_cache = ResultCache(
+            _mb('budget_mb', 'RESULT_CACHE_MB', DEFAULT_BUDGET_MB),
+            spill_dir=_conf('spill_dir', 'RESULT_CACHE_SPILL_DIR'),
+            spill_budget_bytes=_mb('spill_mb', 'RESULT_CACHE_SPILL_MB', DEFAULT_SPILL_MB))
+    return _default_cache
+
+
+def new_key(prefix: str) -> str:
+    """Clave única, para lo que no se debe compartir entre sesiones."""
+    return f"{prefix}:{uuid.uuid4().hex}"
+
+
+def put(key: str, value) -> str:
+    return cache().put(key, value)
+
+
+def get(key, default=None):
+    return cache().get(key, default)
+
+
+def get_or_put(key: str, produce):
+    return cache().get_or_put(key, produce)
+
+
+def stats() -> dict:
+    return cache().stats()
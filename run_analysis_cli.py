@@ -8,7 +8,7 @@ file_path = "../Copy of TSLY, NVDY, MSTY.xlsx"
 
 print(f"Loading {file_path}...")
 try:
-    df = pd.read_excel(file_path)
+    df = logic.read_xlsx_transactions(file_path)
     print("Columns found:", df.columns.tolist())
     
     # Normalize
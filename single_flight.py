@@ -0,0 +1,90 @@
+"""Una sola descarga en vuelo por clave, compartida por todos los hilos del proceso.
+
+Streamlit corre cada sesión en su propio hilo, y `analyze_portfolio` se cachea por
+portafolio, no por ticker: cuando varios usuarios suben a la vez carteras con los mismos
+tickers populares (MSTY, TSLY, SCHD, VOO), cada sesión bajaba de yfinance la misma serie
+por su cuenta. `SingleFlight.do(clave, fn)` hace que las llamadas concurrentes con la
+misma clave esperen a la primera y reciban su resultado (o su excepción), en vez de
+repetir la descarga. No es un caché: en cuanto la primera termina, la siguiente llamada
+con esa clave vuelve a ejecutar `fn`.
+
+Quien recibe un resultado compartido (`do(...)[1] is True`) recibe el MISMO objeto que la
+primera llamada: si lo va a mutar, que lo copie.
+
+Métricas: `stats()` → llamadas, ejecuciones reales, llamadas unidas a una en vuelo
+(`coalesced`), errores y claves en vuelo ahora, por grupo.
+"""
+from __future__ import annotations
+
+import threading
+
+_groups: dict = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalescencia de llamadas concurrentes por clave."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}             # clave → _Call en vuelo
+        self._counts = dict(calls=0, executions=0, coalesced=0, errors=0)
+
+    def do(self, key, fn) -> tuple:
+        """`(fn(), compartido)`. Si ya hay una llamada en vuelo con `key`, espera la suya y
+        devuelve su resultado con `compartido=True` (o relanza su excepción)."""
+        with self._lock:
+            self._counts['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._counts['executions'] += 1
+            else:
+                self._counts['coalesced'] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._counts['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counts, inflight=len(self._calls))
+
+
+def group(name: str) -> SingleFlight:
+    """El `SingleFlight` del proceso llamado `name` (uno por tipo de descarga)."""
+    with _groups_lock:
+        g = _groups.get(name)
+        if g is None:
+            g = _groups[name] = SingleFlight()
+        return g
+
+
+def stats() -> dict:
+    """{grupo: métricas} de todos los grupos del proceso."""
+    with _groups_lock:
+        groups = dict(_groups)
+    return {name: g.stats() for name, g in groups.items()}
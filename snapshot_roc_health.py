@@ -40,7 +40,7 @@ def _load_yaml(path):
 def _price_cagr_recent(ticker):
     """CAGR de precio de los últimos 12m (= erosión/apreciación observada del NAV). None si falla."""
     start = (datetime.date.today() - datetime.timedelta(days=LOOKBACK_DAYS)).isoformat()
-    df, err = logic.fetch_market_data(ticker, start)
+    df, err, _fuente = logic.fetch_market_data(ticker, start)
     if df is None or getattr(df, "empty", True) or "Close" not in df.columns:
         return None, None
     cagr = logic._annualized_cagr(df["Close"], days=365)
@@ -0,0 +1,378 @@
+"""Snapshots de `analyze_portfolio`: reabrir el mismo archivo sin recalcular.
+
+`analyze_portfolio` baja precios de mercado y tarda segundos; su resultado vive en
+`st.session_state["_vd_resultados"]` y muere con la sesión o con un redeploy. Aquí se guarda
+en disco y se devuelve en milisegundos cuando vuelve a entrar la misma tabla.
+
+Clave = huella del CONTENIDO de la tabla de transacciones que recibe `analyze_portfolio`
+(no del nombre del archivo) + versión del código (`logic.py`) + versión del conocimiento
+(`knowledge/`). Cambiar cualquiera de las tres da otra clave: un deploy o un refresco de
+`roc_19a.yaml` invalida solo, sin borrar nada a mano.
+
+Formato: una carpeta por snapshot con `meta.json` (escalares, listas y dicts; lo que JSON no
+tiene — Timestamp, tuplas, claves int, escalares numpy — va etiquetado) y un `.parquet` por
+cada DataFrame/Series del resultado. Los campos perezosos de `logic.TickerResult` que nadie
+leyó se guardan como pendientes (cargador + argumentos), no calculados.
+
+Retención: TTL (SNAPSHOT_TTL_HOURS, 12 h por defecto: los precios envejecen) y tope de
+tamaño total (SNAPSHOT_MAX_MB, 200 MB). Al guardar se borran los vencidos y, si aún sobra,
+los de último uso más antiguo.
+
+Backend: igual que `storage.py`, DESACTIVADO salvo que el operador lo configure con
+SNAPSHOT_LOCAL_DIR (env) o st.secrets['snapshots']['local_dir']; `set_backend()` enchufa
+otro con el contrato de `LocalSnapshotBackend`. Un snapshot contiene el historial completo
+del usuario y PRIVACY.md promete que sin consentimiento nada sale de la memoria de la
+sesión, así que es para despliegues propios (dev/staging, instalación personal). La app
+NUNCA debe romperse por esto: `load()` y `save()` no lanzan.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import logic
+
+SNAPSHOT_PREFIX = 'snapshots'
+SNAPSHOT_FORMAT = 1           # sube si cambia el formato en disco
+DEFAULT_TTL_HOURS = 12
+DEFAULT_MAX_MB = 200
+
+_RAIZ = os.path.dirname(os.path.abspath(__file__))
+_CODE_FILES = ('logic.py',)
+_KNOWLEDGE_DIR = os.path.join(_RAIZ, 'knowledge')
+
+_backend_override = None
+_version_cache: dict = {}
+
+
+def _secrets():
+    try:
+        import streamlit as st
+        return st.secrets
+    except Exception:
+        return {}
+
+
+def _conf(name: str, env: str):
+    v = os.getenv(env)
+    if v:
+        return v
+    try:
+        return _secrets().get('snapshots', {}).get(name)
+    except Exception:
+        return None
+
+
+def _ttl_seconds() -> float:
+    try:
+        return float(_conf('ttl_hours', 'SNAPSHOT_TTL_HOURS') or DEFAULT_TTL_HOURS) * 3600
+    except (TypeError, ValueError):
+        return DEFAULT_TTL_HOURS * 3600
+
+
+def _max_bytes() -> int:
+    try:
+        return int(float(_conf('max_mb', 'SNAPSHOT_MAX_MB') or DEFAULT_MAX_MB) * 1024 * 1024)
+    except (TypeError, ValueError):
+        return DEFAULT_MAX_MB * 1024 * 1024
+
+
+# ── Backends ─────────────────────────────────────────────────────────────────
+
+class LocalSnapshotBackend:
+    """Una carpeta por snapshot en `<root>/snapshots/<clave>/`.
+
+    Contrato de un backend: `read(clave)` → {archivo: bytes} o None; `write(clave, archivos)`;
+    `delete(clave)`; `entries()` → [(clave, creado, último_uso, bytes)].
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.join(root, SNAPSHOT_PREFIX)
+
+    def read(self, key: str):
+        base = os.path.join(self.root, key)
+        if not os.path.isdir(base):
+            return None
+        files = {}
+        for name in os.listdir(base):
+            with open(os.path.join(base, name), 'rb') as f:
+                files[name] = f.read()
+        os.utime(base)                          # último uso → orden de desalojo
+        return files
+
+    def write(self, key: str, files: dict) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        # Se escribe aparte y se mueve entero: un lector nunca ve un snapshot a medias.
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.root)
+        try:
+            for name, data in files.items():
+                with open(os.path.join(tmp, name), 'wb') as f:
+                    f.write(data)
+            dest = os.path.join(self.root, key)
+            if os.path.isdir(dest):
+                shutil.rmtree(dest, ignore_errors=True)
+            os.replace(tmp, dest)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def delete(self, key: str) -> None:
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def entries(self) -> list:
+        out = []
+        if not os.path.isdir(self.root):
+            return out
+        for key in os.listdir(self.root):
+            base = os.path.join(self.root, key)
+            if key.startswith('.') or not os.path.isdir(base):
+                continue
+            try:
+                meta = os.path.getmtime(os.path.join(base, 'meta.json'))
+                size = sum(os.path.getsize(os.path.join(base, n)) for n in os.listdir(base))
+                out.append((key, meta, os.path.getmtime(base), size))
+            except OSError:
+                continue
+        return out
+
+
+def set_backend(be) -> None:
+    """Fija el backend (o None para volver al configurado por entorno/secrets)."""
+    global _backend_override
+    _backend_override = be
+
+
+def backend():
+    """El backend activo, o None si no hay ninguno configurado."""
+    if _backend_override is not None:
+        return _backend_override
+    root = _conf('local_dir', 'SNAPSHOT_LOCAL_DIR')
+    return LocalSnapshotBackend(root) if root else None
+
+
+def is_enabled() -> bool:
+    return backend() is not None
+
+
+# ── Clave ────────────────────────────────────────────────────────────────────
+
+def _version_files() -> list:
+    files = [os.path.join(_RAIZ, n) for n in _CODE_FILES]
+    for base, dirs, names in os.walk(_KNOWLEDGE_DIR):
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__')))
+        files.extend(os.path.join(base, n) for n in sorted(names) if not n.startswith('.'))
+    return files
+
+
+def code_version() -> str:
+    """Huella de `logic.py` + `knowledge/`. Se rehace solo si cambió la fecha o el tamaño de
+    algún archivo, así que consultarla en cada rerun no lee nada del disco."""
+    files = _version_files()
+    sig = []
+    for p in files:
+        try:
+            s = os.stat(p)
+            sig.append((p, s.st_mtime_ns, s.st_size))
+        except OSError:
+            continue
+    sig = tuple(sig)
+    if _version_cache.get('sig') == sig:
+        return _version_cache['version']
+    h = hashlib.sha256()
+    for p, _, _ in sig:
+        h.update(os.path.relpath(p, _RAIZ).encode())
+        with open(p, 'rb') as f:
+            h.update(f.read())
+    _version_cache.update(sig=sig, version=h.hexdigest()[:16])
+    return _version_cache['version']
+
+
+def upload_fingerprint(df: pd.DataFrame) -> str:
+    """Huella del contenido de la tabla: columnas, dtypes y el hash de cada fila."""
+    h = hashlib.sha256()
+    h.update(json.dumps([[str(c), str(t)] for c, t in df.dtypes.items()]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def snapshot_key(df: pd.DataFrame, params: dict = None) -> str:
+    h = hashlib.sha256()
+    for part in (str(SNAPSHOT_FORMAT), upload_fingerprint(df), code_version(),
+                 json.dumps(params or {}, sort_keys=True, default=str)):
+        h.update(part.encode())
+        h.update(b'\x00')
+    return h.hexdigest()[:32]
+
+
+# ── Serialización ────────────────────────────────────────────────────────────
+
+def _frame_bytes(df: pd.DataFrame) -> bytes:
+    if not all(isinstance(c, str) for c in df.columns):
+        raise TypeError('parquet necesita nombres de columna str')
+    buf = io.BytesIO()
+    df.to_parquet(buf, engine='pyarrow', compression='zstd')
+    return buf.getvalue()
+
+
+def _encode(obj, files: dict, memo: dict = None):
+    memo = {} if memo is None else memo
+    enc = lambda v: _encode(v, files, memo)          # noqa: E731
+    if obj is None or isinstance(obj, (str, bool)) or type(obj) in (int, float):
+        return obj
+    if isinstance(obj, np.generic):
+        return {'__np__': obj.dtype.str, 'v': obj.item()}
+    if obj is pd.NaT:
+        return {'__nat__': True}
+    if isinstance(obj, pd.Timestamp):
+        return {'__ts__': obj.isoformat()}
+    if isinstance(obj, dt.datetime):
+        return {'__datetime__': obj.isoformat()}
+    if isinstance(obj, dt.date):
+        return {'__date__': obj.isoformat()}
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        # El mismo objeto (p. ej. `history` y el argumento de un campo perezoso que sale de
+        # él) se escribe una sola vez y vuelve como un solo objeto.
+        name = memo.get(id(obj))
+        if name is None:
+            name = memo[id(obj)] = f'{len(files)}.parquet'
+            is_series = isinstance(obj, pd.Series)
+            files[name] = _frame_bytes(obj.to_frame('values') if is_series else obj)
+        out = {'__frame__': name}
+        if isinstance(obj, pd.Series):
+            out['series'] = enc(obj.name)
+        freq = getattr(obj.index, 'freqstr', None)
+        if freq:
+            out['freq'] = freq                 # parquet no guarda la frecuencia del índice
+        return out
+    if isinstance(obj, logic.LazyField):
+        # Pendiente se guarda pendiente: guardar no obliga a calcular.
+        return {'__lazy__': obj.loader, 'args': [enc(a) for a in obj.args]}
+    if isinstance(obj, logic.TickerResult):
+        return {'__result__': [[k, enc(v)] for k, v in dict.items(obj)]}
+    if isinstance(obj, tuple):
+        return {'__tuple__': [enc(v) for v in obj]}
+    if isinstance(obj, list):
+        return [enc(v) for v in obj]
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) and not k.startswith('__') for k in obj):
+            return {k: enc(v) for k, v in obj.items()}
+        return {'__dict__': [[enc(k), enc(v)] for k, v in obj.items()]}
+    raise TypeError(f'tipo no serializable en el snapshot: {type(obj).__name__}')
+
+
+def _decode(obj, files: dict, memo: dict = None):
+    memo = {} if memo is None else memo
+    dec = lambda v: _decode(v, files, memo)          # noqa: E731
+    if isinstance(obj, list):
+        return [dec(v) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if '__np__' in obj:
+        return np.array(obj['v'], dtype=obj['__np__'])[()]
+    if '__nat__' in obj:
+        return pd.NaT
+    if '__ts__' in obj:
+        return pd.Timestamp(obj['__ts__'])
+    if '__datetime__' in obj:
+        return dt.datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return dt.date.fromisoformat(obj['__date__'])
+    if '__frame__' in obj:
+        name = obj['__frame__']
+        if name not in memo:
+            df = pd.read_parquet(io.BytesIO(files[name]), engine='pyarrow')
+            if obj.get('freq'):
+                df.index = pd.DatetimeIndex(df.index, freq=obj['freq'])
+            if 'series' in obj:
+                df = df['values'].rename(dec(obj['series']))
+            memo[name] = df
+        return memo[name]
+    if '__lazy__' in obj:
+        if obj['__lazy__'] not in logic.LAZY_LOADERS:
+            raise ValueError(f"cargador desconocido: {obj['__lazy__']}")
+        return logic.LazyField(obj['__lazy__'], *dec(obj['args']))
+    if '__result__' in obj:
+        return logic.TickerResult((k, dec(v)) for k, v in obj['__result__'])
+    if '__tuple__' in obj:
+        return tuple(dec(v) for v in obj['__tuple__'])
+    if '__dict__' in obj:
+        return {dec(k): dec(v) for k, v in obj['__dict__']}
+    return {k: dec(v) for k, v in obj.items()}
+
+
+# ── API ──────────────────────────────────────────────────────────────────────
+
+def load(df: pd.DataFrame, params: dict = None):
+    """Resultado guardado de `analyze_portfolio(df, **params)`, o None (sin backend, sin
+    snapshot, vencido o ilegible)."""
+    be = backend()
+    if be is None or df is None:
+        return None
+    try:
+        key = snapshot_key(df, params)
+        files = be.read(key)
+        if not files or 'meta.json' not in files:
+            return None
+        meta = json.loads(files['meta.json'])
+        if (meta.get('format') != SNAPSHOT_FORMAT
+                or time.time() - meta.get('created', 0) > _ttl_seconds()):
+            be.delete(key)
+            return None
+        return _decode(meta['results'], files)
+    except Exception as e:
+        print(f"snapshot_store.load error: {e}")
+        return None
+
+
+def save(df: pd.DataFrame, results: dict, params: dict = None) -> bool:
+    """Guarda el resultado y aplica TTL/tope de tamaño. True si quedó guardado."""
+    be = backend()
+    if be is None or df is None or not results:
+        return False
+    try:
+        key = snapshot_key(df, params)
+        files = {}
+        encoded = _encode(results, files)
+        meta = {'format': SNAPSHOT_FORMAT, 'created': time.time(),
+                'code_version': code_version(), 'results': encoded}
+        files['meta.json'] = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+        be.write(key, files)
+        evict(be)
+        return True
+    except Exception as e:
+        print(f"snapshot_store.save error: {e}")
+        return False
+
+
+def evict(be=None, now: float = None) -> list:
+    """Borra los snapshots vencidos y, si el total pasa el tope, los de último uso más
+    antiguo. Devuelve las claves borradas."""
+    be = be or backend()
+    if be is None:
+        return []
+    now = time.time() if now is None else now
+    ttl, cap = _ttl_seconds(), _max_bytes()
+    borradas, vivos = [], []
+    for key, created, used, size in be.entries():
+        if now - created > ttl:
+            be.delete(key)
+            borradas.append(key)
+        else:
+            vivos.append((used, key, size))
+    total = sum(size for _, _, size in vivos)
+    for _, key, size in sorted(vivos):
+        if total <= cap:
+            break
+        be.delete(key)
+        borradas.append(key)
+        total -= size
+    return borradas
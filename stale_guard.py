@@ -17,46 +17,52 @@ las tres ya observadas:
 Comparar la fecha del archivo no tiene ninguno de esos problemas: detecta cualquier
 cambio, no hay lista que mantener y los módulos se descubren solos.
 
-CÓMO FUNCIONA. Tras importar, `asegurar_frescura()` anota la fecha de modificación de
-cada archivo propio ya cargado. En las corridas siguientes las vuelve a leer: si alguna
-cambió, el disco se movió por debajo del proceso y se recargan TODOS los módulos
-vigilados, en orden de dependencias. Equivale a un «Reboot app» automático.
-
-Se recarga todo y no solo lo que cambió a propósito: un módulo que hace
-`from otro import nombre` se queda con el `nombre` viejo aunque su propio archivo no se
-haya tocado, así que refrescarlo es parte del arreglo.
+CÓMO FUNCIONA. Tras importar, `asegurar_frescura()` anota la fecha de modificación y el
+hash del contenido de cada archivo propio ya cargado. En las corridas siguientes —como mucho
+una vez cada `INTERVALO_S` segundos por proceso, para no hacer `stat` de todo en cada
+rerun— vuelve a mirar las fechas; si alguna se movió, el hash confirma que el contenido
+cambió de verdad (un checkout que reescribe el mismo archivo no cuenta). Entonces se
+recargan ese módulo y todos los que dependen de él, en orden de dependencias. Cada recarga
+se anota en el log con lo que tardó.
+
+Se recargan también los dependientes, y no solo lo que cambió, a propósito: un módulo que
+hace `from otro import nombre` se queda con el `nombre` viejo aunque su propio archivo no
+se haya tocado, así que refrescarlo es parte del arreglo. Las dependencias salen de los
+imports de nivel de módulo de cada archivo (`dependencias()`), no de una lista a mano; lo
+que no depende de lo cambiado conserva su estado (p. ej. el `_ROC19A_CACHE` de `logic`
+cuando solo cambió una vista).
 
 Los módulos que se importan tarde (dentro de una función) no necesitan vigilancia para
 la corrida en que aparecen: un import que ocurre por primera vez SIEMPRE lee del disco.
-Quedan registrados a partir de ese momento.
+Quedan registrados a partir de ese momento. Por lo mismo, un import dentro de una función
+no es una dependencia: se vuelve a resolver en cada llamada.
 """
 
 from __future__ import annotations
 
+import ast
+import hashlib
 import importlib
+import importlib.util
 import os
 import sys
+import time
 
 _RAIZ = os.path.dirname(os.path.abspath(__file__))
 
-# Un módulo va DESPUÉS de aquellos de los que importa nombres sueltos: `reload` re-ejecuta
-# los `from X import y`, y esos solo traen la versión nueva si `X` ya se refrescó.
-# Lo que no esté aquí se recarga al final, que es el lugar seguro por defecto —
-# `test_stale_guard.py` avisa cuando aparece un módulo nuevo sin sitio asignado.
-_ORDEN = (
-    "logic", "storage", "report", "demo_mode", "backtest", "price_cache",
-    # `ui.estado` va antes que sus consumidores (carga, vistas, heredadas): es el dueño de
-    # las claves de sesión compartidas, y recargarlo después dejaría a los demás apuntando
-    # al módulo viejo.
-    "ui.tokens", "ui.estado", "ui.nav", "ui.componentes", "ui.heredadas", "ui.adapters",
-    "ui.chrome", "ui.carga", "ui.pie", "ui.validacion", "ui.vistas",
-)
-
-# módulo → fecha del archivo cuando lo cargamos. Vive aquí y no en `st.session_state`
-# porque el estado de sesión nace vacío en cada visita: una sesión abierta después del
-# despliegue anotaría las fechas nuevas como si fueran las suyas y no vería nada raro.
-# Este módulo, en cambio, persiste en `sys.modules` mientras el proceso viva.
+# Segundos mínimos entre dos revisiones del disco dentro del mismo proceso.
+INTERVALO_S = float(os.getenv("STALE_GUARD_INTERVAL_S") or 3.0)
+
+# módulo → fecha y hash del archivo cuando lo cargamos. Viven aquí y no en
+# `st.session_state` porque el estado de sesión nace vacío en cada visita: una sesión
+# abierta después del despliegue anotaría las fechas nuevas como si fueran las suyas y no
+# vería nada raro. Este módulo, en cambio, persiste en `sys.modules` mientras el proceso
+# viva.
 _fechas: dict[str, float] = {}
+_huellas: dict[str, str] = {}
+_ultima_revision: float | None = None
+# ruta → (fecha, dependencias): el análisis de imports de un archivo que no cambió se reusa.
+_deps_memo: dict[str, tuple[float, frozenset]] = {}
 
 
 def modulos_propios() -> dict[str, str]:
@@ -82,49 +88,158 @@ def modulos_propios() -> dict[str, str]:
     return encontrados
 
 
-def _orden_de_recarga(nombre: str) -> int:
-    return _ORDEN.index(nombre) if nombre in _ORDEN else len(_ORDEN)
+def _huella(ruta: str) -> str | None:
+    try:
+        with open(ruta, "rb") as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _importados(nombre: str, ruta: str) -> frozenset:
+    """Nombres que `ruta` importa a nivel de módulo (no dentro de funciones)."""
+    try:
+        fecha = os.path.getmtime(ruta)
+        memo = _deps_memo.get(ruta)
+        if memo and memo[0] == fecha:
+            return memo[1]
+        with open(ruta, "rb") as fh:
+            arbol = ast.parse(fh.read(), filename=ruta)
+    except (OSError, SyntaxError, ValueError):
+        return frozenset()
+    paquete = nombre if ruta.endswith("__init__.py") else nombre.rpartition(".")[0]
+    nombres = set()
+
+    def visitar(nodo):
+        for hijo in ast.iter_child_nodes(nodo):
+            if isinstance(hijo, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                continue
+            if isinstance(hijo, ast.Import):
+                nombres.update(a.name for a in hijo.names)
+            elif isinstance(hijo, ast.ImportFrom):
+                try:
+                    base = importlib.util.resolve_name("." * hijo.level + (hijo.module or ""),
+                                                       paquete) if hijo.level else hijo.module
+                except (ImportError, ValueError):
+                    continue
+                nombres.add(base)
+                # `from ui import carga` importa el submódulo `ui.carga`.
+                nombres.update(f"{base}.{a.name}" for a in hijo.names)
+            visitar(hijo)
+
+    visitar(arbol)
+    _deps_memo[ruta] = (fecha, frozenset(nombres))
+    return _deps_memo[ruta][1]
+
+
+def dependencias(actuales: dict[str, str] = None) -> dict[str, set[str]]:
+    """módulo propio → módulos propios que importa a nivel de módulo.
+
+    `import x.y` depende también de `x`, que es lo que queda ligado en el módulo.
+    """
+    actuales = modulos_propios() if actuales is None else actuales
+    grafo = {}
+    for nombre, ruta in actuales.items():
+        deps = set()
+        for importado in _importados(nombre, ruta):
+            partes = importado.split(".")
+            for i in range(1, len(partes) + 1):
+                candidato = ".".join(partes[:i])
+                if candidato in actuales and candidato != nombre:
+                    deps.add(candidato)
+        grafo[nombre] = deps
+    return grafo
+
+
+def _dependientes(cambiados, grafo: dict[str, set[str]]) -> set[str]:
+    """`cambiados` más todo lo que los importa, directa o indirectamente."""
+    inverso: dict[str, set[str]] = {}
+    for nombre, deps in grafo.items():
+        for dep in deps:
+            inverso.setdefault(dep, set()).add(nombre)
+    visto, pendientes = set(cambiados), list(cambiados)
+    while pendientes:
+        for dependiente in inverso.get(pendientes.pop(), ()):
+            if dependiente not in visto:
+                visto.add(dependiente)
+                pendientes.append(dependiente)
+    return visto
+
+
+def orden_de_recarga(nombres, grafo: dict[str, set[str]]) -> list[str]:
+    """`nombres` en orden topológico: cada módulo después de los que importa.
+
+    Un ciclo no debería existir (Python tampoco lo importa bien), pero si aparece sus
+    módulos se recargan al final en orden alfabético en vez de quedarse sin recargar.
+    """
+    nombres = set(nombres)
+    faltan = {n: grafo.get(n, set()) & nombres for n in nombres}
+    orden = []
+    while faltan:
+        listos = sorted(n for n, deps in faltan.items() if not deps)
+        if not listos:
+            listos = sorted(faltan)
+        for n in listos:
+            del faltan[n]
+        for deps in faltan.values():
+            deps.difference_update(listos)
+        orden.extend(listos)
+    return orden
 
 
 def asegurar_frescura() -> list[str]:
-    """Recarga los módulos si el disco cambió bajo el proceso. Devuelve los recargados.
+    """Recarga lo que cambió en disco y sus dependientes. Devuelve los recargados.
 
     En la primera corrida solo toma nota; no hay con qué comparar todavía.
     """
+    global _ultima_revision
+    ahora = time.monotonic()
+    if _ultima_revision is not None and _fechas and ahora - _ultima_revision < INTERVALO_S:
+        return []
+    _ultima_revision = ahora
     actuales = modulos_propios()
 
-    movidos = []
+    cambiados = []
     for nombre, ruta in actuales.items():
         try:
             fecha = os.path.getmtime(ruta)
         except OSError:
             continue
-        if nombre in _fechas and _fechas[nombre] != fecha:
-            movidos.append(nombre)
-        _fechas[nombre] = fecha
+        if nombre not in _fechas:
+            _fechas[nombre], _huellas[nombre] = fecha, _huella(ruta)
+        elif _fechas[nombre] != fecha:
+            _fechas[nombre] = fecha
+            huella = _huella(ruta)
+            if huella != _huellas.get(nombre):
+                _huellas[nombre] = huella
+                cambiados.append(nombre)
 
     for nombre in list(_fechas):
         if nombre not in actuales:
             del _fechas[nombre]
+            _huellas.pop(nombre, None)
 
-    if not movidos:
+    if not cambiados:
         return []
 
+    grafo = dependencias(actuales)
+    inicio = time.perf_counter()
     recargados = []
-    for nombre in sorted(actuales, key=_orden_de_recarga):
+    for nombre in orden_de_recarga(_dependientes(cambiados, grafo), grafo):
         modulo = sys.modules.get(nombre)
         if modulo is None:
             continue
+        t0 = time.perf_counter()
         try:
             importlib.reload(modulo)
-        except Exception:
+        except Exception as e:
             # Un módulo que no puede recargarse no debe tumbar la app: sigue sirviendo
             # su versión vieja, que es exactamente lo que hacía sin guardián.
+            print(f"stale_guard: no se pudo recargar {nombre}: {e}")
             continue
         recargados.append(nombre)
-        try:
-            _fechas[nombre] = os.path.getmtime(actuales[nombre])
-        except OSError:
-            pass
+        print(f"stale_guard: recargado {nombre} en {(time.perf_counter() - t0) * 1000:.0f} ms")
 
+    print(f"stale_guard: cambiaron {sorted(cambiados)}; {len(recargados)} módulo(s) "
+          f"recargado(s) en {(time.perf_counter() - inicio) * 1000:.0f} ms")
     return recargados
@@ -11,7 +11,7 @@ import pytest
 
 sys.path.insert(0, os.path.dirname(__file__))
 import logic                                            # noqa: E402
-from ui.adapters import cashflow_data, verificar_identidades  # noqa: E402
+from ui.adapters import cashflow_data, reducir_serie, verificar_identidades  # noqa: E402
 
 
 class FakeFile:
@@ -29,7 +29,7 @@ class FakeFile:
 _MKT_MOCK = lambda t, d: (
     __import__("pandas").DataFrame(
         {"Close": [20.0], "Dividends": [0.0], "Stock Splits": [0.0]},
-        index=__import__("pandas").to_datetime(["2026-01-01"])), None)
+        index=__import__("pandas").to_datetime(["2026-01-01"])), None, "yahoo")
 
 
 def _schwab_msty_stats(monkeypatch, version="TEST_ADAPTERS_SCHWAB"):
@@ -146,7 +146,7 @@ def test_verificar_identidades_no_es_ciego_a_la_convencion_rota(monkeypatch):
     casualidad — comprobado sabotajeando `_dividend_tax_netted` para que devuelva siempre
     `True`: Schwab vuelve a mostrar BRUTO $600.60 (el bug que arregló el PR B) y el guard
     viejo no lo veía. Este test fuerza exactamente ese sabotaje y exige que el guard falle."""
-    monkeypatch.setattr(logic, "_dividend_tax_netted", lambda history_df: True)
+    monkeypatch.setattr(logic, "_dividend_tax_netted", lambda history_df, led=None: True)
     s = _schwab_msty_stats(monkeypatch, version="TEST_ADAPTERS_SCHWAB_SABOTAGE_NETTED")
     datos = cashflow_data(s, "MSTY")
     # Con la detección sabotajeada, el objeto fiscal único queda roto (BRUTO=600.60 en vez
@@ -216,9 +216,49 @@ def test_el_guard_de_nan_no_le_gana_al_guard_de_convencion(monkeypatch):
     """La comprobación de finitud va ANTES y devuelve de inmediato — pero solo debe
     dispararse cuando hay una cifra no numérica. Con datos sanos y una convención rota, el
     fallo que se reporta tiene que seguir siendo el del CSV releído, no un falso NaN."""
-    monkeypatch.setattr(logic, "_dividend_tax_netted", lambda history_df: True)
+    monkeypatch.setattr(logic, "_dividend_tax_netted", lambda history_df, led=None: True)
     s = _schwab_msty_stats(monkeypatch, version="TEST_ADAPTERS_NAN_NO_TAPA_CONVENCION")
     datos = cashflow_data(s, "MSTY")
     fallos = verificar_identidades(datos, s)
     assert any("CSV releído independiente" in f for f in fallos)
     assert not any("no numérica" in f for f in fallos)
+
+
+def _serie_diaria(n=1500):
+    import numpy as np
+    import pandas as pd
+    idx = pd.bdate_range("2020-01-02", periods=n)
+    return pd.Series(1000 + np.cumsum(np.sin(np.arange(n) / 17.0) * 5), index=idx)
+
+
+def test_reducir_serie_conserva_forma_extremos_y_eventos():
+    """La gráfica recibe ~`puntos` valores EXACTOS: primero, último, el pico y el valle,
+    y los días de `conservar` aunque no los elegiría la reducción."""
+    serie = _serie_diaria()
+    serie.iloc[700] = 2000.0                       # un pico de un solo día
+    serie.iloc[900] = 100.0                        # y un valle
+    eventos = [serie.index[5], serie.index[333], serie.index[1234]]
+
+    reducida = reducir_serie(serie, puntos=200, conservar=eventos)
+
+    assert 200 <= len(reducida) <= 200 + len(eventos)
+    assert reducida.index.is_monotonic_increasing
+    assert (reducida == serie[reducida.index]).all()
+    for d in [serie.index[0], serie.index[-1], serie.index[700], serie.index[900]] + eventos:
+        assert d in reducida.index
+
+
+def test_reducir_serie_no_toca_lo_que_ya_cabe():
+    serie = _serie_diaria(300)
+    assert reducir_serie(serie, puntos=500).equals(serie)
+
+
+def test_reducir_serie_con_demasiados_eventos_sigue_en_presupuesto():
+    """Un día fijo por semana (dividendos semanales) no rompe el presupuesto: de los días a
+    conservar quedan los de mayor salto."""
+    serie = _serie_diaria()
+    serie.iloc[600:] += 300.0                      # una compra grande
+    semanales = list(serie.index[::5])
+    reducida = reducir_serie(serie, puntos=200, conservar=semanales)
+    assert len(reducida) <= 200 + 2
+    assert serie.index[600] in reducida.index
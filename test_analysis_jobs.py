@@ -0,0 +1,73 @@
+"""Tests de analysis_jobs.py — unirse al trabajo en curso, avance por ticker y errores."""
+import os
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import analysis_jobs as aj
+import logic
+
+
+@pytest.fixture(autouse=True)
+def _registro_limpio():
+    aj._jobs.clear()
+    yield
+    aj._jobs.clear()
+
+
+def test_submit_se_une_al_trabajo_en_curso():
+    soltar = threading.Event()
+    llamadas = []
+
+    def producir(avisar):
+        llamadas.append(1)
+        avisar(0, 2, None, None)
+        avisar(1, 2, "JEPI", {"roi_percent": 8.0})
+        soltar.wait(5)
+        avisar(2, 2, "SCHD", {"skipped": True})
+        return {"JEPI": {}, "SCHD": {}}
+
+    a = aj.submit("k", producir)
+    b = aj.submit("k", producir)                   # el rerun se une, no relanza
+    assert a is b and aj.active() == ["k"]
+    for _ in range(100):
+        if a.progress()["done"] == 1:
+            break
+        threading.Event().wait(0.01)
+    avance = a.progress()
+    assert (avance["done"], avance["total"], avance["ticker"]) == (1, 2, "JEPI")
+    assert avance["partial"] == {"JEPI": {"roi_percent": 8.0}}
+
+    soltar.set()
+    assert a.wait(5) and a.result() == {"JEPI": {}, "SCHD": {}}
+    assert [e["ticker"] for e in a.events] == ["JEPI", "SCHD"]
+    assert aj.submit("k", producir) is a and len(llamadas) == 1   # terminado bien: se reusa
+    aj.discard("k", a)
+    assert aj.get("k") is None
+
+
+def test_trabajo_fallido_relanza_y_se_reintenta():
+    def falla(avisar):
+        raise ValueError("sin red")
+
+    a = aj.submit("k", falla)
+    assert a.wait(5) and a.failed()
+    with pytest.raises(ValueError, match="sin red"):
+        a.result()
+    b = aj.submit("k", lambda avisar: {"ok": 1})
+    assert b is not a and b.wait(5) and b.result() == {"ok": 1}
+
+
+def test_analyze_portfolio_avisa_por_ticker():
+    # Tickers fuera del universo ETF salen por el primer `continue`: no tocan la red.
+    df = pd.DataFrame({"Date": pd.to_datetime(["2024-01-02", "2024-02-01"]),
+                       "Ticker": ["ZZZQ1", "ZZZQ2"], "Action": ["Buy", "Buy"],
+                       "Quantity": [1.0, 1.0], "Price": [10.0, 10.0], "Amount": [-10.0, -10.0]})
+    avisos = []
+    r = logic.analyze_portfolio.__wrapped__(df, _progreso=lambda *a: avisos.append(a))
+    assert avisos[0] == (0, 2, None, None)
+    assert [(h, t, tk) for h, t, tk, _ in avisos[1:]] == [(1, 2, "ZZZQ1"), (2, 2, "ZZZQ2")]
+    assert avisos[-1][3] is r["ZZZQ2"] and r["ZZZQ2"]["skipped"]
@@ -16,6 +16,7 @@ ya verificó contra la app corriendo, y protegen dos invariantes:
 
 Ver `ui/adapters.py::comparacion_data` para el porqué de cada pieza del JSON.
 """
+import json
 import os
 import re
 import sys
@@ -26,6 +27,7 @@ sys.path.insert(0, os.path.dirname(__file__))
 import backtest  # noqa: E402
 import logic  # noqa: E402
 import price_cache  # noqa: E402
+from ui import adapters  # noqa: E402
 from ui.adapters import (  # noqa: E402
     _INDICE_CAPITAL, _CMP_FLAT_RATE, _politica_fiscal, _tasa_efectiva_neta,
     TRG_MODOS, TRG_SUB, TRG_UNIVERSO, TRG_UNIVERSO_REAL, TRG_YM, comparacion_data)
@@ -75,7 +77,8 @@ def corrida():
 
     backtest.run_backtest = espia
     try:
-        d = comparacion_data()
+        # En vivo: el payload precalculado (`build_view_payloads.py`) no pasaría por el espía.
+        d = comparacion_data(precalculado=False)
     finally:
         backtest.run_backtest = original
 
@@ -494,3 +497,82 @@ class TestMonotoniaFiscalEstructural:
     # depende es exactamente el antipatrón que la Regla 5 del contrato describe: un test que
     # se rompe sin que nadie haya roto nada. Lo escribí yo en el PR #62; el error fue duplicar
     # el guard, no la propiedad.
+
+
+def test_payload_precalculado_solo_si_la_huella_coincide(tmp_path, monkeypatch):
+    """`build_view_payloads.py` deja el JSON con la huella de sus entradas; el adaptador lo
+    sirve tal cual si la huella es la de hoy y, si no, vuelve al cálculo en vivo."""
+    monkeypatch.setattr(adapters, "PAYLOADS_DIR", str(tmp_path))
+    monkeypatch.setattr(adapters, "_cache_vencido", lambda cobertura: False)
+    huella = adapters.huella_entradas()
+    assert huella is not None and huella == adapters.huella_entradas()
+
+    def escribir(inputs):
+        (tmp_path / "comparacion_data.json").write_text(
+            json.dumps({"inputs": inputs, "payload": {"marca": "precalculado"}}), encoding="utf-8")
+
+    escribir(huella)
+    assert comparacion_data() == {"marca": "precalculado"}
+
+    escribir("otra-huella")                       # otro caché, otro yaml u otro código
+    assert adapters._precalculado("comparacion_data") is None
+
+    escribir(huella)
+    monkeypatch.setattr(adapters, "_cache_vencido", lambda cobertura: True)
+    assert adapters._precalculado("comparacion_data") is None   # en vivo bajaría de yfinance
+
+
+def test_clave_compartida_cambia_con_el_codigo_del_adaptador(tmp_path, monkeypatch):
+    """`result_cache` no se recarga al editar un adaptador (`stale_guard` recarga solo los
+    dependientes): la clave de los payloads compartidos tiene que cambiar sola."""
+    import shutil
+    for rel in adapters._CODIGO_ENTRADA:
+        destino = tmp_path.joinpath(*rel.split("/"))
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(os.path.join(os.path.dirname(__file__), *rel.split("/")), destino)
+    monkeypatch.setattr(adapters, "_RAIZ_CODIGO", str(tmp_path))
+    monkeypatch.setattr(adapters, "_huella_codigo_memo", {"firma": None, "valor": None})
+    antes = adapters.version_datos_compartidos()
+    assert adapters.version_datos_compartidos() == antes
+
+    with open(tmp_path / "ui" / "adapters.py", "a", encoding="utf-8") as fh:
+        fh.write("\n# cambio del adaptador\n")
+    assert adapters.version_datos_compartidos() != antes
+
+
+def _expandir(x):
+    """Réplica en Python de `__vdCol` (el decodificador que `ui.componentes` inyecta)."""
+    from ui import componentes
+    if isinstance(x, list):
+        return [_expandir(v) for v in x]
+    if isinstance(x, dict):
+        if isinstance(x.get("q"), list) and isinstance(x.get("__m"), int):
+            return {str(x["__m"] + i): v / componentes._COL_ESCALA
+                    for i, v in enumerate(x["q"]) if v is not None}
+        return {k: _expandir(v) for k, v in x.items()}
+    return x
+
+
+def test_payload_en_columnas_cabe_en_el_presupuesto_y_no_pierde_nada(datos):
+    """Lo que viaja al iframe en cada rerun: las series por mes en columna, sin pérdida, y
+    bajo presupuesto (el JSON plano pesaba ~56 KB y además iba dos veces, ver
+    `_plantilla`)."""
+    from ui import componentes
+
+    texto = componentes._payload(datos)
+    assert len(texto.encode("utf-8")) < 36_000, f"payload de {len(texto) // 1024} KB"
+    assert texto.startswith("__vdCol(") and texto.endswith(")")
+    assert _expandir(json.loads(texto[len("__vdCol("):-1])) == json.loads(json.dumps(datos))
+
+    html = componentes._plantilla("comparacion.html").replace("{{DATA_JSON}}", texto)
+    assert html.count(texto) == 1 and "function __vdCol" in html
+
+
+def test_plantilla_se_lee_una_vez_por_version_del_archivo(monkeypatch):
+    from ui import componentes
+
+    primera = componentes._plantilla("hoja.html")
+    assert componentes._plantilla("hoja.html") is primera
+    fecha, html = componentes._PLANTILLAS["hoja.html"]
+    monkeypatch.setitem(componentes._PLANTILLAS, "hoja.html", (fecha - 1, "vieja"))
+    assert componentes._plantilla("hoja.html") == primera     # la fecha cambió: se relee
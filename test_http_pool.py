@@ -0,0 +1,132 @@
+"""Tests de http_pool.py — ritmo, presupuesto de reintentos, cupo por host y métricas."""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import http_pool as hp
+import logic
+
+
+class _Reloj:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+    def dormir(self, s):
+        self.t += s
+
+
+class _Resp:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+
+
+class _Sesion:
+    def __init__(self, respuestas):
+        self.respuestas = list(respuestas)
+        self.urls = []
+
+    def get(self, url, **kw):
+        self.urls.append(url)
+        r = self.respuestas.pop(0)
+        if isinstance(r, Exception):
+            raise r
+        return r
+
+
+@pytest.fixture
+def sesion_falsa(monkeypatch):
+    pausas = []
+    monkeypatch.setattr(hp, "_budget", hp.RetryBudget(0.2, cap=2))
+    monkeypatch.setattr(hp.time, "sleep", lambda s: pausas.append(s))
+
+    def usar(respuestas):
+        s = _Sesion(respuestas)
+        monkeypatch.setattr(hp, "session", lambda: s)
+        return s, pausas
+    return usar
+
+
+def test_token_bucket_deja_pasar_la_rafaga_y_despues_marca_el_ritmo():
+    reloj = _Reloj()
+    cubo = hp.TokenBucket(rate=2, burst=3, clock=reloj, sleep=reloj.dormir)
+    assert [cubo.acquire() for _ in range(3)] == [0, 0, 0]
+    assert cubo.acquire() == pytest.approx(0.5)
+    assert cubo.acquire() == pytest.approx(0.5)
+    reloj.t += 10                                  # en reposo vuelve a llenarse, con tope
+    assert [cubo.acquire() for _ in range(3)] == [0, 0, 0]
+
+
+def test_get_reintenta_429_respetando_retry_after(sesion_falsa):
+    s, pausas = sesion_falsa([_Resp(429, {"Retry-After": "3"}), _Resp(503), _Resp(200)])
+    assert hp.get("https://query1.finance.yahoo.com/x").status_code == 200
+    assert pausas == [3.0, 1.0] and len(s.urls) == 3
+
+
+def test_el_presupuesto_corta_los_reintentos(sesion_falsa):
+    s, pausas = sesion_falsa([_Resp(429)] * 9)
+    denegados = hp.stats()["retries_denied"]
+    assert hp.get("https://h/a").status_code == 429    # 2 reintentos: saldo 2 → 0
+    assert hp.get("https://h/b", retries=5).status_code == 429
+    assert len(s.urls) == 3 + 1                         # la segunda ya no reintenta
+    assert hp.stats()["retries_denied"] == denegados + 1
+
+    s, _ = sesion_falsa([ConnectionError("reset")] * 3)
+    with pytest.raises(ConnectionError):
+        hp.get("https://h/c", retries=0)
+
+
+def test_cupo_por_host(monkeypatch):
+    monkeypatch.setattr(hp, "_host_limit", 2)
+    monkeypatch.setattr(hp, "_hosts", {})
+    monkeypatch.setattr(hp, "_bucket", hp.TokenBucket(rate=1000, burst=1000))
+    antes = hp.stats()["host_waits"]
+    a, b = hp._admit("https://h.example/1"), hp._admit("https://h.example/2")
+    otro = hp._admit("https://otro.example/1")           # otro host: no comparte cupo
+    entro = threading.Event()
+    hilo = threading.Thread(target=lambda: (hp._admit("https://h.example/3"), entro.set()))
+    hilo.start()
+    time.sleep(0.05)
+    assert not entro.is_set()
+    a.release()
+    hilo.join(2)
+    assert entro.is_set() and hp.stats()["host_waits"] == antes + 1
+    for sem in (b, otro, hp._hosts["h.example"]):
+        sem.release()
+
+
+def test_logic_usa_la_sesion_compartida():
+    pytest.importorskip("curl_cffi")
+    s = logic.get_session()
+    assert s is logic.get_session() is hp.session()
+
+
+def test_circuito_abre_tras_n_fallos_y_prueba_tras_el_enfriamiento():
+    reloj = _Reloj()
+    br = hp.CircuitBreaker(threshold=3, cooldown_s=60, clock=reloj)
+    for _ in range(2):
+        assert br.allow()
+        br.failure("HTTP 429")
+    br.success()                                   # los fallos cuentan solo si son seguidos
+    for _ in range(3):
+        br.failure("HTTP 429")
+    assert not br.allow() and br.state()["state"] == "open"
+    assert br.state()["retry_in_s"] == 60
+
+    reloj.t += 60
+    assert br.allow()                              # una de prueba…
+    assert not br.allow()                          # …y solo una
+    br.failure("ConnectError")
+    assert br.state()["state"] == "open" and br.state()["short_circuits"] == 2
+
+    reloj.t += 60
+    assert br.allow()
+    br.success()
+    assert br.state()["state"] == "closed" and br.allow()
@@ -0,0 +1,50 @@
+"""Presupuesto de import del arranque (`python -X importtime`).
+
+`app.py` importa `logic` y `ui.*` antes de pintar nada, y `stale_guard` repite esos imports
+en cada despliegue sin reinicio. yfinance, curl_cffi, numpy_financial, fpdf, pdfplumber,
+google.genai, openpyxl y altair solo hacen falta al analizar, exportar o dibujar una vista
+concreta: se importan dentro de la función que los usa. Este test corre el mismo grafo de
+imports que `app.py` en un proceso limpio y falla si alguno vuelve al arranque, o si el
+total se sale del presupuesto.
+"""
+import os
+import subprocess
+import sys
+
+_RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+# Lo que `app.py` importa antes de `st.set_page_config`.
+_ARRANQUE = "import stale_guard, logic; from ui import carga, chrome, pie, validacion, vistas"
+
+_PEREZOSOS = ("yfinance", "curl_cffi", "numpy_financial", "fpdf", "pdfplumber",
+              "google.genai", "openpyxl", "altair")
+
+# Segundos. Medido en ~0.95 s (pandas+pyarrow ~0.5, streamlit ~0.2); antes de sacar los
+# imports perezosos del arranque eran ~1.2 s. Holgado a propósito: la guardia fina es
+# `_PEREZOSOS`, esto solo atrapa una regresión gruesa.
+PRESUPUESTO_S = 2.0
+
+
+def _importtime() -> dict:
+    """{módulo: microsegundos acumulados} del arranque, en un intérprete nuevo."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _ARRANQUE],
+                          cwd=_RAIZ, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    tiempos = {}
+    for linea in proc.stderr.splitlines():
+        if not linea.startswith("import time:") or "imported package" in linea:
+            continue
+        _, acumulado, modulo = linea[len("import time:"):].split("|")
+        tiempos[modulo[1:].rstrip()] = int(acumulado)   # la sangría marca la profundidad
+    return tiempos
+
+
+def test_arranque_sin_dependencias_perezosas_y_dentro_del_presupuesto():
+    tiempos = _importtime()
+    cargados = {m.strip() for m in tiempos}
+    arriba = [m for m in _PEREZOSOS if m in cargados]
+    assert not arriba, f"el arranque volvió a importar {arriba} — van dentro de la función que los usa"
+
+    # Solo los de nivel superior: el acumulado de cada uno ya incluye a sus hijos.
+    total_s = sum(us for m, us in tiempos.items() if not m.startswith(" ")) / 1e6
+    assert total_s < PRESUPUESTO_S, f"import del arranque: {total_s:.2f} s (> {PRESUPUESTO_S} s)"
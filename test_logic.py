@@ -5,12 +5,14 @@ import sys
 
 import pandas as pd
 import pytest
+import yfinance
 from streamlit.testing.v1 import AppTest
 
 sys.path.insert(0, os.path.dirname(__file__))
 import backtest
 import logic
 import price_cache
+import result_cache
 from ui.adapters import _tiene_datos, trg_real_data
 from ui.heredadas import _agregados, _cuadricula_roc_consolidada
 from ui.validacion import _separar_excluidos
@@ -158,6 +160,32 @@ def test_ib_activity_statement_dividend_present():
         assert "Dividend" in df["Action"].values or len(df) > 0
 
 
+def test_ib_activity_statement_withholding_and_repeated_sections():
+    """Secciones repetidas con headers distintos (p. ej. dos cuentas) y la sección Withholding
+    Tax: cada bloque usa su propio header; las filas de total y lo que no es acción (Forex) se descartan."""
+    raw = (
+        b"\xef\xbb\xbfStatement,Header,Field Name,Field Value\n"
+        b"Statement,Data,BrokerName,Interactive Brokers LLC\n"
+        + IB_ACTIVITY_STATEMENT +
+        b"Withholding Tax,Header,Currency,Date,Description,Amount,Code\n"
+        b"Withholding Tax,Data,USD,2024-01-20,MSFT(US123) Cash Dividend - US Tax,-22.50,\n"
+        b"Withholding Tax,Data,Total,,,-22.50,\n"
+        b"Open Positions,Header,Symbol,Quantity\n"
+        b"Open Positions,Data,MSFT,10\n"
+        b"Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,"
+        b"Quantity,Proceeds,T. Price\n"
+        b'Trades,Data,Order,Stocks,USD,KO,"2024-02-01, 10:00:00","-1,000",61000.00,61.00\n'
+        b'Trades,Data,Order,Forex,USD,EUR.USD,"2024-02-01, 10:00:00",1000,-1085.00,1.085\n'
+    )
+    df = logic.parse_ibkr_csv(raw)
+    assert df["Action"].tolist() == ["Buy", "Sell", "Dividend", "Dividend - Foreign Tax Withholding"]
+    ko = df[df["Ticker"] == "KO"].iloc[0]
+    assert (ko["Quantity"], ko["Price"], ko["Amount"]) == (1000.0, 61.0, 61000.0)
+    wht = df[df["Action"] == "Dividend - Foreign Tax Withholding"].iloc[0]
+    assert (wht["Ticker"], wht["Amount"]) == ("MSFT", -22.50)
+    assert df["Amount"].dtype == float
+
+
 # ── parse_schwab_csv ───────────────────────────────────────────────────────────
 
 def test_schwab_parsed():
@@ -187,6 +215,164 @@ def test_normalize_schwab_output():
     assert len(df_clean) > 0
 
 
+# ── CSV genérico — encoding y separador detectados una sola vez ─────────────
+
+_GENERIC_ROWS = ("Fecha{s}Operación{s}Símbolo{s}Cantidad{s}Monto\n"
+                 "2024-01-05{s}Buy{s}SCHD{s}10{s}\"1.234,50\"\n"
+                 "2024-02-05{s}Cash Dividend{s}SCHD{s}{s}\"7,10\"\n")
+
+
+def test_generic_csv_excel_semicolon_cp1252():
+    raw = _GENERIC_ROWS.format(s=";").encode("cp1252")
+    df, broker = logic.load_and_detect_csv(FakeFile(raw))
+    assert broker == "generic"
+    assert list(df.columns) == ["Fecha", "Operación", "Símbolo", "Cantidad", "Monto"]
+    assert df["Monto"].tolist() == ["1.234,50", "7,10"]
+
+
+@pytest.mark.parametrize("encoding,sep", [("utf-8-sig", "\t"), ("utf-16", ",")])
+def test_generic_csv_bom_not_glued_to_first_column(encoding, sep):
+    """Antes el BOM quedaba pegado a 'Fecha' (UTF-8) o el UTF-16 se leía como latin1."""
+    raw = _GENERIC_ROWS.format(s=sep).encode(encoding)
+    df, _ = logic.load_and_detect_csv(FakeFile(raw))
+    assert df.columns[0] == "Fecha"
+    assert logic.normalize_csv(df)["Amount"].tolist() == [1234.5, 7.1]
+
+
+# ── read_xlsx_transactions — Excel en streaming ──────────────────────────────
+
+def _xlsx_bytes(hojas: dict) -> bytes:
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for titulo, filas in hojas.items():
+        ws = wb.create_sheet(titulo)
+        for fila in filas:
+            ws.append(fila)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def test_read_xlsx_picks_transaction_sheet_and_needed_columns():
+    import datetime as dt
+    raw = _xlsx_bytes({
+        "Resumen": [["Portafolio de prueba"], ["Generado", dt.datetime(2024, 6, 1)]],
+        "Movimientos": [
+            ["Reporte de movimientos"],
+            [],
+            ["Fecha", "Operación", "Símbolo", "Cantidad", "Precio", "Monto", "Notas"],
+            [dt.datetime(2024, 1, 5), "Buy", "SCHD", 10, 75.5, -755, "primera compra"],
+            [],
+            [dt.datetime(2024, 3, 20), "Cash Dividend", "SCHD", None, None, 6.1, None],
+        ],
+    })
+    avisos = []
+    crudo = logic.read_xlsx_transactions(raw, progress=avisos.append)
+    assert list(crudo.columns) == ["Fecha", "Operación", "Símbolo", "Cantidad", "Precio", "Monto"]
+    assert len(crudo) == 2
+    assert avisos[-1] == 1.0
+
+    df = logic.normalize_csv(crudo)
+    assert df["Date"].tolist() == [pd.Timestamp("2024-01-05"), pd.Timestamp("2024-03-20")]
+    assert df["Amount"].tolist() == [-755.0, 6.1]
+    assert df["Quantity"].tolist() == [10.0, 0.0]
+
+
+def test_read_xlsx_unreadable_returns_empty():
+    assert logic.read_xlsx_transactions(b"no es un zip").empty
+
+
+# ── merge_transaction_frames — varios exports que se solapan ──────────────────
+
+def _limpio(raw):
+    df, broker = logic.load_and_detect_csv(FakeFile(raw))
+    return logic.normalize_csv(df), broker
+
+
+def test_merge_drops_overlap_between_schwab_exports_keeps_real_repeats():
+    """El export nuevo repite el dividendo del borde; las dos compras idénticas del mismo día
+    (reales, en un solo archivo) se conservan ambas."""
+    viejo = (
+        b'"Date","Action","Symbol","Description","Quantity","Price","Fees & Comm","Amount"\n'
+        b'"05/08/2026","Cash Dividend","SCHD","SCHWAB US DIVIDEND ETF","","","","75.00"\n'
+        b'"04/01/2026","Buy","SCHD","SCHWAB US DIVIDEND ETF","10","27.50","","-275.00"\n'
+        b'"04/01/2026","Buy","SCHD","SCHWAB US DIVIDEND ETF","10","27.50","","-275.00"\n'
+    )
+    nuevo = (
+        b'"Date","Action","Symbol","Description","Quantity","Price","Fees & Comm","Amount"\n'
+        b'"06/08/2026","Cash Dividend","SCHD","SCHWAB US DIVIDEND ETF","","","","80.00"\n'
+        b'"05/08/2026","Cash Dividend","SCHD","SCHWAB US DIVIDEND ETF","","","","75.00"\n'
+        b'"04/01/2026","Buy","SCHD","SCHWAB US DIVIDEND ETF","10","27.50","","-275.00"\n'
+    )
+    (a, ba), (b, bb) = _limpio(viejo), _limpio(nuevo)
+    df, rep = logic.merge_transaction_frames([("viejo.csv", a, ba), ("nuevo.csv", b, bb)])
+    assert len(df) == 4
+    assert (df["Action"] == "Buy").sum() == 2
+    assert rep["duplicates"] == 2 and rep["rows_in"] == 6 and rep["rows_out"] == 4
+    assert [f["added"] for f in rep["files"]] == [3, 1]
+    assert rep["broker"] == "schwab"
+
+
+def test_merge_schwab_and_ib_reports_mixed_broker_and_unreadable_file():
+    (s, bs), (i, bi) = _limpio(SCHWAB_CSV), _limpio(IB_TH_CSV)
+    df, rep = logic.merge_transaction_frames(
+        [("schwab.csv", s, bs), ("ib.csv", i, bi), ("roto.csv", pd.DataFrame(), "generic")])
+    assert len(df) == len(s) + len(i)
+    assert rep["broker"] == "mixto" and rep["brokers"] == ["schwab", "ibkr"]
+    assert rep["files"][2]["error"] and rep["duplicates"] == 0
+
+
+# ── canonical_transactions — tabla tipada de `_wizard_df_clean` ───────────────
+
+def test_canonical_transactions_schema_and_action_kinds():
+    limpio, _ = _limpio(SCHWAB_CSV)
+    extra = pd.DataFrame({
+        "Date": pd.to_datetime(["2026-05-02"] * 5),
+        "Action": ["Reinvest Shares", "Reinvest Dividend", "NRA Tax Adj", "Journaled Shares", "Stock Split"],
+        "Ticker": ["SCHD"] * 5, "Quantity": [1.0, 0, 0, -3, 0], "Price": 0.0,
+        "Amount": [-27.5, 27.5, -8.25, 0, 0],
+    })
+    df = logic.canonical_transactions(pd.concat([limpio, extra], ignore_index=True))
+    assert logic.transaction_schema_errors(df) == []
+    assert str(df["Ticker"].dtype) == "category" and df["ActionKind"].dtype == "int8"
+    kinds = dict(zip(df["Action"].astype(str), df["ActionKind"]))
+    assert kinds == {
+        "Cash Dividend": logic.TXN_DIVIDEND, "Buy": logic.TXN_BUY,
+        "Reinvest Shares": logic.TXN_DRIP, "Reinvest Dividend": logic.TXN_DRIP,
+        "NRA Tax Adj": logic.TXN_TAX, "Journaled Shares": logic.TXN_DEPOSIT,
+        "Stock Split": logic.TXN_OTHER,
+    }
+    assert logic.transaction_schema_errors(limpio)  # la salida cruda de normalize_csv no lo es
+
+
+def test_canonical_transactions_same_analysis_as_normalized(monkeypatch):
+    limpio, _ = _limpio(
+        b'"Date","Action","Symbol","Description","Quantity","Price","Fees & Comm","Amount"\n'
+        b'"05/20/2026","NRA Tax Adj","SCHD","SCHWAB US DIVIDEND ETF","","","","-4.50"\n'
+        b'"05/20/2026","Reinvest Shares","SCHD","SCHWAB US DIVIDEND ETF","0.5","30.00","","-15.00"\n'
+        b'"05/20/2026","Reinvest Dividend","SCHD","SCHWAB US DIVIDEND ETF","","","","15.00"\n'
+        b'"05/08/2026","Cash Dividend","SCHD","SCHWAB US DIVIDEND ETF","","","","75.00"\n'
+        b'"05/01/2026","Sell","MSTY","YIELDMAX MSTR OPTION INCOME ETF","2","20.00","","40.00"\n'
+        b'"04/01/2026","Buy","MSTY","YIELDMAX MSTR OPTION INCOME ETF","10","20.00","","-200.00"\n'
+        b'"04/01/2026","Buy","SCHD","SCHWAB US DIVIDEND ETF","10","27.50","","-275.00"\n'
+    )
+
+    def mock_fetch(ticker, start_date):
+        idx = pd.bdate_range("2026-03-01", "2026-06-30")
+        return pd.DataFrame({"Close": 100.0, "Dividends": 0.0, "Stock Splits": 0.0,
+                             "VOO Price": 500.0}, index=idx), None, "yahoo"
+
+    monkeypatch.setattr(logic, "fetch_market_data", mock_fetch)
+    crudo = logic.analyze_portfolio(limpio.copy(), version="TEST_CANON_A")
+    canon = logic.analyze_portfolio(logic.canonical_transactions(limpio), version="TEST_CANON_B")
+    assert set(crudo) == set(canon)
+    for tk in crudo:
+        assert "shares_owned" in crudo[tk]
+        for campo in ("shares_owned", "pocket_investment", "dividends_collected_cash", "roi_percent"):
+            assert canon[tk].get(campo) == pytest.approx(crudo[tk].get(campo), nan_ok=True)
+
+
 def test_ib_sell_negative_qty_shares_counted_correctly():
     """
     IB Transaction History guarda sells con Quantity negativa (ej. -35).
@@ -390,7 +576,7 @@ def test_ib_negative_dividend_corrections_reduce_total(monkeypatch):
             {"Close": [20.0], "Dividends": [0.0], "Stock Splits": [0.0], "VOO Price": [500.0]},
             index=[pd.Timestamp("2025-08-15")],
         )
-        return data, None
+        return data, None, "yahoo"
 
     monkeypatch.setattr(logic, "fetch_market_data", mock_fetch)
     results = logic.analyze_portfolio(df_clean, version="TEST_DIV_NEG")
@@ -420,7 +606,7 @@ def test_cony_portfolio_analysis(monkeypatch):
             {"Close": [31.434], "Dividends": [0.0], "Stock Splits": [0.0], "VOO Price": [450.0]},
             index=[pd.Timestamp("2026-03-15")],
         )
-        return data, None
+        return data, None, "yahoo"
 
     monkeypatch.setattr(logic, "fetch_market_data", mock_fetch)
     results = logic.analyze_portfolio(df_clean, version="TEST_RUN")
@@ -446,7 +632,7 @@ def test_roc_calculation_with_ib_cost_basis(monkeypatch):
             {"Close": [20.0], "Dividends": [0.0], "Stock Splits": [0.0]},
             index=[pd.Timestamp("2024-10-15")],
         )
-        return data, None
+        return data, None, "yahoo"
 
     monkeypatch.setattr(logic, "fetch_market_data", mock_fetch)
 
@@ -469,7 +655,7 @@ def _roc_norm_df(rows):
 
 
 _MKT_MOCK = lambda t, d: (pd.DataFrame({"Close": [20.0], "Dividends": [0.0], "Stock Splits": [0.0]},
-                                       index=[pd.Timestamp("2024-10-15")]), None)
+                                       index=[pd.Timestamp("2024-10-15")]), None, "yahoo")
 
 
 def test_roc_includes_reinvested_drip(monkeypatch):
@@ -490,6 +676,32 @@ def test_roc_includes_reinvested_drip(monkeypatch):
     assert s["roc_source"] == "broker"
 
 
+def test_analyze_portfolio_heavy_fields_are_lazy(monkeypatch):
+    """El ingreso mensual se calcula al leerlo y la copia serializada (la que reparte
+    st.cache_data) viaja sin él. Las series de mercado van copiadas en el resultado: leerlas
+    no depende de `_MARKET_FRAMES` ni vuelve a pedir mercado."""
+    import pickle
+    df = _roc_norm_df([
+        ("2024-09-01", "Buy", "MSTY", 100, -2000.0),
+        ("2024-10-01", "Dividend", "MSTY", 0, 250.0),
+    ])
+    pedidos = []
+    monkeypatch.setattr(logic, "fetch_market_data", lambda t, d: pedidos.append(t) or _MKT_MOCK(t, d))
+    s = logic.analyze_portfolio(df, version="TEST_LAZY_FIELDS")["MSTY"]
+    assert isinstance(s, dict)
+    assert s.pending() == ["monthly_income"]
+    copia = pickle.loads(pickle.dumps(s))
+    assert copia.pending() == s.pending()
+
+    n = len(pedidos)
+    logic._MARKET_FRAMES.clear()                           # tope, recarga o snapshot
+    assert s["fund_close_series"].tolist() == [20.0]
+    assert s.get("monthly_income").to_dict() == {"2024-10": 250.0}
+    assert len(pedidos) == n                               # sin volver a pedir mercado
+    assert dict(copia)["fund_dividends_series"].tolist() == [0.0]
+    assert copia.pending() == []
+
+
 def test_roc_estimated_from_19a_when_no_basis(monkeypatch):
     """Sin costo base del bróker, se estima el ROC con el % publicado por el fondo (19a),
     empatando por fecha. roc_source == '19a'."""
@@ -553,7 +765,7 @@ def test_roc_none_when_no_basis_provided(monkeypatch):
             {"Close": [20.0], "Dividends": [0.0], "Stock Splits": [0.0]},
             index=[pd.Timestamp("2024-10-15")],
         )
-        return data, None
+        return data, None, "yahoo"
 
     monkeypatch.setattr(logic, "fetch_market_data", mock_fetch)
     results = logic.analyze_portfolio(df_clean, version="TEST_ROC_NONE")
@@ -598,6 +810,12 @@ def test_clean_val_plain_formats():
     assert _norm_amounts(["300"]) == [300.0]
 
 
+def test_clean_val_mixed_column_decides_each_cell():
+    """La limpieza es por columna, pero cada celda conserva su propio formato."""
+    assert _norm_amounts(["1,234.56", "12.500,00", "$ 2,34", "", "abc\nx", "-1,000.5"]) == \
+        [1234.56, 12500.0, 2.34, 0.0, 0.0, -1000.5]
+
+
 # ── Regresión: is_held_too_briefly con ventas negativas (IB) ────────────────
 
 def test_held_too_briefly_ib_negative_sell():
@@ -748,6 +966,37 @@ def test_net_transfer_pairs_keeps_unpaired_journal_out():
     assert (out["Action"] == "Journaled Shares").any()
 
 
+def test_net_transfer_pairs_one_to_one_within_tolerance():
+    """Dos salidas iguales y una sola entrada: empareja una sola vez (la primera salida);
+    una diferencia < 1e-6 acciones sigue contando como la misma cantidad."""
+    df = pd.DataFrame({
+        "Date": pd.to_datetime(["2024-05-13"] * 4),
+        "Action": ["Journaled Shares", "Journaled Shares", "Internal Transfer", "Journaled Shares"],
+        "Ticker": ["SCHB", "SCHB", "SCHB", "VTI"],
+        "Quantity": [-3.0, -3.0, 3.0000004, -1.0],
+    })
+    out = logic._net_transfer_pairs(df)
+    assert list(out.index) == [1, 2, 3]
+
+
+def test_net_transfer_pairs_10k_legs_is_linear():
+    import time
+
+    import numpy as np
+    n = 5000
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(n) % 200, "D")
+    tickers = [f"T{i % 50}" for i in range(n)]
+    qty = (np.arange(n) % 37 + 1).astype(float)
+    df = pd.concat([
+        pd.DataFrame({"Date": dates, "Action": "Journaled Shares", "Ticker": tickers, "Quantity": -qty}),
+        pd.DataFrame({"Date": dates, "Action": "Internal Transfer", "Ticker": tickers, "Quantity": qty}),
+    ], ignore_index=True).sample(frac=1, random_state=1).reset_index(drop=True)
+    t0 = time.perf_counter()
+    out = logic._net_transfer_pairs(df)
+    assert time.perf_counter() - t0 < 1.0
+    assert len(out) == n and (out["Action"] == "Internal Transfer").all()
+
+
 # ── Sortino con downside deviation estándar ─────────────────────────────────────
 
 def test_sortino_ratio_downside_deviation():
@@ -779,7 +1028,7 @@ def _mock_price_30(ticker, start_date):
         {"Close": [30.0], "Dividends": [0.0], "Stock Splits": [0.0], "VOO Price": [500.0]},
         index=[pd.Timestamp("2025-08-15")],
     )
-    return data, None
+    return data, None, "yahoo"
 
 
 def test_reconciliation_overrides_incomplete_position(monkeypatch):
@@ -1315,6 +1564,42 @@ def test_observed_tax_refund_by_year_detects_positive_rows():
         [{'Date': '2025-11-15', 'Action': 'Cash Dividend', 'Amount': 12}])) == {}
 
 
+def test_fiscal_ledger_rows_and_shared_ledger():
+    hist = _div_hist([
+        {'Date': '2024-12-15', 'Action': 'Reinvest Dividend', 'Amount': 50},
+        {'Date': '2024-12-15', 'Action': 'Reinvest Shares', 'Amount': -35},    # compra → fuera
+        {'Date': '2024-12-15', 'Action': 'NRA Tax Adj', 'Amount': -15},
+        {'Date': '2025-03-15', 'Action': 'Dividend - Foreign Tax Withholding', 'Amount': -3},
+        {'Date': '2025-04-10', 'Action': 'NRA Tax Adj', 'Amount': 6},
+        {'Date': None, 'Action': 'Cash Dividend', 'Amount': 8},               # sin fecha
+        {'Date': '2025-05-01', 'Action': 'Buy', 'Amount': -100},               # fuera
+    ])
+    led = logic.fiscal_ledger(hist)
+    assert tuple(led.columns) == logic.FISCAL_LEDGER_COLUMNS
+    assert led['amount'].tolist() == [50, -15, -3, 6, 8]
+    assert led['is_dividend'].tolist() == [True, False, True, False, True]
+    assert led['netted'].tolist() == [False, False, True, False, False]
+    assert led['withheld'].tolist() == [0, 15, 3, 0, 0]
+    assert led['refund'].tolist() == [0, 0, 0, 6, 0]
+    assert led['year'].isna().tolist() == [False] * 4 + [True]
+
+    # Con el ledger ya armado (`led=`) los helpers dan lo mismo que construyéndolo.
+    for kw in ({}, {'led': led}):
+        assert logic._csv_dividends_in_window(hist, **kw) == pytest.approx(55.0)
+        assert logic._csv_dividends_by_year(hist, **kw) == {2024: 50.0, 2025: -3.0}
+        assert logic.withheld_at_payment_by_year(hist, **kw) == {2024: 15.0, 2025: 3.0}
+        assert logic.withheld_tax_total(hist, **kw) == pytest.approx(12.0)
+
+    # Sin caché: editar una fila del medio se ve en el siguiente ledger.
+    hist.loc[hist.index[2], 'Amount'] = -20
+    assert logic.fiscal_ledger(hist)['withheld'].tolist() == [0, 20, 3, 0, 0]
+
+    # Desde un resultado se usa el ledger guardado con él, no uno reconstruido.
+    h, l = logic._result_ledger({'history': hist, 'fiscal_ledger': led})
+    assert h is hist and l is led
+    assert logic._result_ledger({'history': hist})[1]['withheld'].tolist()[1] == 20
+
+
 def test_forward_realized_yield_distinguishes_headline_from_collected():
     # Pagos mensuales decrecientes: último pago anualizado (forward) > lo cobrado en 12m (realizado).
     rows = [{'Date': f'2025-{m:02d}-15', 'Action': 'Cash Dividend', 'Amount': amt}
@@ -1403,6 +1688,75 @@ def test_project_income_goal_milestone():
     assert out['portfolio'].get('income_goal_year') is not None
 
 
+def test_simulate_forward_batch_matches_closed_form_drip():
+    # Sin aportes, sin impuesto y precio/dividendo planos, el DRIP compone las acciones a
+    # (1 + y/12)^m: la recurrencia vectorizada tiene que dar exactamente eso.
+    sim = logic._simulate_forward_batch([100.0, 50.0], [20.0, 10.0], [12.0, 60.0], 24, drip=True)
+    assert sim['shares'].shape == (2, 24)
+    assert sim['shares'][0, -1] == pytest.approx(100 * (1 + 0.12 / 12) ** 24)
+    assert sim['shares'][1, -1] == pytest.approx(50 * (1 + 0.60 / 12) ** 24)
+    nodrip = logic._simulate_forward_batch(100.0, 20.0, 12.0, 24, drip=False)
+    assert nodrip['shares'][0, -1] == pytest.approx(100.0)
+    assert nodrip['value'][0, -1] == pytest.approx(2000 + 24 * 20.0)   # $20/mes en efectivo
+
+
+def test_project_many_tickers_matches_one_at_a_time():
+    # La pasada conjunta (activos × meses) no mezcla activos: cada ticker proyecta igual que
+    # si fuera el único del portafolio (sin aporte, que sí se reparte entre los elegibles).
+    results = {f'T{i}': {'forward_yield': 5.0 + i, 'shares_owned': 10.0 + i,
+                         'current_price': 20.0 + i, 'price_cagr_recent': -i * 2.0,
+                         'roc_percent': 50.0}
+               for i in range(50)}
+    cm = {tk: ('mode_a' if i % 2 else 'mode_b') for i, tk in enumerate(results)}
+    params = {'horizon_years': 30, 'drip': True, 'tax_rate_pct': 15, 'price_appreciation_pct': 4}
+    out = logic.project_portfolio_forward(results, params, classify_map=cm)
+    for tk in ('T0', 'T7', 'T49'):
+        solo = logic.project_portfolio_forward({tk: results[tk]}, params, classify_map=cm)
+        assert out['per_ticker'][tk] == solo['per_ticker'][tk]
+    assert len(out['portfolio']['yearly']) == 30
+    assert out['portfolio']['yearly'][-1]['portfolio_value'] == pytest.approx(
+        sum(e['yearly'][-1]['portfolio_value'] for e in out['per_ticker'].values()), abs=0.01)
+
+
+def test_project_partial_year_horizon_keeps_whole_years_only():
+    results = {'SCHD': {'forward_yield': 4.0, 'shares_owned': 100, 'current_price': 80.0}}
+    out = logic.project_portfolio_forward(results, {'horizon_years': 2.5},
+                                          classify_map={'SCHD': 'mode_b'})
+    assert [r['year'] for r in out['per_ticker']['SCHD']['yearly']] == [1, 2]
+    assert out['params']['months'] == 30
+
+
+def test_sweep_projection_matches_one_projection_per_combination():
+    results = {
+        'MSTY': {'forward_yield': 60.0, 'shares_owned': 100, 'current_price': 20.0,
+                 'price_cagr_recent': -30.0, 'underlying_cagr_recent': -20.0, 'roc_percent': 70.0},
+        'SCHD': {'forward_yield': 4.0, 'shares_owned': 200, 'current_price': 80.0},
+    }
+    cm = {'MSTY': 'mode_a', 'SCHD': 'mode_b'}
+    grid = {'horizon_years': [2, 5], 'monthly_contribution': [0, 300], 'drip': [True, False],
+            'country': [None, 'México'], 'scenario': {'base': None, 'alcista': {'MSTY': 60.0}}}
+    df = logic.sweep_projection(results, grid, {'income_goal_monthly': 400}, classify_map=cm)
+    assert len(df) == 2 * 2 * 2 * 2 * (2 + 5)            # una fila por combinación × año
+    for (hz, c, drip, country, scen), g in df.groupby(
+            ['horizon_years', 'monthly_contribution', 'drip', 'country', 'scenario'], dropna=False):
+        country = None if country != country else country
+        pf = logic.project_portfolio_forward(
+            results, {'horizon_years': hz, 'monthly_contribution': c, 'drip': drip,
+                      'country': country, 'income_goal_monthly': 400,
+                      'underlying_scenarios': grid['scenario'][scen]}, classify_map=cm)['portfolio']
+        assert g[['year', 'portfolio_value', 'annual_income', 'cumulative_dividends',
+                  'cumulative_contributions']].to_dict('records') == pf['yearly']
+        last = g.iloc[-1]
+        for k in ('end_value', 'end_value_nodrip', 'drip_advantage', 'cumulative_dividends_net'):
+            assert last[k] == pytest.approx(pf[k], abs=0.01)
+
+
+def test_sweep_projection_empty_without_eligible_assets():
+    df = logic.sweep_projection({'X': {'forward_yield': 0, 'shares_owned': 1, 'current_price': 1}},
+                                {'horizon_years': [1, 2]})
+    assert df.empty and 'portfolio_value' in df.columns
+
+
 # ── v3.1: detección de cambio de cadencia + decaimiento de ventana reciente ──
 
 def _payment_hist(dates_amounts):
@@ -1606,6 +1960,57 @@ def test_monte_carlo_real_view_below_nominal():
     assert real['final']['p50'] < nom['final']['p50']
 
 
+def _goal_portfolio():
+    results = {
+        'MSTY': {'forward_yield': 60.0, 'shares_owned': 100, 'current_price': 20.0,
+                 'price_cagr_recent': -25.0, 'volatilidad_anualizada': 80.0},
+        'SCHD': {'forward_yield': 4.0, 'shares_owned': 100, 'current_price': 80.0,
+                 'price_cagr_recent': 6.0, 'volatilidad_anualizada': 18.0},
+    }
+    return results, {'MSTY': 'mode_a', 'SCHD': 'mode_b'}
+
+
+def test_solve_income_goal_min_contribution_is_tight():
+    # El aporte resuelto cumple la meta con los mismos caminos (seed) que el Monte Carlo y
+    # un dólar menos ya no: es el mínimo, no una cota cualquiera.
+    results, cm = _goal_portfolio()
+    params = {'horizon_years': 10, 'income_goal_monthly': 1000, 'price_appreciation_pct': 6}
+    sol = logic.solve_income_goal(results, params, cm, target_prob_pct=80, seed=1)
+    assert sol['reachable'] and sol['value'] > 0
+    assert sol['evaluations'] <= 6                     # un puñado de pasadas, no decenas
+    at = logic.monte_carlo_projection(results, {**params, 'monthly_contribution': sol['value']},
+                                      classify_map=cm, seed=1)
+    below = logic.monte_carlo_projection(
+        results, {**params, 'monthly_contribution': sol['value'] - 1.0}, classify_map=cm, seed=1)
+    assert at['prob_goal'] >= 80 > below['prob_goal']
+
+
+def test_solve_income_goal_zero_when_already_reached_and_none_when_unreachable():
+    results, cm = _goal_portfolio()
+    easy = logic.solve_income_goal(results, {'horizon_years': 5, 'income_goal_monthly': 1},
+                                   cm, seed=2)
+    assert easy['value'] == 0.0 and easy['evaluations'] == 1
+    # Un año es muy poco para cobrar $10M/mes, aporte lo que aporte (techo de la búsqueda).
+    hard = logic.solve_income_goal(results, {'horizon_years': 1, 'income_goal_monthly': 1e7},
+                                   cm, seed=2)
+    assert hard['reachable'] is False and hard['value'] is None
+    assert logic.solve_income_goal(results, {'horizon_years': 5}, cm)['value'] is None  # sin meta
+    with pytest.raises(ValueError, match="solve_for"):
+        logic.solve_income_goal(results, {'income_goal_monthly': 1}, cm, solve_for='horizonte')
+
+
+def test_solve_income_goal_shortest_horizon():
+    results, cm = _goal_portfolio()
+    params = {'monthly_contribution': 500, 'income_goal_monthly': 1000,
+              'price_appreciation_pct': 6}
+    sol = logic.solve_income_goal(results, params, cm, solve_for='horizon',
+                                  target_prob_pct=80, seed=1)
+    assert sol['reachable'] and sol['evaluations'] == 1
+    by_year = {r['year']: r['prob_goal'] for r in sol['prob_by_year']}
+    assert by_year[sol['value']] >= 80
+    assert all(by_year[y] < 80 for y in range(1, sol['value']))
+
+
 # ── v3.3: winsorización de retornos (fix de volatilidad corrupta por transferencias) ──
 
 def test_winsorize_clips_spurious_spike():
@@ -1639,12 +2044,12 @@ def _mock_flat50(monkeypatch):
     sin dividendos, para que el benchmark sea determinista (yf.download trae VOO de la red real)."""
     def mock_fetch(ticker, start_date):
         return pd.DataFrame({'Close': [50.0] * len(_XFER_IDX), 'Dividends': [0.0] * len(_XFER_IDX),
-                             'Stock Splits': [0.0] * len(_XFER_IDX)}, index=_XFER_IDX), None
+                             'Stock Splits': [0.0] * len(_XFER_IDX)}, index=_XFER_IDX), None, "yahoo"
     def mock_download(ticker, **kwargs):
         return pd.DataFrame({'Close': [50.0] * len(_XFER_IDX), 'Dividends': [0.0] * len(_XFER_IDX)},
                             index=_XFER_IDX)
     monkeypatch.setattr(logic, 'fetch_market_data', mock_fetch)
-    monkeypatch.setattr(logic.yf, 'download', mock_download)
+    monkeypatch.setattr(yfinance, 'download', mock_download)
 
 
 def test_benchmark_includes_share_transfer(monkeypatch):
@@ -2306,7 +2711,7 @@ def test_triple_comparison_reinvierte_dividendos(monkeypatch):
     def _mkt(ticker, start):
         idx = pd.to_datetime(["2024-09-02", "2024-09-03"])
         df = pd.DataFrame({"Close": [100.0, 100.0], "Dividends": [0.0, 10.0]}, index=idx)
-        return df, None
+        return df, None, "yahoo"
 
     monkeypatch.setattr(logic, "fetch_market_data", _mkt)
     flows = json.dumps([["2024-09-01", 1000.0]])
@@ -3033,7 +3438,7 @@ def test_weekend_purchase_keeps_cost_curve(monkeypatch):
              "Stock Splits": [0.0, 0.0, 0.0], "VOO Price": [500.0, 500.0, 500.0]},
             index=idx,
         )
-        return data, None
+        return data, None, "yahoo"
 
     monkeypatch.setattr(logic, "fetch_market_data", mock_fetch)
     results = logic.analyze_portfolio(df_clean, version="TEST_WEEKEND_BUY")
@@ -3216,7 +3621,7 @@ render_estrategias(resultados)
 """.format(path=os.path.dirname(os.path.abspath(__file__)))
 
     at = AppTest.from_string(script)
-    at.session_state["_vd_resultados"] = results
+    at.session_state["_vd_resultados"] = result_cache.put(result_cache.new_key("test"), results)
     at.run()
     assert at.exception == [], [e.value for e in at.exception]
 
@@ -3266,7 +3671,7 @@ _render_excluidos(obtener_resultados())
 """.format(path=os.path.dirname(os.path.abspath(__file__)))
 
     at = AppTest.from_string(script)
-    at.session_state["_vd_resultados"] = results
+    at.session_state["_vd_resultados"] = result_cache.put(result_cache.new_key("test"), results)
     at.run()
     assert at.exception == [], [e.value for e in at.exception]
 
@@ -3277,3 +3682,86 @@ _render_excluidos(obtener_resultados())
 
     texto = "\n".join(m.value for m in at.markdown)
     assert "SMH" in texto and "TSLY" in texto and "ACME" in texto
+
+
+# ── Caché negativo y circuito de Yahoo en fetch_market_data ──────────────────────────
+
+def test_fetch_market_data_cachea_el_ticker_inexistente(monkeypatch):
+    """Con Yahoo sano, un símbolo sin datos no vuelve a recorrer la cascada."""
+    llamadas = []
+
+    def sin_datos(ticker, start_date):
+        llamadas.append(ticker)
+        return pd.DataFrame(), "No market data found", "sin_datos"
+
+    monkeypatch.setattr(logic, "_fetch_market_data", sin_datos)
+    for _ in range(3):
+        df, err, fuente = logic.fetch_market_data("zzdelisted", "2024-01-02")
+        assert df.empty and err == "No market data found" and fuente == "sin_datos"
+    assert llamadas == ["zzdelisted"]
+    resultados = {"ZZDELISTED": {"error": "No market data found", "market_source": fuente}}
+    assert logic.market_data_health(resultados)["missing"] == {"ZZDELISTED": "No market data found"}
+    assert not logic.market_degraded(resultados)
+
+
+def test_fetch_market_data_distingue_no_existe_de_yahoo_caido(monkeypatch):
+    """El motivo del vacío sale de las requests de ESA cascada (`http_pool.observe`), no del
+    estado del circuito: un 404 sano es 'sin_datos'; un 429 es 'caido' y no se cachea."""
+    import http_pool
+
+    def cascada(estados):
+        def correr(ticker, start_date):
+            for estado in estados:
+                http_pool._observe(None if estado == 404 else f"HTTP {estado}")
+            return pd.DataFrame(), "No market data found"
+        return correr
+
+    monkeypatch.setattr(logic, "_market_cascade", cascada([404, 404]))
+    assert logic._fetch_market_data("ZZNOEXISTE", "2024-01-02")[2] == "sin_datos"
+    monkeypatch.setattr(logic, "_market_cascade", cascada([404, 429]))
+    assert logic._fetch_market_data("MSTY", "2024-01-02")[2] == "caido"
+    monkeypatch.setattr(logic, "_market_cascade", cascada([]))
+    assert logic._fetch_market_data("MSTY", "2024-01-02")[2] == "caido"
+
+    df, err, fuente = logic.fetch_market_data("ZZSINCACHE", "2024-01-02")
+    assert df.empty and fuente == "caido" and logic._NEGATIVE == {}
+
+
+def test_fetch_market_data_con_circuito_abierto_sirve_lo_guardado(monkeypatch):
+    """Tras N fallos seguidos de Yahoo no se intenta la red: sale del caché de precios (con
+    sus splits) y queda declarado; un vacío por caída no entra al caché negativo."""
+    import http_pool
+    monkeypatch.setattr(logic, "_fetch_market_data",
+                        lambda t, s: pytest.fail("con el circuito abierto no se baja nada"))
+    br = http_pool._breaker("yahoo.com")
+    for _ in range(br.threshold):
+        br.failure("HTTP 429")
+
+    df, err, fuente = logic.fetch_market_data("MSTY", "2025-06-02")
+    assert err is None and not df.empty and fuente == "price_cache"
+    assert df.index.min() >= pd.Timestamp("2025-05-23")
+    assert df.loc["2025-12-08", "Stock Splits"] == pytest.approx(0.2)
+
+    df, err, fuente = logic.fetch_market_data("ZZNOCACHE", "2025-06-02")
+    assert df.empty and "Yahoo Finance no responde (HTTP 429)" in err and fuente == "caido"
+    assert logic._NEGATIVE == {}
+
+    # El panel lee la fuente de cada resultado: otra sesión con Yahoo sano no la cambia.
+    resultados = {"MSTY": {"market_source": "price_cache"},
+                  "SCHD": {"market_source": "yahoo"},
+                  "ZZNOCACHE": {"error": err, "market_source": "caido"}}
+    salud = logic.market_data_health(resultados)
+    assert salud["stale"] == {"MSTY": "price_cache"} and salud["breaker"]["state"] == "open"
+    assert list(salud["down"]) == ["ZZNOCACHE"] and salud["missing"] == {}
+    assert logic.market_degraded(resultados)
+    assert not logic.market_degraded({"SCHD": {"market_source": "yahoo"}})
+
+
+def test_market_store_saca_el_usado_hace_mas_tiempo(monkeypatch):
+    monkeypatch.setattr(logic, "MARKET_STORE_MAX", 2)
+    marco = pd.DataFrame({"Close": [1.0]}, index=pd.DatetimeIndex(["2024-01-02"]))
+    logic._remember_market("A", "2024-01-02", marco)
+    logic._remember_market("B", "2024-01-02", marco)
+    logic._remember_market("A", "2024-01-02", marco)          # A, recién usado
+    logic._remember_market("C", "2024-01-02", marco)
+    assert [t for t, _ in logic._MARKET_FRAMES] == ["A", "C"]
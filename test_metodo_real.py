@@ -37,7 +37,7 @@ def _mkt_mock(precio: float):
     yfinance esté sano: el 2026-08-18 devolvía filas con `Close` = NaN)."""
     return lambda t, d: (pd.DataFrame(
         {"Close": [precio], "Dividends": [0.0], "Stock Splits": [0.0]},
-        index=pd.to_datetime(["2026-01-01"])), None)
+        index=pd.to_datetime(["2026-01-01"])), None, "yahoo")
 
 
 def _resultados(monkeypatch, fixture: str, version: str, precio: float = 20.0):
@@ -229,7 +229,7 @@ def _mkt_mock_con_barra_vacia(precio: float):
         {"Close": [precio, float("nan")],
          "Dividends": [0.0, 0.0],
          "Stock Splits": [0.0, 0.0]},
-        index=pd.to_datetime(["2026-01-01", "2026-01-02"])), None)
+        index=pd.to_datetime(["2026-01-01", "2026-01-02"])), None, "yahoo")
 
 
 def test_precio_ignora_la_barra_en_curso_sin_datos(monkeypatch):
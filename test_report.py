@@ -101,3 +101,71 @@ def test_pdf_unicode_dinamico_en_ticker_no_crashea():
     res["MSTY"]["company_name"] = "Tesla — Option Income"  # campo arbitrario con em-dash
     pdf = generate_report_pdf(res, "ibkr", version="2.0")
     assert pdf[:4] == b"%PDF"
+
+
+def test_todo_broker_de_la_carga_tiene_etiqueta_en_el_pdf():
+    """Una carga de varios archivos guarda `_wizard_broker = 'mixto'`: el encabezado no
+    debe caer al `broker.upper()` ("MIXTO")."""
+    from ui.carga import BROKER_LABEL
+    assert set(BROKER_LABEL) <= set(report.BROKER_LABELS)
+    assert report.BROKER_LABELS["mixto"] == "Varios brokers"
+
+
+def test_huella_solo_cambia_con_lo_que_el_pdf_muestra():
+    """`report_fingerprint` decide si el PDF cacheado sirve: cambia con un campo que el
+    reporte imprime, con el bróker o la versión — y NO con campos que el reporte no lee."""
+    import pandas as pd
+
+    base = _fake_results()
+    h = report.report_fingerprint(base, "ibkr")
+    assert h == report.report_fingerprint(_fake_results(), "ibkr")
+
+    otro = _fake_results()
+    otro["SCHB"]["market_value"] = 1301.0
+    assert report.report_fingerprint(otro, "ibkr") != h
+    assert report.report_fingerprint(base, "schwab") != h
+    assert report.report_fingerprint(base, "ibkr", version="2.1") != h
+
+    pesado = _fake_results()
+    pesado["SCHB"]["daily_trend"] = pd.DataFrame({"x": range(1000)})
+    assert report.report_fingerprint(pesado, "ibkr") == h
+
+    mensual = _fake_results()
+    mensual["MSTY"]["monthly_income"] = pd.Series([10.0], index=["2025-01"])
+    assert report.report_fingerprint(mensual, "ibkr") != h
+
+
+def test_huella_cambia_con_el_codigo_del_reporte(tmp_path, monkeypatch):
+    """Editar `report.py` recarga solo `report`: los bytes cacheados del diseño anterior no
+    pueden seguir sirviéndose."""
+    import shutil
+    copia = tmp_path / "report.py"
+    shutil.copy(report._RUTA_CODIGO, copia)
+    monkeypatch.setattr(report, "_RUTA_CODIGO", str(copia))
+    monkeypatch.setattr(report, "_codigo_memo", {"firma": None, "valor": ""})
+    h = report.report_fingerprint(_fake_results(), "ibkr")
+    assert report.report_fingerprint(_fake_results(), "ibkr") == h
+    with open(copia, "a", encoding="utf-8") as fh:
+        fh.write("\n# otro diseño\n")
+    assert report.report_fingerprint(_fake_results(), "ibkr") != h
+
+
+def test_pdf_solo_se_construye_al_pedirlo(monkeypatch):
+    """`preparar_pdf` no genera nada hasta que la sesión lo pide, y luego lo reusa."""
+    import result_cache
+    from ui import validacion
+
+    llamadas = []
+    monkeypatch.setattr(report, "generate_report_pdf",
+                        lambda r, b, version: llamadas.append(b) or b"%PDF-fake")
+    monkeypatch.setattr(validacion.st, "session_state", {"_wizard_broker": "ibkr"})
+    result_cache.set_cache(result_cache.ResultCache(budget_bytes=10_000_000))
+    try:
+        assert validacion.preparar_pdf(_fake_results()) == (None, "")
+        validacion.pedir_pdf()
+        pdf, nombre = validacion.preparar_pdf(_fake_results())
+        assert pdf == b"%PDF-fake" and nombre.endswith(".pdf")
+        validacion.preparar_pdf(_fake_results())
+        assert llamadas == ["ibkr"]
+    finally:
+        result_cache.set_cache(None)
@@ -0,0 +1,93 @@
+"""Tests de result_cache.py — presupuesto, LRU, derrame a disco y métricas."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(__file__))
+import logic
+import result_cache as rc
+
+
+def _frame(n, texto="x"):
+    return pd.DataFrame({"v": np.arange(n, dtype=float), "s": [texto * 10] * n})
+
+
+def test_sizeof_mide_profundo_y_cuenta_compartidos_una_vez():
+    df = _frame(1000)
+    base = int(df.memory_usage(deep=True).sum())
+    assert rc.sizeof(df) == base
+    # `history` y el argumento del campo perezoso son el mismo objeto: cuenta una vez,
+    # y medir no dispara el cálculo.
+    r = logic.TickerResult({"history": df,
+                            "monthly_income": logic.LazyField("monthly_income", "X", df, "mode_b")})
+    assert base < rc.sizeof({"A": r}) < 2 * base
+    assert r.pending() == ["monthly_income"]
+
+
+def test_lru_respeta_el_presupuesto():
+    tam = rc.sizeof(_frame(1000))
+    c = rc.ResultCache(budget_bytes=int(tam * 2.5))
+    for k in ("a", "b", "c"):
+        c.put(k, _frame(1000))
+    assert c.get("a") is None                      # el de uso más antiguo salió
+    c.get("b")                                     # b pasa a ser el más reciente
+    c.put("d", _frame(1000))
+    assert c.get("c") is None and c.get("b") is not None
+    st = c.stats()
+    assert st["entries"] == 2 and st["bytes"] <= st["budget"] and st["evictions"] == 2
+    assert st["misses"] == 2
+
+    # Una entrada que sola excede el presupuesto se queda (quien la pidió la necesita).
+    c.put("grande", _frame(10_000))
+    assert c.get("grande") is not None and c.stats()["entries"] == 1
+
+
+def test_derrame_a_disco_y_vuelta(tmp_path):
+    tam = rc.sizeof(_frame(1000))
+    c = rc.ResultCache(budget_bytes=int(tam * 1.5), spill_dir=str(tmp_path))
+    original = _frame(1000, "a")
+    c.put("a", original)
+    c.put("b", _frame(1000, "b"))                  # desaloja "a" → disco
+    assert c.stats()["spills"] == 1 and len(os.listdir(tmp_path)) == 1
+
+    back = c.get("a")
+    pd.testing.assert_frame_equal(back, original)
+    st = c.stats()
+    assert st["spill_hits"] == 1 and st["evictions"] == 2   # al volver desalojó a "b"
+    assert c.get("b") is not None                  # "b" también vuelve de disco
+    c.clear()
+    assert os.listdir(tmp_path) == [] and c.stats()["bytes"] == 0
+
+
+def test_get_or_put_no_guarda_none():
+    c = rc.ResultCache(budget_bytes=10_000_000)
+    llamadas = []
+    assert c.get_or_put("k", lambda: llamadas.append(1)) is None
+    assert c.get_or_put("k", lambda: llamadas.append(1) or {"ok": 1}) == {"ok": 1}
+    assert c.get_or_put("k", lambda: llamadas.append(1)) == {"ok": 1}
+    assert len(llamadas) == 2
+
+
+def test_get_or_put_calcula_una_vez_con_sesiones_concurrentes():
+    import threading
+    import time
+
+    c = rc.ResultCache(budget_bytes=10_000_000)
+    llamadas = []
+
+    def producir():
+        llamadas.append(1)
+        time.sleep(0.05)
+        return {"datos": 1}
+
+    salidas = []
+    hilos = [threading.Thread(target=lambda: salidas.append(c.get_or_put("k", producir)))
+             for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert len(llamadas) == 1
+    assert len(salidas) == 8 and all(s is salidas[0] for s in salidas)
@@ -217,7 +217,7 @@ def test_render_metodologia_inyecta_datos_reales(monkeypatch):
     componentes.render_metodologia("Claro", datos=datos)
 
     assert "html" in capturado, "render_metodologia no llamó a components.html"
-    assert json.dumps(datos, ensure_ascii=False) in capturado["html"], (
+    assert json.dumps(datos, ensure_ascii=False, separators=(",", ":")) in capturado["html"], (
         "el DATA_JSON inyectado no es el `datos` que se pasó")
     assert "{{DATA_JSON}}" not in capturado["html"], "quedó el placeholder sin reemplazar"
 
@@ -243,7 +243,7 @@ def test_vistas_metodologia_reusa_el_cache_de_metodo_data():
     mismo caso de estudio fijo sería trabajo duplicado."""
     with open(os.path.join(os.path.dirname(__file__), "ui", "vistas.py"), encoding="utf-8") as f:
         src = f.read()
-    ocurrencias = src.count('st.session_state.get("_vd_metodo_data")')
+    ocurrencias = src.count('_en_cache("_vd_metodo_data", "metodo_data", metodo_data)')
     assert ocurrencias >= 2, (
         "la rama de metodología ya no reusa `_vd_metodo_data` — volvería a bajar "
         "la historia del caso de estudio por separado")
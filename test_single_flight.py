@@ -0,0 +1,85 @@
+"""Tests de single_flight.py — una descarga por clave con sesiones concurrentes."""
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import pytest
+import yfinance
+
+sys.path.insert(0, os.path.dirname(__file__))
+import logic
+import single_flight as sf
+
+
+def _a_la_vez(n, fn):
+    salidas, errores = [], []
+    barrera = threading.Barrier(n)
+
+    def correr():
+        barrera.wait()
+        try:
+            salidas.append(fn())
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=correr) for _ in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return salidas, errores
+
+
+def test_llamadas_concurrentes_comparten_una_ejecucion():
+    g = sf.SingleFlight()
+    llamadas = []
+
+    def lento():
+        llamadas.append(1)
+        time.sleep(0.1)
+        return {"datos": 1}
+
+    salidas, _ = _a_la_vez(6, lambda: g.do("MSTY", lento))
+    assert len(llamadas) == 1
+    assert all(v is salidas[0][0] for v, _ in salidas)
+    assert sorted(c for _, c in salidas) == [False] + [True] * 5
+    assert g.stats() == dict(calls=6, executions=1, coalesced=5, errors=0, inflight=0)
+
+    g.do("MSTY", lento)                             # no es caché: terminada, se vuelve a ejecutar
+    assert len(llamadas) == 2
+
+
+def test_el_error_llega_a_todos_y_no_queda_en_vuelo():
+    g = sf.SingleFlight()
+
+    def falla():
+        time.sleep(0.1)
+        raise ConnectionError("rate limited")
+
+    salidas, errores = _a_la_vez(4, lambda: g.do("k", falla))
+    assert not salidas and len(errores) == 4
+    assert g.stats()["errors"] == 1 and g.stats()["inflight"] == 0
+    assert g.do("k", lambda: 1) == (1, False)
+
+
+def test_fetch_market_data_una_descarga_y_copias_independientes(monkeypatch):
+    descargas = []
+
+    def download(ticker, **kw):
+        descargas.append(ticker)
+        time.sleep(0.1)
+        idx = pd.date_range("2024-01-02", periods=3)
+        return pd.DataFrame({"Close": [1.0, 2.0, 3.0], "Dividends": 0.0}, index=idx)
+
+    monkeypatch.setattr(yfinance, "download", download)
+    antes = sf.group("market_data").stats()["coalesced"]
+    salidas, errores = _a_la_vez(5, lambda: logic.fetch_market_data("SCHD", "2024-01-12"))
+    assert not errores and descargas == ["SCHD"]
+    assert sf.group("market_data").stats()["coalesced"] - antes == 4
+    assert {fuente for _, _, fuente in salidas} == {"yahoo"}
+    marcos = [df for df, _, _ in salidas]
+    assert len({id(df) for df in marcos}) == 5     # cada sesión puede mutar el suyo
+    marcos[0].loc[:, "Close"] = 0.0
+    assert marcos[1]["Close"].tolist() == [1.0, 2.0, 3.0]
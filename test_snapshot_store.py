@@ -0,0 +1,125 @@
+"""Tests de snapshot_store.py — deterministas, sin red, en un directorio temporal.
+
+Lo que importa: que un resultado vuelva IDÉNTICO (tipos incluidos: claves int, tuplas,
+Timestamp, escalares numpy, frames con su índice), que la clave cambie sola cuando cambia el
+código o el conocimiento, y que TTL y tope de tamaño borren lo que deben.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import snapshot_store as ss
+
+
+@pytest.fixture
+def store(tmp_path):
+    be = ss.LocalSnapshotBackend(str(tmp_path))
+    ss.set_backend(be)
+    yield be
+    ss.set_backend(None)
+
+
+def _txns():
+    return pd.DataFrame({
+        "Date": pd.to_datetime(["2024-01-05", "2024-02-05"]),
+        "Action": pd.Categorical(["Buy", "Cash Dividend"]),
+        "Ticker": pd.Categorical(["SCHD", "SCHD"]),
+        "Amount": [-755.0, 6.1],
+    })
+
+
+def _resultado():
+    idx = pd.date_range("2024-01-01", periods=5, freq="D")
+    return {
+        "SCHD": {
+            "current_price": np.float64(27.5),
+            "shares_owned": 10.0,
+            "history_incomplete": False,
+            "gross_by_year": {2024: 6.1},
+            "cash_flows_dated": [(pd.Timestamp("2024-01-05"), -755.0)],
+            "csv_inception_yf": pd.Timestamp("2011-10-20").date(),
+            "history": _txns(),
+            "daily_trend": pd.DataFrame({"Market Value": np.linspace(755, 780, 5)}, index=idx),
+            "monthly_income": pd.Series([6.1], index=["2024-02"], name="Amount"),
+            "roi_percent": float("nan"),
+            "error_note": None,
+        },
+    }
+
+
+def test_roundtrip_exacto(store):
+    df, res = _txns(), _resultado()
+    assert ss.save(df, res)
+    back = ss.load(df)
+    s, b = res["SCHD"], back["SCHD"]
+    assert list(b) == list(s)
+    assert type(b["current_price"]) is np.float64 and b["current_price"] == 27.5
+    assert b["gross_by_year"] == {2024: 6.1}
+    assert b["cash_flows_dated"] == [(pd.Timestamp("2024-01-05"), -755.0)]
+    assert b["csv_inception_yf"] == s["csv_inception_yf"]
+    assert np.isnan(b["roi_percent"]) and b["error_note"] is None
+    pd.testing.assert_frame_equal(b["history"], s["history"])
+    pd.testing.assert_frame_equal(b["daily_trend"], s["daily_trend"])   # incluye freq='D'
+    pd.testing.assert_series_equal(b["monthly_income"], s["monthly_income"])
+
+
+def test_clave_por_contenido_y_version(store, monkeypatch):
+    df = _txns()
+    ss.save(df, _resultado())
+    assert ss.load(df.copy()) is not None                  # mismo contenido, otro objeto
+    otro = df.copy()
+    otro.loc[1, "Amount"] = 6.2
+    assert ss.load(otro) is None
+
+    # Un deploy (logic.py o knowledge/ distintos) invalida sin borrar nada a mano.
+    monkeypatch.setattr(ss, "code_version", lambda: "otra-version")
+    assert ss.load(df) is None
+
+
+def test_ttl_y_tope_de_tamano(store, monkeypatch):
+    a, b = _txns(), _txns().assign(Amount=[-1.0, 1.0])
+    ss.save(a, _resultado())
+    time.sleep(0.01)
+    ss.save(b, _resultado())
+
+    # Tope de tamaño: sobrevive solo el de uso más reciente.
+    tamano = max(size for *_, size in store.entries())
+    monkeypatch.setattr(ss, "_max_bytes", lambda: tamano)
+    ss.evict()
+    assert ss.load(a) is None and ss.load(b) is not None
+
+    # TTL: vencido → no se devuelve y se borra.
+    monkeypatch.setattr(ss, "_ttl_seconds", lambda: -1)
+    assert ss.load(b) is None
+    assert store.entries() == []
+
+
+def test_desactivado_sin_configuracion(monkeypatch):
+    monkeypatch.delenv("SNAPSHOT_LOCAL_DIR", raising=False)
+    monkeypatch.setattr(ss, "_secrets", lambda: {})
+    ss.set_backend(None)
+    assert not ss.is_enabled()
+    assert ss.save(_txns(), _resultado()) is False
+    assert ss.load(_txns()) is None
+
+
+def test_campos_perezosos_se_guardan_pendientes(store):
+    import logic
+    hist = _txns()
+    res = {"SCHD": logic.TickerResult({
+        "history": hist,
+        "monthly_income": logic.LazyField("monthly_income", "SCHD", hist, "mode_b"),
+    })}
+    assert ss.save(hist, res)
+    assert res["SCHD"].pending() == ["monthly_income"]    # guardar no obliga a calcular
+
+    back = ss.load(hist)["SCHD"]
+    assert isinstance(back, logic.TickerResult) and back.pending() == ["monthly_income"]
+    assert back["monthly_income"].to_dict() == {"2024-02": 6.1}
+    assert back.pending() == []
+
@@ -6,6 +6,7 @@ Vigilar la fecha del archivo lo detecta; vigilar símbolos no.
 """
 
 import os
+import re
 
 import pytest
 
@@ -13,19 +14,29 @@ import stale_guard
 
 
 @pytest.fixture(autouse=True)
-def _guardian_limpio():
-    """Cada test parte sin fechas anotadas y deja el registro como estaba."""
-    previas = dict(stale_guard._fechas)
+def _guardian_limpio(monkeypatch):
+    """Cada test parte sin fechas anotadas, sin esperar el intervalo entre revisiones, y
+    deja el registro como estaba."""
+    previas = dict(stale_guard._fechas), dict(stale_guard._huellas)
     stale_guard._fechas.clear()
+    stale_guard._huellas.clear()
+    monkeypatch.setattr(stale_guard, "INTERVALO_S", 0.0)
+    monkeypatch.setattr(stale_guard, "_ultima_revision", None)
     yield
     stale_guard._fechas.clear()
-    stale_guard._fechas.update(previas)
+    stale_guard._fechas.update(previas[0])
+    stale_guard._huellas.clear()
+    stale_guard._huellas.update(previas[1])
 
 
 @pytest.fixture
-def fecha_restaurada():
-    """Permite mover la fecha de un archivo y la devuelve a su valor real al terminar."""
+def fecha_restaurada(monkeypatch):
+    """Simula una edición: mueve la fecha de un archivo y hace que su hash cambie (el
+    contenido real no se toca). Devuelve la fecha a su valor real al terminar."""
     tocados = {}
+    huella_real = stale_guard._huella
+    monkeypatch.setattr(stale_guard, "_huella",
+                        lambda ruta: huella_real(ruta) + ("-editado" if ruta in tocados else ""))
 
     def tocar(ruta, desplazamiento=120):
         if ruta not in tocados:
@@ -112,7 +123,7 @@ def test_recarga_todo_el_grafo_no_solo_el_archivo_tocado(fecha_restaurada):
 
 
 def test_recarga_en_orden_de_dependencias(fecha_restaurada):
-    """`ui.vistas` importa nombres sueltos de adapters/chrome/componentes: va después."""
+    """`ui.vistas` importa nombres sueltos de adapters/chrome/estado: va después."""
     import logic  # noqa: F401
     from ui import carga, chrome, pie, vistas  # noqa: F401
 
@@ -123,7 +134,7 @@ def test_recarga_en_orden_de_dependencias(fecha_restaurada):
 
     for antes, despues in (("logic", "ui.adapters"), ("logic", "ui.heredadas"),
                            ("ui.adapters", "ui.vistas"), ("ui.chrome", "ui.vistas"),
-                           ("ui.componentes", "ui.vistas"), ("ui.heredadas", "ui.chrome")):
+                           ("ui.estado", "ui.vistas"), ("ui.heredadas", "ui.chrome")):
         assert recargados.index(antes) < recargados.index(despues), \
             f"{despues} se recargó antes que {antes}"
 
@@ -154,11 +165,9 @@ def test_la_app_sigue_viva_despues_de_recargar(fecha_restaurada):
     assert hasattr(sys.modules["ui.vistas"], "render_vista")
 
 
-def test_un_modulo_nuevo_no_se_queda_sin_sitio_en_el_orden():
-    """Anti-rot: si aparece un módulo propio fuera de `_ORDEN`, hay que ubicarlo a mano.
-
-    Se recargaría igual (al final, que es seguro), pero si importa nombres sueltos de
-    otro módulo propio su sitio correcto puede no ser el último. Este test avisa.
+def test_el_grafo_del_arranque_no_tiene_ciclos():
+    """El orden de recarga sale del grafo de imports: con un ciclo no hay orden correcto
+    (alguno de los dos se quedaría con los nombres viejos del otro).
 
     Corre en un subproceso a propósito: dentro de pytest, `sys.modules` acumula lo que
     importan los demás tests (`fetch_roc_19a`, `validate_real_cases`…), que son scripts
@@ -169,20 +178,87 @@ def test_un_modulo_nuevo_no_se_queda_sin_sitio_en_el_orden():
     import sys
 
     sonda = """
-import json, sys
+import json
 import stale_guard
 import logic
 from ui import carga, chrome, pie, vistas
-print(json.dumps(sorted(set(stale_guard.modulos_propios()) - set(stale_guard._ORDEN))))
+grafo = stale_guard.dependencias()
+orden = stale_guard.orden_de_recarga(grafo, grafo)
+print(json.dumps(sorted([n, d] for i, n in enumerate(orden) for d in grafo[n]
+                        if d not in orden[:i])))
 """
     salida = subprocess.run(
         [sys.executable, "-c", sonda],
         cwd=os.path.dirname(os.path.abspath(__file__)),
         capture_output=True, text=True, check=True,
     )
-    sin_sitio = json.loads(salida.stdout.strip().splitlines()[-1])
+    al_reves = json.loads(salida.stdout.strip().splitlines()[-1])
 
-    assert not sin_sitio, (
-        f"módulos propios sin sitio en stale_guard._ORDEN: {sin_sitio}. "
-        "Ubícalos según sus dependencias."
-    )
+    assert not al_reves, f"imports circulares entre módulos de la app: {al_reves}"
+
+
+def test_el_grafo_sale_de_los_imports():
+    from ui import vistas  # noqa: F401
+
+    grafo = stale_guard.dependencias()
+
+    assert {"logic", "ui.adapters", "ui.chrome", "ui.componentes"} <= grafo["ui.vistas"]
+    assert "ui.heredadas" in grafo["ui.chrome"]
+    assert "single_flight" in grafo["logic"]
+    assert not any(m.startswith("ui") for m in grafo["logic"])   # logic no depende de la UI
+
+
+def test_solo_recarga_lo_que_cambio_y_sus_dependientes(fecha_restaurada):
+    """Cambiar una vista no toca `logic` (ni sus cachés en memoria)."""
+    import logic
+    from ui import carga, chrome, pie, vistas  # noqa: F401
+
+    logic._centinela_stale_guard = True
+    stale_guard.asegurar_frescura()
+    fecha_restaurada(_ruta_de("ui.pie"))
+
+    recargados = stale_guard.asegurar_frescura()
+
+    assert recargados[0] == "ui.pie" and "ui.vistas" in recargados
+    assert not {"logic", "ui.adapters", "ui.carga", "ui.chrome"} & set(recargados)
+    assert getattr(logic, "_centinela_stale_guard", False)
+    del logic._centinela_stale_guard
+
+
+def test_fecha_nueva_con_el_mismo_contenido_no_recarga():
+    """Un checkout que reescribe el archivo igual mueve la fecha, no el código."""
+    from ui import adapters  # noqa: F401
+
+    stale_guard.asegurar_frescura()
+    ruta = _ruta_de("ui.adapters")
+    tiempos = (os.path.getatime(ruta), os.path.getmtime(ruta))
+    try:
+        os.utime(ruta, (tiempos[0], tiempos[1] + 120))
+        assert stale_guard.asegurar_frescura() == []
+    finally:
+        os.utime(ruta, tiempos)
+
+
+def test_revisa_el_disco_como_mucho_una_vez_por_intervalo(fecha_restaurada, monkeypatch):
+    from ui import adapters  # noqa: F401
+
+    monkeypatch.setattr(stale_guard, "INTERVALO_S", 3600.0)
+    stale_guard.asegurar_frescura()
+    fecha_restaurada(_ruta_de("ui.adapters"))
+
+    assert stale_guard.asegurar_frescura() == []          # dentro del intervalo: ni mira
+    monkeypatch.setattr(stale_guard, "INTERVALO_S", 0.0)
+    assert "ui.adapters" in stale_guard.asegurar_frescura()
+
+
+def test_cada_recarga_queda_en_el_log_con_su_duracion(fecha_restaurada, capsys):
+    from ui import adapters  # noqa: F401
+
+    stale_guard.asegurar_frescura()
+    fecha_restaurada(_ruta_de("ui.adapters"))
+    stale_guard.asegurar_frescura()
+
+    log = capsys.readouterr().out
+    assert re.search(r"stale_guard: recargado ui\.adapters en \d+ ms", log)
+    assert re.search(r"stale_guard: cambiaron \['ui\.adapters'\]; \d+ módulo\(s\) "
+                     r"recargado\(s\) en \d+ ms", log)
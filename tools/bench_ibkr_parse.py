@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Mide `logic.parse_ibkr_csv` sobre un Activity Statement sintético grande.
+
+Un extracto real de IB de varios años con opciones, FX y cuentas vinculadas llega a decenas
+de MB y cientos de miles de líneas, casi todas de secciones que el análisis no usa (Open
+Positions, Mark-to-Market, Forex Balances…). Este script arma uno así — secciones de relleno
+intercaladas con Trades/Dividends/Withholding Tax, headers repetidos — y reporta tiempo y
+memoria pico (tracemalloc) del parseo. No necesita red ni datos privados.
+
+    python3 tools/bench_ibkr_parse.py [--lines 500000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TICKERS = ["MSFT", "AAPL", "SCHD", "JEPI", "O", "VTI", "TSLY", "NVDY", "KO", "PEP"]
+
+
+def synthetic_statement(n_lines: int) -> bytes:
+    """~`n_lines` líneas: ~10% Trades, ~5% Dividends, ~5% Withholding Tax, resto relleno."""
+    out = [
+        "Statement,Header,Field Name,Field Value",
+        "Statement,Data,BrokerName,Interactive Brokers LLC",
+    ]
+    block = 1000
+    n_blocks = max(1, n_lines // block)
+    for b in range(n_blocks):
+        year = 2015 + b % 10
+        out.append("Mark-to-Market Performance Summary,Header,Asset Category,Symbol,"
+                   "Prior Quantity,Current Quantity,Prior Price,Current Price,Mark-to-Market P/L")
+        for i in range(block * 8 // 10 - 1):
+            tk = TICKERS[i % len(TICKERS)]
+            out.append(f"Mark-to-Market Performance Summary,Data,Stocks,{tk},{i},{i + 1},"
+                       f"{100 + i % 50}.25,{101 + i % 50}.75,\"1,{i % 1000:03d}.50\"")
+        out.append("Trades,Header,DataDiscriminator,Asset Category,Currency,Symbol,Date/Time,"
+                   "Quantity,T. Price,Proceeds,Comm/Fee")
+        for i in range(block // 10 - 1):
+            tk = TICKERS[i % len(TICKERS)]
+            qty = (i % 20 + 1) * (1 if i % 3 else -1)
+            cat = "Stocks" if i % 7 else "Equity and Index Options"
+            out.append(f"Trades,Data,Order,{cat},USD,{tk},\"{year}-0{1 + i % 9}-1{i % 9}, 09:30:00\","
+                       f"{qty},{50 + i % 40}.10,{-qty * (50 + i % 40):.2f},-1.00")
+        out.append("Dividends,Header,Currency,Date,Description,Amount")
+        for i in range(block // 20 - 1):
+            tk = TICKERS[i % len(TICKERS)]
+            out.append(f"Dividends,Data,USD,{year}-0{1 + i % 9}-2{i % 9},"
+                       f"{tk}(US0000000{i % 10}) Cash Dividend USD 0.{i % 90 + 10} per Share,{i % 90 + 10}.00")
+        out.append("Dividends,Data,Total,,,999.00")
+        out.append("Withholding Tax,Header,Currency,Date,Description,Amount,Code")
+        for i in range(block // 20 - 1):
+            tk = TICKERS[i % len(TICKERS)]
+            out.append(f"Withholding Tax,Data,USD,{year}-0{1 + i % 9}-2{i % 9},"
+                       f"{tk}(US0000000{i % 10}) Cash Dividend - US Tax,-{i % 27 + 3}.00,")
+    return ("\n".join(out) + "\n").encode("utf-8")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--lines", type=int, default=500_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    import logic
+
+    raw = synthetic_statement(args.lines)
+    n_lines = raw.count(b"\n")
+    print(f"extracto sintético: {n_lines:,} líneas, {len(raw) / 1e6:.1f} MB")
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        df = logic.parse_ibkr_csv(raw)
+        best = min(best, time.perf_counter() - t0)
+    print(f"parse_ibkr_csv: {best:.2f} s (mejor de {args.repeat}), {len(df):,} filas")
+    print(df["Action"].value_counts().to_string())
+
+    tracemalloc.start()
+    logic.parse_ibkr_csv(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"memoria pico (tracemalloc, sin contar el input): {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
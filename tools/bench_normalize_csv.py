@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Mide la ingesta de un CSV genérico sintético de 200k filas: `logic.load_and_detect_csv`
+(detección de encoding/separador + parseo) y `logic.normalize_csv`.
+
+El CSV imita un export de Excel en español (separador ';', cp1252) y trae lo que complica la
+limpieza: filas de metadatos antes del encabezado (para que corra la detección de header),
+montos con formato US ("1,234.56"), europeo ("1.234,56"), con "$" y vacíos. No necesita red
+ni datos privados.
+
+    python3 tools/bench_normalize_csv.py [--rows 200000] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+
+TICKERS = ["MSFT", "AAPL", "SCHD", "JEPI", "O", "VTI", "TSLY", "NVDY", "KO", "PEP"]
+
+
+def synthetic_csv(n_rows: int, seed: int = 0, sep: str = ",", encoding: str = "utf-8") -> bytes:
+    rng = np.random.default_rng(seed)
+    qty = rng.integers(1, 5000, n_rows) / 10
+    price = rng.integers(100, 100_000, n_rows) / 100
+    amount = qty * price
+    formato = rng.integers(0, 4, n_rows)
+    montos = np.where(formato == 0, [f"{a:,.2f}" for a in amount],
+                      np.where(formato == 1,
+                               [f"{a:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+                                for a in amount],
+                               np.where(formato == 2, [f"$ {a:.2f}" for a in amount], "")))
+    df = pd.DataFrame({
+        "Fecha": pd.Timestamp("2015-01-01") + pd.to_timedelta(rng.integers(0, 3650, n_rows), "D"),
+        "Operación": rng.choice(["Buy", "Sell", "Cash Dividend", "Reinvest Shares"], n_rows),
+        "Símbolo": rng.choice(TICKERS, n_rows),
+        "Cantidad": qty,
+        "Precio": price,
+        "Monto": montos,
+    })
+    cuerpo = df.to_csv(index=False, sep=sep)
+    vacias = sep * 4
+    return (f"Reporte de movimientos{sep}{vacias}\nGenerado{sep}2026-10-01{vacias[1:]}\n"
+            + cuerpo).encode(encoding)
+
+
+class _Subida(io.BytesIO):
+    """Lo mínimo de un UploadedFile de Streamlit que usa `load_and_detect_csv`."""
+    name = "export.csv"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    import logic
+
+    raw = synthetic_csv(args.rows, sep=";", encoding="cp1252")
+    print(f"CSV sintético: {args.rows:,} filas, {len(raw) / 1e6:.1f} MB")
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        crudo, broker = logic.load_and_detect_csv(_Subida(raw))
+        best = min(best, time.perf_counter() - t0)
+    print(f"load_and_detect_csv: {best:.2f} s (mejor de {args.repeat}), broker {broker}, "
+          f"{crudo.shape[0]:,}×{crudo.shape[1]}")
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        limpio = logic.normalize_csv(crudo.copy())
+        best = min(best, time.perf_counter() - t0)
+    print(f"normalize_csv: {best:.2f} s (mejor de {args.repeat}), {len(limpio):,} filas, "
+          f"columnas {list(limpio.columns)}")
+
+
+if __name__ == "__main__":
+    main()
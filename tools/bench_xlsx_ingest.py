@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Compara `pd.read_excel` (la ruta anterior) contra `logic.read_xlsx_transactions` sobre un
+.xlsx sintético de transacciones: tiempo y memoria pico (tracemalloc).
+
+El libro imita un export armado a mano en Excel: filas de título antes del encabezado,
+columnas que el análisis no usa (Comisión, Notas) y fechas como celdas de fecha. No necesita
+red ni datos privados.
+
+    python3 tools/bench_xlsx_ingest.py [--rows 100000] [--repeat 2]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_xlsx(n_rows: int, seed: int = 0) -> bytes:
+    from bench_normalize_csv import synthetic_csv
+    df = pd.read_csv(io.BytesIO(synthetic_csv(n_rows, seed)), skiprows=2)
+    df["Fecha"] = pd.to_datetime(df["Fecha"])
+    df["Comisión"] = 0.65
+    df["Notas"] = "importado desde el broker"
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        df.to_excel(writer, sheet_name="Movimientos", index=False, startrow=2)
+    return buf.getvalue()
+
+
+def _medir(nombre, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nombre}: {best:.2f} s (mejor de {repeat}), pico {peak / 1e6:.0f} MB, "
+          f"{out.shape[0]:,}×{out.shape[1]}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--repeat", type=int, default=2)
+    args = ap.parse_args()
+
+    import logic
+
+    raw = synthetic_xlsx(args.rows)
+    print(f"xlsx sintético: {args.rows:,} filas, {len(raw) / 1e6:.1f} MB")
+    _medir("pd.read_excel", lambda: pd.read_excel(io.BytesIO(raw)), args.repeat)
+    _medir("read_xlsx_transactions", lambda: logic.read_xlsx_transactions(raw), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -42,10 +42,11 @@ import tempfile
 
 import openpyxl
 import pdfplumber
-import requests
 import yaml
 
 HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+import http_pool   # noqa: E402
 OUT_PATH = os.path.join(HERE, "knowledge", "roc_ici.yaml")
 
 BASE_URL = ("https://yieldmaxetfs.com/wp-content/uploads/TaxDocuments/"
@@ -104,7 +105,7 @@ def download_all(dest_dir):
     paths = {}
     for doc in ICI_DOCS:
         dest = os.path.join(dest_dir, doc["filename"])
-        resp = requests.get(doc["url"], headers=_BROWSER_HEADERS, timeout=60)
+        resp = http_pool.get(doc["url"], headers=_BROWSER_HEADERS, timeout=60)
         resp.raise_for_status()
         with open(dest, "wb") as fh:
             fh.write(resp.content)
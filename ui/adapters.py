@@ -11,9 +11,13 @@ El mapa cifra→campo está en `specs/port-artifact/mapa-datos.md` § 1, verific
 from __future__ import annotations
 
 import datetime
+import hashlib
+import json
 import math
+import os
 import typing
 
+import numpy as np
 import pandas as pd
 
 import backtest
@@ -613,7 +617,190 @@ def _mensualizar_desde(serie, origen, decimales: int = 4) -> dict:
     return out
 
 
-def comparacion_data() -> dict | None:
+# Puntos por serie que una gráfica diaria manda al navegador (ver `reducir_serie`). ~500
+# sobran para un ancho de 1000-1200 px; el diario completo de 3 años × 5 estrategias eran
+# ~5,500 puntos por render, y crece con la historia.
+PUNTOS_GRAFICA = 500
+
+
+def reducir_serie(serie: pd.Series, puntos: int = PUNTOS_GRAFICA, conservar=()) -> pd.Series:
+    """`serie` diaria reducida a unos `puntos` para graficar, sin cambiarle la forma.
+
+    Largest-Triangle-Three-Buckets: parte la serie en cubetas y de cada una se queda con
+    el punto que forma el triángulo de mayor área con el elegido en la cubeta anterior y el
+    promedio de la siguiente — los picos y valles sobreviven, a diferencia de tomar uno de
+    cada N o promediar. Los valores que quedan son los EXACTOS de esos días, no
+    interpolados.
+
+    Además se conservan siempre el primer y el último punto y los días de `conservar`
+    (compras, ex-dividendo, splits): ahí la línea salta por un evento real, y un gráfico que
+    lo suavice contaría otra historia. Por eso el resultado puede tener algo más de
+    `puntos`. Si los días a conservar pasan de la mitad de `puntos`, se quedan los de mayor
+    salto respecto al día anterior: el presupuesto de puntos se sigue cumpliendo. Sin
+    `DatetimeIndex` el eje es la posición y `conservar` no aplica. Los NaN se descartan antes
+    de elegir. Una serie que ya cabe se devuelve tal cual.
+    """
+    serie = serie.dropna()
+    n = len(serie)
+    if puntos < 3 or n <= puntos:
+        return serie
+    fijos = np.zeros(n, dtype=bool)
+    if isinstance(serie.index, pd.DatetimeIndex):
+        x = serie.index.asi8.astype(float)
+        if len(conservar):
+            fijos = serie.index.normalize().isin(pd.DatetimeIndex(list(conservar)).normalize())
+    else:
+        x = np.arange(n, dtype=float)
+    y = serie.to_numpy(dtype=float)
+    tope = max(puntos // 2, 2)
+    if fijos.sum() > tope:
+        salto = np.abs(np.diff(y, prepend=y[0]))
+        idx = np.flatnonzero(fijos)
+        fijos = np.zeros(n, dtype=bool)
+        fijos[idx[np.argsort(salto[idx], kind="stable")[::-1][:tope - 2]]] = True
+    fijos[0] = fijos[-1] = True
+
+    cubetas = max(puntos - int(fijos.sum()), 1)
+    bordes = np.linspace(1, n - 1, min(cubetas, n - 2) + 1).astype(int)
+    elegidos = fijos.copy()
+    a = 0
+    for i in range(len(bordes) - 1):
+        ini, fin = bordes[i], bordes[i + 1]
+        sig = slice(fin, bordes[i + 2]) if i + 2 < len(bordes) else slice(n - 1, n)
+        cx, cy = x[sig].mean(), y[sig].mean()
+        areas = np.abs((x[a] - cx) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (cy - y[a]))
+        a = ini + int(np.argmax(areas))
+        elegidos[a] = True
+    return serie[elegidos]
+
+
+def _cache_vencido(cobertura: dict) -> bool:
+    """¿Algún ticker del caché de precio pasó `DEFAULT_MAX_STALENESS_DAYS`? Entonces
+    `price_cache.load_history` baja de yfinance en vivo y lo calculado sobre el caché ya no
+    es lo que se calcularía hoy."""
+    for meta in cobertura.values():
+        edad = price_cache._cache_age_days((meta or {}).get("generated_at"))
+        if edad is None or edad > price_cache.DEFAULT_MAX_STALENESS_DAYS:
+            return True
+    return False
+
+
+def version_datos_compartidos() -> str:
+    """Versión de lo que alimenta `comparacion_data`, `metodo_data` y `metodo_serie_data`.
+
+    Ninguna de las tres depende del portafolio del usuario, así que se calculan una vez
+    por proceso (`ui.vistas._en_cache`) bajo una clave que cambia solo cuando cambian sus
+    entradas: el `generated_at` de cada ticker del caché de precio y los yaml de
+    `knowledge/` (19a, ICI, instrumentos). Si algún ticker del caché está vencido,
+    `price_cache.load_history` cae a yfinance en vivo y la cifra cambia de un día a otro:
+    entonces la fecha de hoy entra también en la clave.
+
+    También entra el contenido del código que arma los payloads (`_huella_codigo`):
+    `stale_guard` recarga solo los módulos que dependen del archivo editado y `result_cache`
+    no es uno de ellos, así que sin esto las sesiones seguían recibiendo el payload que armó
+    el código anterior hasta que el LRU lo sacara.
+    """
+    cobertura = price_cache.cache_coverage()
+    partes = [f"{tk}={(meta or {}).get('generated_at')}"
+              for tk, meta in sorted(cobertura.items())]
+    partes.append(f"codigo={_huella_codigo()}")
+    base = os.path.dirname(price_cache.CACHE_DIR)
+    for nombre in sorted(os.listdir(base)):
+        if nombre.endswith((".yaml", ".yml")):
+            st_ = os.stat(os.path.join(base, nombre))
+            partes.append(f"{nombre}={st_.st_mtime_ns}:{st_.st_size}")
+    if _cache_vencido(cobertura):
+        partes.append(datetime.date.today().isoformat())
+    return hashlib.sha256("|".join(partes).encode()).hexdigest()[:16]
+
+
+# Payloads precalculados de las tres vistas de arriba. Los escribe `build_view_payloads.py`
+# en los workflows de refresco semanal, justo después de bajar el caché de precio o el 19a:
+# sus entradas solo cambian ahí. Cada archivo es {"inputs": huella_entradas(),
+# "generated_at": ..., "payload": <lo que devuelve la función>}.
+VISTAS_PRECALCULADAS = ("comparacion_data", "metodo_data", "metodo_serie_data")
+PAYLOADS_DIR = os.path.join(os.path.dirname(price_cache.CACHE_DIR), "view_payloads")
+# El código que convierte esas entradas en el payload: un cambio aquí también lo invalida.
+_CODIGO_ENTRADA = ("ui/adapters.py", "backtest.py", "price_cache.py", "logic.py")
+_RAIZ_CODIGO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_huella_memo: dict = {"firma": None, "valor": None}
+_huella_codigo_memo: dict = {"firma": None, "valor": None}
+
+
+def _huella_codigo() -> str:
+    """Hash del contenido de `_CODIGO_ENTRADA`. Como `huella_entradas`, se relee solo si
+    cambió algún mtime/tamaño; un archivo que falta cuenta como vacío."""
+    rutas = [(r, os.path.join(_RAIZ_CODIGO, *r.split("/"))) for r in _CODIGO_ENTRADA]
+    firma = []
+    for etiqueta, ruta in rutas:
+        try:
+            st_ = os.stat(ruta)
+            firma.append((etiqueta, st_.st_mtime_ns, st_.st_size))
+        except OSError:
+            firma.append((etiqueta, None, None))
+    firma = tuple(firma)
+    if firma != _huella_codigo_memo["firma"]:
+        h = hashlib.sha256()
+        for etiqueta, ruta in rutas:
+            try:
+                with open(ruta, "rb") as fh:
+                    contenido = fh.read()
+            except OSError:
+                contenido = b""
+            h.update(etiqueta.encode() + b"\0" + contenido + b"\0")
+        _huella_codigo_memo.update(firma=firma, valor=h.hexdigest()[:16])
+    return _huella_codigo_memo["valor"]
+
+
+def _archivos_entrada() -> list[tuple[str, str]]:
+    """(etiqueta, ruta) de cada archivo del que dependen las vistas precalculadas."""
+    base = os.path.dirname(price_cache.CACHE_DIR)
+    archivos = [(f"price_cache/{n}", os.path.join(price_cache.CACHE_DIR, n))
+                for n in sorted(os.listdir(price_cache.CACHE_DIR))]
+    archivos += [(n, os.path.join(base, n)) for n in sorted(os.listdir(base))
+                 if n.endswith((".yaml", ".yml"))]
+    archivos += [(r, os.path.join(_RAIZ_CODIGO, *r.split("/"))) for r in _CODIGO_ENTRADA]
+    return archivos
+
+
+def huella_entradas() -> str | None:
+    """Hash del CONTENIDO de las entradas de las vistas precalculadas: el caché de precio,
+    los yaml de `knowledge/` y `_CODIGO_ENTRADA`. A diferencia de
+    `version_datos_compartidos` no usa mtimes — tiene que dar lo mismo en el runner de CI
+    que en el checkout del deploy. Se relee solo si cambió algún mtime/tamaño. `None` si
+    falta algún archivo."""
+    try:
+        archivos = _archivos_entrada()
+        firma = tuple((e, os.stat(r).st_mtime_ns, os.stat(r).st_size) for e, r in archivos)
+        if firma != _huella_memo["firma"]:
+            h = hashlib.sha256()
+            for etiqueta, ruta in archivos:
+                with open(ruta, "rb") as fh:
+                    h.update(etiqueta.encode() + b"\0" + fh.read() + b"\0")
+            _huella_memo.update(firma=firma, valor=h.hexdigest()[:16])
+        return _huella_memo["valor"]
+    except OSError:
+        return None
+
+
+def _precalculado(nombre: str) -> dict | None:
+    """Payload precalculado de la vista `nombre`, o `None` si no sirve: no existe, se
+    generó sobre otras entradas (`huella_entradas`), o el caché está vencido — en ese caso
+    la función en vivo bajaría de yfinance y el payload ya no es lo que calcularía hoy."""
+    if _cache_vencido(price_cache.cache_coverage()):
+        return None
+    try:
+        with open(os.path.join(PAYLOADS_DIR, f"{nombre}.json"), encoding="utf-8") as fh:
+            doc = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    huella = huella_entradas()
+    if huella is None or not isinstance(doc, dict) or doc.get("inputs") != huella:
+        return None
+    return doc.get("payload")
+
+
+def comparacion_data(precalculado: bool = True) -> dict | None:
     """JSON para `ui/componentes/comparacion.html` (Total Return Graph · Simulación).
 
     Mismo patrón de índice mensual (`origen`/`last`/`idx[modo][tk][m]`) que
@@ -658,7 +845,14 @@ def comparacion_data() -> dict | None:
     Devuelve `None` solo si NINGÚN ticker del universo pudo cargar historia (ni caché ni
     yfinance en vivo) — la vista entera se degrada con un aviso explícito en vez de
     dibujar un gráfico vacío o a medias.
+
+    Con `precalculado=True` devuelve primero el payload que dejó
+    `build_view_payloads.py`, si sus entradas son las de hoy (ver `_precalculado`).
     """
+    if precalculado:
+        datos = _precalculado("comparacion_data")
+        if datos is not None:
+            return datos
     historias: dict[str, price_cache.HistoryResult] = {}
     for tk in TRG_UNIVERSO:
         try:
@@ -842,7 +1036,7 @@ def _tmtot_ejemplo(ratios: list[dict]) -> str | None:
     return max(candidatos, key=lambda r: r["ret"])["t"]
 
 
-def metodo_data() -> dict | None:
+def metodo_data(precalculado: bool = True) -> dict | None:
     """JSON para `ui/componentes/metodo.html` (Método tradicional · La matriz, Fase
     3.3b). Reemplaza los `var MATRIZ`/`var ROC_19A` congelados que tenía el componente
     (copiados a mano de la hoja fechada 5/1/2026, ya desfasados del yaml vivo) por
@@ -913,7 +1107,13 @@ def metodo_data() -> dict | None:
         cobrados sobre lo aportado; retorno de precio) — lo que publicó el emisor
         (`dr`/`sec`/`x`/`trc`/`tra` del panel Tasa) se queda literal y fechado en el
         componente, porque no hay fuente viva de 30-Day SEC Yield en el repo.
+
+    `precalculado`: como en `comparacion_data`.
     """
+    if precalculado:
+        datos = _precalculado("metodo_data")
+        if datos is not None:
+            return datos
     filas = []
     fuente: dict[str, str] = {}
     asof_candidatos = []
@@ -1341,7 +1541,7 @@ def _politica_fiscal(ticker: str, modo: str, roc19a: dict, roc_ici: dict,
     return _PoliticaFiscal(base_rate, _roc_pct_by_year(ticker, roc19a, roc_ici))
 
 
-def metodo_serie_data() -> dict | None:
+def metodo_serie_data(precalculado: bool = True) -> dict | None:
     """JSON para la tercera matriz de «Método tradicional · La matriz»: las 6 curvas de
     la cartera del caso de estudio en el tiempo (eje X = mes, eje Y = dólares).
 
@@ -1385,7 +1585,13 @@ def metodo_serie_data() -> dict | None:
 
     Devuelve `None` con el mismo criterio que `metodo_data`: si alguno de los 5 tickers
     no cargó historia, la lección queda coja y no hay «cartera parcial» que dibujar.
+
+    `precalculado`: como en `comparacion_data`.
     """
+    if precalculado:
+        datos = _precalculado("metodo_serie_data")
+        if datos is not None:
+            return datos
     historias: dict[str, pd.DataFrame] = {}
     fuente: dict[str, str] = {}
     asof_candidatos: list[str] = []
@@ -99,14 +99,57 @@ def notificar_progreso(con_datos: bool) -> None:
 
 # ── Flujo ─────────────────────────────────────────────────────────────────────
 
+_XLSX_BARRA_BYTES = 2 * 1024 * 1024   # desde este tamaño el .xlsx muestra barra de progreso
+
+
 def _leer_transacciones(archivo) -> tuple:
-    """Parseo del CSV/Excel — misma ruta que `app_old.py`, sin lógica propia."""
+    """Parseo del CSV/Excel. El .xlsx se lee en streaming (`logic.read_xlsx_transactions`),
+    con barra de progreso si el archivo es grande."""
     if archivo.name.endswith(".xlsx"):
-        import pandas as pd
-        return pd.read_excel(archivo), "generic"
+        barra = None
+        if getattr(archivo, "size", 0) >= _XLSX_BARRA_BYTES:
+            barra = st.progress(0.0, text=f"Leyendo {archivo.name}…")
+        try:
+            crudo = logic.read_xlsx_transactions(archivo, progress=barra.progress if barra else None)
+        finally:
+            if barra is not None:
+                barra.empty()
+        return crudo, "generic"
     return logic.load_and_detect_csv(archivo)
 
 
+def _fusionar_transacciones(archivos) -> tuple:
+    """Lee y normaliza cada archivo por separado (cada uno con su broker detectado) y los
+    fusiona con `logic.merge_transaction_frames`, que descarta el solapamiento entre exports.
+    Un archivo ilegible no tumba a los demás: queda en el reporte con su `error`."""
+    limpios = []
+    for archivo in archivos:
+        try:
+            crudo, broker = _leer_transacciones(archivo)
+            limpio = logic.normalize_csv(crudo) if not crudo.empty else crudo
+        except Exception:                                          # noqa: BLE001
+            if len(archivos) == 1:
+                raise
+            limpio, broker = None, "generic"
+        limpios.append((archivo.name, limpio, broker))
+    return logic.merge_transaction_frames(limpios)
+
+
+def _detalle_fusion(reporte: dict) -> str:
+    """Una línea por archivo fusionado: filas aportadas, duplicados descartados y rango."""
+    partes = []
+    for f in reporte["files"]:
+        if f["error"]:
+            partes.append(f"{f['name']}: no se pudo leer ({f['error']})")
+            continue
+        rango = f" · {f['first_date']} → {f['last_date']}" if f["first_date"] else ""
+        partes.append(f"{f['name']}: {f['added']} filas nuevas, "
+                      f"{f['duplicates']} ya incluidas{rango}")
+    return (f"{reporte['rows_out']} transacciones de {len(reporte['files'])} archivos "
+            f"({reporte['duplicates']} duplicadas por solapamiento descartadas).  \n"
+            + "  \n".join(partes))
+
+
 def _resumen_por_ticker(df_limpio) -> dict:
     """Vista previa del Bloque 1 — réplica de `app_old.py:1400-1412`.
 
@@ -117,9 +160,14 @@ def _resumen_por_ticker(df_limpio) -> dict:
     datos = {}
     if "Ticker" not in df_limpio.columns or "Action" not in df_limpio.columns:
         return datos
-    for ticker, grupo in df_limpio.groupby("Ticker"):
-        compras = grupo[grupo["Action"].str.lower().str.contains("buy", na=False)]
-        dividendos = grupo[grupo["Action"].str.lower().str.contains("div", na=False)]
+    # El texto se baja a minúsculas y se busca una sola vez (sobre las categorías de la
+    # tabla canónica), no una vez por ticker.
+    accion = df_limpio["Action"].str.lower()
+    es_compra = accion.str.contains("buy", na=False)
+    es_div = accion.str.contains("div", na=False)
+    for ticker, grupo in df_limpio.groupby("Ticker", observed=True):
+        compras = grupo[es_compra.loc[grupo.index]]
+        dividendos = grupo[es_div.loc[grupo.index]]
         datos[ticker] = {
             "shares": float(compras["Quantity"].sum()) if not compras.empty else 0.0,
             "invested": abs(float(compras["Amount"].sum())) if not compras.empty else 0.0,
@@ -133,6 +181,7 @@ BROKER_LABEL = {
     "schwab": "Charles Schwab",
     "ibkr": "Interactive Brokers",
     "generic": "Formato genérico",
+    "mixto": "Varios brokers",
 }
 
 _AYUDA_BROKER = (
@@ -150,14 +199,20 @@ def render_bloque_transacciones() -> bool:
         st.markdown(bloque_resumen("CSV cargado",
                                    f"{nombre} · {broker} · {len(tickers)} tickers"),
                     unsafe_allow_html=True)
+        reporte = st.session_state.get("_wizard_merge_report")
+        if reporte:
+            st.caption(_detalle_fusion(reporte))
         _, col = st.columns([5, 1])
         with col:
             if st.button("editar", key="_vd_edit_csv", type="tertiary",
                          use_container_width=True):
                 for clave in ("_wizard_df_clean", "_wizard_csv_ticker_data", "_wizard_broker",
-                              "_wizard_csv_name", "_wizard_positions", "_wizard_income_summary",
+                              "_wizard_csv_name", "_wizard_merge_report", "_wizard_positions",
+                              "_wizard_income_summary",
                               "_wizard_income_df", "_wizard_income_multi",
-                              "_wizard_1042s", "_wizard_1042s_sig", "_wizard_1042s_error"):
+                              "_wizard_1042s", "_wizard_1042s_sig", "_wizard_1042s_error",
+                              "_vd_resultados",    # handle del análisis (ui.vistas)
+                              "_vd_pdf_pedido"):   # el PDF se vuelve a pedir por archivo
                     st.session_state.pop(clave, None)
                 st.session_state["_wizard_pos_confirmed"] = False
                 st.session_state["_wizard_listo"] = False
@@ -166,30 +221,41 @@ def render_bloque_transacciones() -> bool:
 
     st.markdown(bloque_header(1, "Transacciones", "activo"),
                 unsafe_allow_html=True)
-    archivo = st.file_uploader("Archivo de transacciones", type=["csv", "xlsx"],
-                               label_visibility="collapsed", help=_AYUDA_BROKER,
-                               key="_vd_upload_txn")
-    if archivo is None:
+    archivos = st.file_uploader("Archivo de transacciones", type=["csv", "xlsx"],
+                                label_visibility="collapsed", help=_AYUDA_BROKER,
+                                key="_vd_upload_txn", accept_multiple_files=True)
+    if not archivos:
         return False
 
     try:
-        crudo, broker = _leer_transacciones(archivo)
-        if crudo.empty:
+        limpio, reporte = _fusionar_transacciones(archivos)
+        if limpio.empty:
+            primero = reporte["files"][0]
+            if len(archivos) == 1 and "columns" in primero:
+                st.error(f"Falta(n) la(s) columna(s): {', '.join(primero['missing'])}")
+                st.caption(f"Columnas encontradas: {primero['columns']}")
+                return False
             st.error("No pudimos leer el formato del archivo. "
                      "Intenta guardarlo como «CSV UTF-8» o usa Excel (.xlsx).")
+            if len(archivos) > 1:
+                st.caption("Revisados: " + ", ".join(
+                    f"{f['name']} ({f['error']})" for f in reporte["files"]))
             return False
 
-        limpio = logic.normalize_csv(crudo)
-        faltan = [c for c in ("Date", "Ticker", "Amount") if c not in limpio.columns]
-        if faltan:
-            st.error(f"Falta(n) la(s) columna(s): {', '.join(faltan)}")
-            st.caption(f"Columnas encontradas: {list(limpio.columns)}")
+        limpio = logic.canonical_transactions(limpio)
+        problemas = logic.transaction_schema_errors(limpio)
+        if problemas:
+            st.error("El archivo se leyó, pero la tabla de transacciones no quedó en el "
+                     "formato esperado.")
+            st.caption("; ".join(problemas))
             return False
 
         st.session_state["_wizard_df_clean"] = limpio
         st.session_state["_wizard_csv_ticker_data"] = _resumen_por_ticker(limpio)
-        st.session_state["_wizard_broker"] = broker
-        st.session_state["_wizard_csv_name"] = archivo.name
+        st.session_state["_wizard_broker"] = reporte["broker"]
+        st.session_state["_wizard_csv_name"] = " + ".join(
+            f["name"] for f in reporte["files"] if not f["error"])
+        st.session_state["_wizard_merge_report"] = reporte if len(archivos) > 1 else None
         st.rerun()
     except Exception as error:                                    # noqa: BLE001
         st.error(f"Error procesando el archivo: {error}")
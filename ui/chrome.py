@@ -200,7 +200,7 @@ def _popover_segmento(columna, etiqueta_actual: str, opciones: dict, clave_actua
 
 
 def render_ruta(alerta: bool = False, pdf_bytes: bytes | None = None,
-                 pdf_filename: str = "") -> Ruta:
+                 pdf_filename: str = "", pedir_pdf=None) -> Ruta:
     """Ruta horizontal funcional Categoría › Vista › ETF, un popover por segmento.
 
     Sustituye a `render_crumb` (decorativo) y a la barra lateral: es el único navegador.
@@ -210,7 +210,8 @@ def render_ruta(alerta: bool = False, pdf_bytes: bytes | None = None,
     `alerta`/`pdf_bytes`/`pdf_filename` son datos ya resueltos por quien llama
     (`app.py`, vía `ui.validacion`): este módulo es solo presentación (docstring de
     arriba) y no calcula ni la confiabilidad ni el PDF — solo dibuja el menú de 3 puntos
-    con lo que se le entrega.
+    con lo que se le entrega. Mientras no hay bytes, el menú ofrece «Preparar reporte
+    PDF», que llama a `pedir_pdf`; el rerun que sigue ya trae los bytes.
     """
     _consumir_cierre_popover()
 
@@ -292,6 +293,9 @@ def render_ruta(alerta: bool = False, pdf_bytes: bytes | None = None,
                                 file_name=pdf_filename or "auditoria-portafolio.pdf",
                                 mime="application/pdf", key="vd_menu_pdf",
                                 use_container_width=True)
+                        elif pedir_pdf is not None:
+                            st.button("Preparar reporte PDF", key="vd_menu_pdf_preparar",
+                                      on_click=pedir_pdf, use_container_width=True)
 
     return Ruta(categoria=categoria, vista=vista, etf=etf,
                 tema=st.session_state.get("vd_tema", "Claro"))
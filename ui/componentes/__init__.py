@@ -81,14 +81,94 @@ ALTO_METODOLOGIA = 7000
 ALTO_METODO_REAL = 2600
 
 
+# Cifras por mes (`{"0": 1.0, "1": 1.0213, ...}`, ver `ui.adapters._mensualizar_desde`)
+# viajan como columna: `{"__m": primer mes, "q": [enteros]}`, cada valor × 10^4 — los
+# adapters ya redondean a 4 decimales (índices) o 2 (dólares), así que no se pierde nada.
+# Sin las claves repetidas y sin el punto decimal, el JSON de Comparación baja de ~56 KB a
+# ~31 KB. `__vdCol` (inyectado al principio de cada plantilla) devuelve al componente el
+# mismo objeto de siempre, así que el JS de los componentes no cambió.
+_COL_ESCALA = 10_000
+_COL_MIN = 12          # menos meses que esto no compensan el envoltorio
+_CON_COLUMNAS = (
+    "<script>function __vdCol(x){if(Array.isArray(x))return x.map(__vdCol);"
+    "if(x&&typeof x==='object'){if(Array.isArray(x.q)&&typeof x.__m==='number'){"
+    "var o={};x.q.forEach(function(v,i){if(v!==null)o[String(x.__m+i)]=v/%d;});return o;}"
+    "for(var k in x)x[k]=__vdCol(x[k]);}return x;}</script>\n" % _COL_ESCALA)
+
+
+def _columna(d: dict):
+    """`d` en forma de columna si es una serie por mes que cabe sin pérdida; si no, None."""
+    if len(d) < _COL_MIN:
+        return None
+    try:
+        claves = [int(k) for k in d]
+    except (TypeError, ValueError):
+        return None
+    if any(str(c) != k for c, k in zip(claves, d)):
+        return None
+    inicio, fin = min(claves), max(claves)
+    if fin - inicio + 1 > 2 * len(d):
+        return None
+    q = [None] * (fin - inicio + 1)
+    for c, v in zip(claves, d.values()):
+        if isinstance(v, bool) or not isinstance(v, (int, float)) or v != v or abs(v) > 1e11:
+            return None
+        entero = round(v * _COL_ESCALA)
+        if entero / _COL_ESCALA != v:
+            return None
+        q[c - inicio] = entero
+    return {"__m": inicio, "q": q}
+
+
+def _compactar(x, columnas: list):
+    if isinstance(x, dict):
+        col = _columna(x)
+        if col is not None:
+            columnas.append(col)
+            return col
+        return {k: _compactar(v, columnas) for k, v in x.items()}
+    if isinstance(x, (list, tuple)):
+        return [_compactar(v, columnas) for v in x]
+    return x
+
+
+def _payload(datos) -> str:
+    """JSON para un hueco `{{..._JSON}}`: compacto (sin espacios) y con las series por mes
+    en columna (ver `_columna`). `None` → `null`."""
+    if datos is None:
+        return "null"
+    columnas = []
+    texto = json.dumps(_compactar(datos, columnas), ensure_ascii=False, separators=(",", ":"))
+    return f"__vdCol({texto})" if columnas else texto
+
+
+# nombre → (fecha del archivo, html). Cada rerun volvía a leer del disco plantillas de
+# 75-210 KB; ahora se relee solo si el archivo cambió.
+_PLANTILLAS: dict[str, tuple[float, str]] = {}
+
+
 def _plantilla(nombre: str) -> str:
+    """El `.html` del componente, leído una vez por versión del archivo.
+
+    Se quita el comentario de cabecera (documentación para quien mantiene el archivo):
+    nombra el hueco `{{DATA_JSON}}`, así que el `replace` de cada render metía AHÍ una
+    segunda copia entera del JSON y el navegador la recibía dos veces.
+    """
     ruta = os.path.join(_AQUI, nombre)
-    if not os.path.exists(ruta):
+    try:
+        fecha = os.path.getmtime(ruta)
+    except OSError:
         raise FileNotFoundError(
             f"Falta {nombre}. Genéralo con `python tools/extract_cashflow.py`."
-        )
-    with open(ruta, encoding="utf-8") as f:
-        return f.read()
+        ) from None
+    guardada = _PLANTILLAS.get(nombre)
+    if guardada is None or guardada[0] != fecha:
+        with open(ruta, encoding="utf-8") as f:
+            html = f.read()
+        if html.startswith("<!--"):
+            html = html[html.index("-->") + 3:].lstrip("\n")
+        guardada = _PLANTILLAS[nombre] = (fecha, _CON_COLUMNAS + html)
+    return guardada[1]
 
 
 def _con_tema(html: str, tema: str) -> str:
@@ -139,7 +219,7 @@ def render_cashflow(datos: dict, paso: int, tema: str, alto: int = ALTO_CASHFLOW
     """
     html = _plantilla("cashflow.html")
     html = _con_tema(html, tema)
-    html = html.replace("{{DATA_JSON}}", json.dumps(datos, ensure_ascii=False))
+    html = html.replace("{{DATA_JSON}}", _payload(datos))
     html = html.replace("{{PASO}}", str(int(paso)))
     components.html(html, height=alto, scrolling=False)
 
@@ -150,7 +230,7 @@ def render_hoja(datos: dict, tema: str, alto: int = ALTO_HOJA) -> None:
     """
     html = _plantilla("hoja.html")
     html = _con_tema(html, tema)
-    html = html.replace("{{DATA_JSON}}", json.dumps(datos, ensure_ascii=False))
+    html = html.replace("{{DATA_JSON}}", _payload(datos))
     components.html(html, height=alto, scrolling=False)
 
 
@@ -164,7 +244,7 @@ def render_comparacion(datos: dict, tema: str, alto: int = ALTO_COMPARACION) ->
     """
     html = _plantilla("comparacion.html")
     html = _con_tema(html, tema)
-    html = html.replace("{{DATA_JSON}}", json.dumps(datos, ensure_ascii=False))
+    html = html.replace("{{DATA_JSON}}", _payload(datos))
     components.html(html, height=alto, scrolling=False)
 
 
@@ -185,7 +265,7 @@ def render_comparacion_real(datos: dict, tema: str, alto: int = ALTO_COMPARACION
     """
     html = _plantilla("comparacion_real.html")
     html = _con_tema(html, tema)
-    html = html.replace("{{DATA_JSON}}", json.dumps(datos, ensure_ascii=False))
+    html = html.replace("{{DATA_JSON}}", _payload(datos))
     html = html.replace("{{ASOF}}", str(datos.get("asof", "")))
     components.html(html, height=alto, scrolling=False)
 
@@ -210,9 +290,8 @@ def render_metodo(vista_activa: str, tema: str, datos: dict, serie: dict | None
     html = _plantilla("metodo.html")
     html = _con_tema(html, tema)
     html = html.replace("{{VISTA_ACTIVA}}", vista_activa)
-    html = html.replace("{{DATA_JSON}}", json.dumps(datos, ensure_ascii=False))
-    html = html.replace("{{SERIE_JSON}}",
-                        json.dumps(serie, ensure_ascii=False) if serie else "null")
+    html = html.replace("{{DATA_JSON}}", _payload(datos))
+    html = html.replace("{{SERIE_JSON}}", _payload(serie) if serie else "null")
     components.html(html, height=alto, scrolling=False)
 
 
@@ -227,7 +306,7 @@ def render_metodo_real(datos: dict, tema: str, alto: int = ALTO_METODO_REAL) ->
     """
     html = _plantilla("metodo_real.html")
     html = _con_tema(html, tema)
-    html = html.replace("{{DATA_JSON}}", json.dumps(datos, ensure_ascii=False))
+    html = html.replace("{{DATA_JSON}}", _payload(datos))
     components.html(html, height=alto, scrolling=False)
 
 
@@ -248,7 +327,7 @@ def render_metodologia(tema: str, alto: int = ALTO_METODOLOGIA, anchor: str | No
     html = _plantilla("metodologia.html")
     html = _con_tema(html, tema)
     html = _con_anchor(html, anchor)
-    html = html.replace("{{DATA_JSON}}", json.dumps(datos, ensure_ascii=False) if datos else "null")
+    html = html.replace("{{DATA_JSON}}", _payload(datos) if datos else "null")
     components.html(html, height=alto, scrolling=False)
 
 
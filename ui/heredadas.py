@@ -35,6 +35,7 @@ from __future__ import annotations
 import streamlit as st
 
 import logic
+import result_cache
 from ui import estado
 
 CAT_CLAVE = "detalle"
@@ -1093,6 +1094,37 @@ def _modulo_fiscal_nra(resultados: dict, fwd: dict, p_country: str) -> None:
             st.caption(bd["audit_note"])
 
 
+def _aporte_para_meta(resultados: dict, classify_map: dict, mc_params: dict) -> None:
+    """Aporte mensual mínimo (y horizonte mínimo) para cumplir la meta de ingreso con 80% de
+    probabilidad, con los mismos caminos del Monte Carlo de arriba (`seed=123`). Se calcula
+    solo al pedirlo y queda guardado mientras los supuestos no cambien: mover el aporte a
+    tanteo era justo lo que se quería evitar."""
+    firma = repr(sorted(mc_params.items(), key=lambda kv: kv[0]))
+    guardado = st.session_state.get("vd_her_mc_meta")
+    if st.button("¿Cuánto necesito aportar para llegar a mi meta?", key="vd_her_mc_meta_btn"):
+        guardado = (firma, [logic.solve_income_goal(resultados, mc_params, classify_map,
+                                                    solve_for=modo, target_prob_pct=80.0,
+                                                    n_paths=500, seed=123)
+                            for modo in ("contribution", "horizon")])
+        st.session_state["vd_her_mc_meta"] = guardado
+    if not guardado or guardado[0] != firma:
+        return
+    aporte, horizonte = guardado[1]
+    lineas = []
+    if aporte["reachable"]:
+        lineas.append(f"Con {_money(aporte['value'], 0)}/mes de aporte llegas a tu meta en el "
+                      f"{aporte['prob_goal']:.0f}% de los escenarios, en el mismo horizonte.")
+    else:
+        lineas.append("En este horizonte ningún aporte razonable alcanza la meta con 80% de "
+                      "probabilidad.")
+    if horizonte["reachable"]:
+        lineas.append(f"Con tu aporte actual, la meta se cumple en el 80% de los escenarios "
+                      f"hacia el año {horizonte['value']}.")
+    else:
+        lineas.append("Con tu aporte actual no se alcanza con 80% de probabilidad en 30 años.")
+    st.caption(" ".join(lineas))
+
+
 def _monte_carlo(resultados: dict, classify_map: dict, proj_params: dict) -> None:
     """Literal de `app_old.py:5592-5607` — rango de resultados posibles."""
     import altair as alt
@@ -1107,9 +1139,8 @@ def _monte_carlo(resultados: dict, classify_map: dict, proj_params: dict) -> Non
         with c2:
             mc_real = st.checkbox("Mostrar en poder de compra de hoy (descontar inflación)",
                                   value=False, key="vd_her_mc_real")
-        mc = logic.monte_carlo_projection(
-            resultados, {**proj_params, "inflation_pct": mc_infl, "real_view": mc_real},
-            classify_map, n_paths=500, seed=123)
+        mc_params = {**proj_params, "inflation_pct": mc_infl, "real_view": mc_real}
+        mc = logic.monte_carlo_projection(resultados, mc_params, classify_map, n_paths=500, seed=123)
         if not mc["bands"]:
             return
         f = mc["final"]
@@ -1118,6 +1149,7 @@ def _monte_carlo(resultados: dict, classify_map: dict, proj_params: dict) -> Non
                   f"{_money(f['p10'], 0)} – {_money(f['p90'], 0)}", f"mediana {_money(f['p50'], 0)}")
         if mc["prob_goal"] is not None:
             k2.metric("Prob. de cumplir tu meta de ingreso", f"{mc['prob_goal']:.0f}%")
+            _aporte_para_meta(resultados, classify_map, mc_params)
         brows = []
         for b in mc["bands"]:
             brows += [{"Año": b["year"], "Banda": "Pesimista (p10)", "Valor": b["p10"]},
@@ -1455,7 +1487,8 @@ def _estr_nra_rate() -> float:
 
 def _serie_temporal_estrategias(resultados: dict, sr_invested: float) -> dict:
     """Reconstruye la serie temporal Portafolio Real vs «todo en un solo ETF».
-    Cacheada en sesión por `_file_id` (evita repetir el trabajo en cada rerun del rail).
+    Cacheada por `_file_id` en `result_cache`, con el handle en la sesión (evita repetir
+    el trabajo en cada rerun del rail).
 
     Portado de `app_old.py:5682-5794`, con un cambio de FUENTE y de MOTOR: antes llamaba
     `yf.download(..., auto_adjust=True)` en cada render —la única vista de la app que seguía
@@ -1469,18 +1502,25 @@ def _serie_temporal_estrategias(resultados: dict, sr_invested: float) -> dict:
     a propósito (`Close` crudo + `Dividends` aparte) para que el DRIP no se cuente dos veces.
     Sustituir una serie por la otra sin reinvertir las distribuciones convierte el benchmark
     en sólo-precio: medido sobre 3 tranches de $5k, YMAX caía de $16,741 a $7,102 (−58%) y
-    los ETF amplios ~1-2%. Vía motor la equivalencia se mantiene dentro del 0.5%."""
+    los ETF amplios ~1-2%. Vía motor la equivalencia se mantiene dentro del 0.5%.
+
+    Cada serie se guarda ya reducida a `PUNTOS_GRAFICA` con `reducir_serie` (la gráfica es
+    su único consumidor; `etf_final` sale de la serie completa), conservando los días en
+    que la línea salta por un evento: compras, ex-dividendo del ETF y, en el portafolio
+    real, toda fecha del CSV (dividendos, splits)."""
     import pandas as pd
 
     import backtest
     import price_cache
+    from ui.adapters import reducir_serie
 
     # La tasa entra en la clave: si no, cambiar de residencia dejaría la serie cacheada de
     # la tasa anterior y la gráfica contradiría al resto de la app en silencio.
     ts_key = (f"vd_her_strat_ts_{st.session_state.get('_file_id', 'x')}"
               f"_{_estr_nra_rate():.4f}")
-    if ts_key in st.session_state:
-        return st.session_state[ts_key]
+    previo = result_cache.get(st.session_state.get(ts_key))
+    if previo is not None:
+        return previo
 
     flow_by_date: dict = {}
     for _t, s in resultados.items():
@@ -1532,6 +1572,17 @@ def _serie_temporal_estrategias(resultados: dict, sr_invested: float) -> dict:
             col = s["daily_trend"]["User Total Value"]
             real_ts = col.copy() if real_ts is None else real_ts.add(col, fill_value=0)
     if real_ts is not None:
+        # Solo los días en que la línea salta: compras/ventas, transferencias y splits. Los
+        # dividendos y el DRIP (semanales en YieldMax) no: serían más fechas fijas que días
+        # de mercado y la reducción no reduciría nada.
+        eventos = [d for d, _ in buy_flows]
+        for _t, s in resultados.items():
+            h = s.get("history") if "error" not in s else None
+            if h is not None and "Date" in h and "Action" in h:
+                salta = h["Action"].astype(str).str.contains(
+                    "buy|sell|split|transfer", case=False, na=False)
+                eventos.extend(pd.to_datetime(h.loc[salta, "Date"], errors="coerce").dropna())
+        real_ts = reducir_serie(real_ts, conservar=eventos)
         r_df = real_ts.reset_index()
         r_df.columns = ["Fecha", "Valor"]
         r_df["Estrategia"] = "Tu Portafolio Real"
@@ -1570,6 +1621,8 @@ def _serie_temporal_estrategias(resultados: dict, sr_invested: float) -> dict:
                 if vals.empty:
                     continue
                 etf_final_vals[etf_lbl] = float(vals.iloc[-1])
+                ex_div = hist.index[hist["Dividends"] > 0] if "Dividends" in hist else []
+                vals = reducir_serie(vals, conservar=[d for d, _ in buy_flows] + list(ex_div))
                 e_df = vals.reset_index()
                 e_df.columns = ["Fecha", "Valor"]
                 e_df["Estrategia"] = etf_lbl
@@ -1579,7 +1632,8 @@ def _serie_temporal_estrategias(resultados: dict, sr_invested: float) -> dict:
 
     resultado = {"df": pd.concat(frames_ts, ignore_index=True) if frames_ts else pd.DataFrame(),
                 "etf_final": etf_final_vals}
-    st.session_state[ts_key] = resultado
+    # Depende de la sesión (residencia, monto): handle propio, no compartido.
+    st.session_state[ts_key] = result_cache.put(result_cache.new_key("estrategias"), resultado)
     return resultado
 
 
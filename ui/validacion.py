@@ -17,6 +17,11 @@ from __future__ import annotations
 import streamlit as st
 
 import logic
+import result_cache
+
+# El PDF se construye solo si la sesión lo pidió (`pedir_pdf`); ver `preparar_pdf`.
+_CLAVE_PDF_PEDIDO = "_vd_pdf_pedido"
+_VERSION_REPORTE = "2.0"
 
 _QUALITY_STYLE = {
     "unreliable": ("--warn", "No confiable"),
@@ -46,6 +51,18 @@ _SKIP_REASON = {
     "held_less_than_14_days": "Posición cerrada en {days} días (< 2 semanas)",
 }
 
+# Estado del circuito de Yahoo Finance (`http_pool.CircuitBreaker`).
+_CIRCUITO_ESTILO = {
+    "closed": ("--cash", "Normal"),
+    "open": ("--warn", "En pausa"),
+    "half_open": ("--ink-mut", "Probando de nuevo"),
+}
+
+_FUENTE_GUARDADA = {
+    "memoria": "lo ya descargado en esta sesión del servidor",
+    "price_cache": "caché semanal de precios",
+}
+
 _V1042S_ESTILO = {
     "match":             ("--cash", "Coincide"),
     "portfolio_higher":  ("--warn", "Tu análisis reporta más"),
@@ -85,8 +102,41 @@ def _render_1042s(resultados: dict) -> dict | None:
     return validacion
 
 
+def _render_estado_mercado(resultados: dict) -> None:
+    """Conexión con el mercado: el circuito de Yahoo y, de las posiciones del usuario, las
+    que salieron de datos guardados o sin datos (`logic.market_data_health`, leído del
+    `market_source` de cada resultado)."""
+    salud = logic.market_data_health(resultados)
+    circuito = salud["breaker"]
+    accent_var, etiqueta = _CIRCUITO_ESTILO.get(circuito["state"], _CIRCUITO_ESTILO["half_open"])
+    cuerpo = []
+    if circuito["state"] == "open":
+        cuerpo.append(f'Yahoo Finance falló {circuito["failures"]} veces seguidas '
+                      f'({circuito["last_error"]}); dejamos de consultarlo '
+                      f'{circuito["cooldown_s"]:.0f} s para no empeorar el bloqueo. '
+                      f'Siguiente intento en {circuito["retry_in_s"]:.0f} s.')
+    elif circuito["state"] == "half_open":
+        cuerpo.append("Tras la pausa, una consulta de prueba decide si se reanuda.")
+    if salud["stale"]:
+        cuerpo.append("Precios de datos guardados, no en vivo: " + ", ".join(
+            f'<b>{t}</b> ({_FUENTE_GUARDADA.get(f, f)})' for t, f in sorted(salud["stale"].items())))
+    if salud["missing"]:
+        cuerpo.append("Yahoo no tiene datos de " + ", ".join(
+            f"<b>{t}</b>" for t in sorted(salud["missing"]))
+            + "; no se vuelven a consultar durante unas horas.")
+    if salud["down"]:
+        cuerpo.append("Sin precios (Yahoo no respondía y no había datos guardados): " + ", ".join(
+            f"<b>{t}</b>" for t in sorted(salud["down"])) + ".")
+    st.markdown(
+        _tarjeta(accent_var,
+                 f'Conexión con el mercado · <span style="color: var({accent_var});">{etiqueta}</span>',
+                 "".join(f'<p class="vd-pie-card-cuerpo">{c}</p>' for c in cuerpo)),
+        unsafe_allow_html=True)
+
+
 def _render_calidad_datos(resultados: dict) -> None:
     """Calidad de datos y validación cruzada de ingresos (antes fila 22 de `ui.pie`)."""
+    _render_estado_mercado(resultados)
     classify_map = logic.classify_tickers(list(resultados.keys()))
     dq = logic.assess_data_quality(resultados, classify_map)
     no_ok = {t: q for t, q in dq.items() if q["level"] != "ok"}
@@ -293,6 +343,17 @@ def _puntuacion_acertividad(resultados: dict) -> tuple[str, list[str]]:
             nivel = "Media"
         razones.append(f"{len(tuyos)} posición(es) tuya(s) excluida(s) por datos insuficientes.")
 
+    salud = logic.market_data_health(resultados)
+    if salud["stale"] or salud["down"]:
+        if nivel == "Alta":
+            nivel = "Media"
+    if salud["stale"]:
+        razones.append(f"{len(salud['stale'])} posición(es) con precios guardados: Yahoo Finance "
+                       "no respondía.")
+    if salud["down"]:
+        razones.append(f"{len(salud['down'])} posición(es) sin precios: Yahoo Finance no "
+                       "respondía y no había datos guardados.")
+
     if not razones:
         razones.append("Sin discrepancias entre las fuentes disponibles.")
     return nivel, razones
@@ -307,19 +368,36 @@ def hay_alertas(resultados: dict) -> bool:
     return nivel != "Alta"
 
 
+def pedir_pdf() -> None:
+    """Callback del botón «Preparar reporte PDF» del menú de la ruta."""
+    st.session_state[_CLAVE_PDF_PEDIDO] = True
+
+
 def preparar_pdf(resultados: dict) -> tuple[bytes | None, str]:
-    """Genera los bytes del reporte PDF por adelantado: el botón de descarga vive dentro
-    del popover de la ruta (`ui/chrome.py`), que es solo presentación y no calcula nada,
-    así que se prepara aquí antes. Literal de la fila 37 heredada de `ui.pie`/
-    `app_old.py:5271-5282`: `report.py` y `test_report.py` no se tocan. `try/except`
-    porque el original también lo protege — un reporte que falla no debe romper el menú."""
+    """Los bytes del reporte PDF, o `(None, "")` mientras la sesión no lo haya pedido.
+
+    El botón de descarga vive dentro del popover de la ruta (`ui/chrome.py`), que es solo
+    presentación y no calcula nada, así que los bytes se resuelven aquí. Antes se generaba
+    el PDF completo en cada rerun aunque casi nadie lo baje; ahora el menú ofrece primero
+    «Preparar reporte PDF» (`pedir_pdf`) y solo desde ahí se construye, una vez por huella
+    (`report.report_fingerprint`: los campos que el PDF lee + bróker + versión + fecha +
+    código de `report.py`) en
+    `result_cache`. Las corridas siguientes solo recalculan la huella. La petición vale por
+    archivo: «editar» la carga (`ui.carga`) o abrir otro demo (`app.py`) la borra.
+
+    `try/except` porque el original también lo protege — un reporte que falla no debe
+    romper el menú."""
+    if not resultados or not st.session_state.get(_CLAVE_PDF_PEDIDO):
+        return None, ""
     try:
         from datetime import date as _date
 
-        from report import generate_report_pdf
+        from report import generate_report_pdf, report_fingerprint
 
         broker = st.session_state.get("_wizard_broker") or "schwab"
-        pdf_bytes = generate_report_pdf(resultados, broker, version="2.0")
+        clave = "pdf:" + report_fingerprint(resultados, broker, _VERSION_REPORTE)
+        pdf_bytes = result_cache.get_or_put(
+            clave, lambda: generate_report_pdf(resultados, broker, version=_VERSION_REPORTE))
         filename = f"auditoria-portafolio-{_date.today().isoformat()}.pdf"
         return pdf_bytes, filename
     except Exception:
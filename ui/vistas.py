@@ -8,11 +8,14 @@ from __future__ import annotations
 
 import streamlit as st
 
+import analysis_jobs
 import logic
+import result_cache
+import snapshot_store
 from ui import estado, heredadas, nav
 from ui.adapters import (DatosIncompletos, cashflow_data, comparacion_data, hoja_data,
                          metodo_data, metodo_real_data, metodo_serie_data, salud_nav_data,
-                         trg_real_data, verificar_identidades)
+                         trg_real_data, verificar_identidades, version_datos_compartidos)
 from ui.chrome import Ruta, render_placeholder
 from ui.componentes import (render_cashflow, render_comparacion, render_comparacion_real,
                             render_hoja, render_metodo, render_metodo_real,
@@ -27,20 +30,111 @@ def obtener_resultados() -> dict:
     return _resultados()
 
 
+SONDEO_S = 0.5   # cada cuánto se vuelve a pintar el avance mientras corre el análisis
+
+
 def _resultados() -> dict:
-    """`analyze_portfolio` cacheado en la sesión.
+    """`analyze_portfolio` del archivo cargado; la sesión guarda solo el handle.
 
     Baja precios de mercado, así que recalcularlo en cada rerun —y el rail provoca uno
-    por paso— haría la vista inusable. Se invalida al editar la carga, porque esos
-    handlers borran `_wizard_df_clean`.
+    por paso— haría la vista inusable. El objeto vive en `result_cache` bajo la clave del
+    contenido (`snapshot_store.snapshot_key`): dos sesiones con el mismo archivo comparten
+    uno, y si el caché lo desalojó se vuelve a obtener. Se invalida al editar la carga (o
+    abrir otro demo), porque esos handlers borran el handle junto con `_wizard_df_clean`.
+
+    Entre sesiones (recargar la página, volver mañana con el mismo CSV) lo evita el
+    snapshot persistido, si el operador lo activó: ver `snapshot_store`.
+
+    Un resultado con precios degradados (`logic.market_degraded`: Yahoo no respondía) se
+    guarda bajo una clave solo de esta sesión, no la del contenido: otra sesión, o esta al
+    recargar, vuelve a consultar el mercado en vez de heredar los precios guardados.
+
+    Si hay que calcular, corre como trabajo de `analysis_jobs` bajo la misma clave: esta
+    corrida pinta el avance por ticker en un fragmento que se repinta solo y se detiene ahí
+    (el resto de la vista espera al resultado); un rerun a mitad se une al trabajo en curso
+    en vez de empezarlo de nuevo.
     """
-    if st.session_state.get("_vd_resultados") is None:
+    resultados = result_cache.get(st.session_state.get("_vd_resultados"))
+    if resultados is None:
         df = st.session_state.get("_wizard_df_clean")
         if df is None:
             return {}
-        with st.spinner("Leyendo tu portafolio y consultando el mercado…"):
-            st.session_state["_vd_resultados"] = logic.analyze_portfolio(df)
-    return st.session_state["_vd_resultados"] or {}
+        clave = "resultados:" + snapshot_store.snapshot_key(df)
+        resultados = result_cache.get(clave)
+        if resultados is None:
+            resultados = snapshot_store.load(df)
+        if resultados is None:
+            trabajo = analysis_jobs.submit(clave, lambda avisar: _analizar(df, avisar))
+            if not trabajo.done():
+                _esperar_analisis(trabajo)
+                st.stop()
+            analysis_jobs.discard(clave, trabajo)
+            resultados = trabajo.result()
+        if logic.market_degraded(resultados):
+            clave = result_cache.new_key("resultados")
+        st.session_state["_vd_resultados"] = result_cache.put(clave, resultados)
+    return resultados or {}
+
+
+def _analizar(df, avisar) -> dict:
+    """Cuerpo del trabajo (corre en el pool de `analysis_jobs`, fuera del script). Con
+    precios degradados no se guarda snapshot, y se vacía el `st.cache_data` de
+    `analyze_portfolio` para que el próximo análisis vuelva a pedir el mercado."""
+    resultados = logic.analyze_portfolio(df, _progreso=avisar)
+    if logic.market_degraded(resultados):
+        logic.analyze_portfolio.clear()
+    elif resultados:
+        snapshot_store.save(df, resultados)
+    return resultados
+
+
+@st.fragment(run_every=SONDEO_S)
+def _esperar_analisis(trabajo) -> None:
+    """Avance del análisis en curso y los tickers que ya terminaron. Es un fragmento: cada
+    `SONDEO_S` se repinta solo este bloque, no el script entero ni el resto de la página.
+    Cuando el trabajo termina pide una corrida completa, que ya encuentra el resultado."""
+    if trabajo.done():
+        st.rerun()
+    avance = trabajo.progress()
+    hechos, total = avance["done"], avance["total"]
+    if total:
+        texto = f"Consultando el mercado · {hechos} de {total} posiciones"
+        if avance["ticker"]:
+            texto += f" · {avance['ticker']} listo"
+    else:
+        texto = "Leyendo tu portafolio y consultando el mercado…"
+    st.progress(hechos / total if total else 0.0, text=texto)
+    listos = []
+    for ticker, r in avance["partial"].items():
+        r = r or {}
+        if r.get("skipped") or r.get("error"):
+            listos.append(f"{ticker} (sin analizar)")
+        elif r.get("roi_percent") is not None:
+            listos.append(f"{ticker} {r['roi_percent']:+.1f}%")
+        else:
+            listos.append(str(ticker))
+    if listos:
+        st.caption(" · ".join(listos))
+
+
+def _en_cache(clave_sesion: str, clave: str, producir):
+    """Objeto detrás del handle que la sesión guarda en `clave_sesion` (ver `result_cache`),
+    para los datos que no dependen del usuario.
+
+    La clave es `clave` + `version_datos_compartidos()`, que comparten todas las sesiones
+    del proceso: el primer visitante lo calcula y los demás (también los que llegan mientras
+    tanto) lo reusan. Un handle que apunta a otra versión (cambió el código o las entradas)
+    no se sirve. Si falta —primera vez, otra versión, o el caché lo desalojó— se pide de
+    nuevo. `None` (sin caché ni yfinance en vivo) no se guarda: el siguiente rerun reintenta.
+    """
+    clave = f"{clave}:{version_datos_compartidos()}"
+    datos = None
+    if st.session_state.get(clave_sesion) == clave:
+        datos = result_cache.get(clave)
+    if datos is None:
+        datos = result_cache.get_or_put(clave, producir)
+        st.session_state[clave_sesion] = clave if datos is not None else None
+    return datos
 
 
 def _stats_o_aviso(ruta: Ruta) -> dict | None:
@@ -209,12 +303,10 @@ def render_comparacion_simulacion(ruta: Ruta) -> None:
     portafolio del usuario — vive fuera del wizard —, así que a diferencia de
     `render_trg_real` no hay `_resultados()` que esperar. `comparacion_data` sí baja
     historia (del caché de precio, casi nunca de red — ver `ui.adapters.comparacion_data`),
-    así que se cachea en la sesión con el mismo criterio que `_resultados()`: recalcularlo
+    así que se cachea con el mismo criterio que `_resultados()` (`_en_cache`): recalcularlo
     en cada rerun del rail sería lento sin motivo, sobre datos que no cambian por sesión.
     """
-    if st.session_state.get("_vd_comparacion_data") is None:
-        st.session_state["_vd_comparacion_data"] = comparacion_data()
-    datos = st.session_state["_vd_comparacion_data"]
+    datos = _en_cache("_vd_comparacion_data", "comparacion_data", comparacion_data)
     if datos is None:
         st.warning("No se pudo cargar la historia de precios (ni caché ni yfinance en "
                   "vivo) — inténtalo de nuevo en unos minutos.")
@@ -226,12 +318,9 @@ def render_metodo_tradicional(ruta: Ruta) -> None:
     """«Método tradicional» (las 5 sub-vistas de `nav.MET_ORDER`). Como
     `render_comparacion_simulacion`, no depende del portafolio del usuario — es el caso
     de estudio fijo de la clase de Greco — así que `metodo_data()` (que sí baja historia,
-    del caché casi siempre) se cachea en la sesión con el mismo criterio que
-    `_vd_comparacion_data`.
+    del caché casi siempre) se cachea con el mismo criterio que `_vd_comparacion_data`.
     """
-    if st.session_state.get("_vd_metodo_data") is None:
-        st.session_state["_vd_metodo_data"] = metodo_data()
-    datos = st.session_state["_vd_metodo_data"]
+    datos = _en_cache("_vd_metodo_data", "metodo_data", metodo_data)
     if datos is None:
         st.warning("No se pudo cargar la historia de precios del caso de estudio (ni "
                   "caché ni yfinance en vivo) — inténtalo de nuevo en unos minutos.")
@@ -240,9 +329,8 @@ def render_metodo_tradicional(ruta: Ruta) -> None:
     # regla: mismo caso de estudio fijo, así que una vez por sesión basta. Clave propia y
     # no dentro de `_vd_metodo_data` porque son dos metodologías distintas (ver
     # `ui.adapters.metodo_serie_data`) y conviene que se vea que no comparten objeto.
-    if st.session_state.get("_vd_metodo_serie") is None:
-        st.session_state["_vd_metodo_serie"] = metodo_serie_data()
-    render_metodo(ruta.vista, ruta.tema, datos, st.session_state["_vd_metodo_serie"])
+    render_metodo(ruta.vista, ruta.tema, datos,
+                  _en_cache("_vd_metodo_serie", "metodo_serie_data", metodo_serie_data))
 
 
 def render_matriz2(ruta: Ruta) -> None:
@@ -323,15 +411,13 @@ def render_vista(ruta: Ruta) -> None:
             st.session_state["vd_panel"] = None
             st.rerun()
         if panel == "metodologia":
-            # Mismo caché de sesión que `render_metodo_tradicional` (`_vd_metodo_data`):
+            # Mismo handle de sesión que `render_metodo_tradicional` (`_vd_metodo_data`):
             # § 9 «Anualizar bien» cita el mismo caso de estudio que «Método tradicional»,
             # así que reutiliza la corrida en vez de bajar la historia dos veces. `None`
             # (sin caché ni yfinance en vivo) degrada con gracia dentro del componente —
             # no hay banner aquí porque Metodología no depende de que esto cargue.
-            if st.session_state.get("_vd_metodo_data") is None:
-                st.session_state["_vd_metodo_data"] = metodo_data()
             render_metodologia(ruta.tema, anchor=st.session_state.get("vd_metodologia_anchor"),
-                                datos=st.session_state["_vd_metodo_data"])
+                                datos=_en_cache("_vd_metodo_data", "metodo_data", metodo_data))
         elif panel == "validacion":
             render_validacion_datos(_resultados())
         else: